@@ -0,0 +1,92 @@
+"""Memory and throughput of accounts carrying long histories.
+
+Compares the array-backed AccountRecords against a plain list of AccountRecord objects for
+building a history, appending operations through Account and reading it back.
+
+    python -m benchmarks.bench_account_history --records 100000,1000000 --output history.json
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.common import make_result, measure, write_results
+
+
+def make_records(count: int):
+    from account.value_objects import AccountRecord
+
+    time_at = datetime(2021, 3, 1, tzinfo=timezone.utc)
+    return [
+        AccountRecord(action=AccountRecord.DEPOSIT, balance=index, record_index=index, time_at=time_at)
+        for index in range(1, count + 1)
+    ]
+
+
+def allocated_bytes(build):
+    tracemalloc.start()
+    try:
+        started = tracemalloc.take_snapshot()
+        built = build()
+        finished = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in finished.compare_to(started, 'filename'))
+    return built, size
+
+
+def run(count: int, appends: int):
+    from account.entity import Account
+    from account.value_objects import AccountRecord, AccountRecords
+
+    params = dict(records=count)
+    records = make_records(count)
+
+    # every record gets its own datetime, like rows loaded from the database
+    _, list_bytes = allocated_bytes(lambda: [
+        AccountRecord(record.action, record.balance, record.record_index, record.time_at.replace())
+        for record in records
+    ])
+    history, array_bytes = allocated_bytes(lambda: AccountRecords(records))
+    yield dict(
+        name='memory', params=params,
+        list_bytes_per_record=list_bytes / count, array_bytes_per_record=array_bytes / count
+    )
+
+    started_at = time.perf_counter_ns()
+    account = Account(account_id=1, user_id=1, name='statement', histories=records)
+    elapsed_ns = time.perf_counter_ns() - started_at
+    yield make_result('load_account', params, dict(iterations=count, ops_per_sec=count / (elapsed_ns / 1e9)))
+
+    def deposit_and_commit():
+        account.deposit(1)
+        account.commit_new_histories()
+
+    yield make_result('append', params, measure(deposit_and_commit, appends))
+
+    started_at = time.perf_counter_ns()
+    total = sum(record.balance for record in history)
+    elapsed_ns = time.perf_counter_ns() - started_at
+    assert total == count * (count + 1) // 2
+    yield make_result('scan', params, dict(iterations=count, ops_per_sec=count / (elapsed_ns / 1e9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', default='100000', help='comma separated history lengths')
+    parser.add_argument('--appends', type=int, default=10000, help='deposits appended to the loaded account')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    results = []
+    for count in (int(value) for value in args.records.split(',')):
+        results.extend(run(count, args.appends))
+
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Throughput and latency of the set_session, get_accounts and account_action handlers.
+
+The ``fake`` backend runs the handlers against the in-memory fakes from tests/conftest.py and
+measures pure domain and service overhead. The ``sqlite`` backend uses DjangoUnitOfWork on an
+in-memory SQLite database and RedisSessionManager on fakeredis to include the adaptors. The
+``ledger`` backend runs LedgerUnitOfWork on a ledger file in a temporary directory.
+
+    python -m benchmarks.bench_handlers --backend all --accounts 1,10,50 --history 1,1000 \\
+        --output bench.json [--baseline previous.json]
+"""
+import argparse
+import itertools
+import os
+import sys
+from datetime import datetime, timezone
+
+import django
+
+from benchmarks.common import compare, make_result, measure, write_results
+
+PIN = '4321'
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'atmdjango.atm_django.settings')
+    os.environ.pop('MYSQL_DATABASE', None)
+    django.setup()
+
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def make_records(history: int):
+    from account.value_objects import AccountRecord
+
+    return [
+        AccountRecord(
+            action=AccountRecord.DEPOSIT, balance=1000 + index, record_index=index, time_at=datetime.now(timezone.utc)
+        )
+        for index in range(1, history + 1)
+    ]
+
+
+def fake_backend(user_id: int, card_num: int, accounts: int, history: int):
+    from account.entity import Account, Card
+    from tests.conftest import FakeSessionmanager, FakeUnitOfWork
+
+    card = Card(card_num=card_num, user_id=user_id, pin_salt_hash=Card.make_pin_hash(PIN))
+    user_accounts = [
+        Account(account_id=account_id, user_id=user_id, name=f'account {account_id}', histories=make_records(history))
+        for account_id in range(1, accounts + 1)
+    ]
+    return FakeUnitOfWork(cards=[card], accounts=user_accounts), FakeSessionmanager(), 1
+
+
+def sqlite_backend(user_id: int, card_num: int, accounts: int, history: int):
+    import fakeredis
+
+    from account.adaptors.session_manager import RedisSessionManager
+    from account.entity import Card
+    from account.service.unit_of_work import DjangoUnitOfWork
+    from atmdjango.atm_app.models import AccountBalance, AccountHistory, BankAccount, BankCard
+
+    BankCard.objects.create(card_number=card_num, user_id=user_id, pin_hash=Card.make_pin_hash(PIN))
+    account_ids = [
+        BankAccount.objects.create(user_id=user_id, account_name=f'account {index}').id
+        for index in range(accounts)
+    ]
+    for account_id in account_ids:
+        rows = [
+            AccountHistory(
+                account_id=account_id, account_balance=record.balance,
+                operation=record.action, operation_index=record.record_index
+            )
+            for record in make_records(history)
+        ]
+        AccountHistory.objects.bulk_create(rows, batch_size=500)
+        AccountBalance.record_latest(rows)
+
+    session_manager = RedisSessionManager(redis_cls=fakeredis.FakeStrictRedis)
+    return DjangoUnitOfWork(), session_manager, account_ids[0]
+
+
+def ledger_backend(user_id: int, card_num: int, accounts: int, history: int):
+    import tempfile
+
+    from account.adaptors.ledger import LedgerStore
+    from account.adaptors.ledger_repo import LedgerAccountRepo
+    from account.entity import Account, Card
+    from account.service.unit_of_work import LedgerUnitOfWork
+    from tests.conftest import FakeSessionmanager
+
+    store = LedgerStore(os.path.join(tempfile.mkdtemp(), 'bench.ledger'))
+    store.add_card(card_num, user_id, Card.make_pin_hash(PIN))
+    account_ids = [store.add_account(user_id, f'account {index}') for index in range(accounts)]
+    for account_id in account_ids:
+        account = Account(account_id=account_id, user_id=user_id, name='', histories=[])
+        account.new_histories = make_records(history)
+        LedgerAccountRepo(store).update_account(account)
+
+    return LedgerUnitOfWork(store), FakeSessionmanager(), account_ids[0]
+
+
+BACKENDS = dict(fake=fake_backend, sqlite=sqlite_backend, ledger=ledger_backend)
+
+
+def run_backend(backend: str, accounts: int, history: int, iterations: int, user_id: int):
+    from account.service import handler
+    from account.value_objects import AccountRecord
+
+    card_num = user_id * 10
+    uow, session_manager, account_id = BACKENDS[backend](user_id, card_num, accounts, history)
+    session_key = handler.set_session(card_num=card_num, pin=PIN, uow=uow, session_manager=session_manager)
+    params = dict(backend=backend, accounts=accounts, history=history)
+
+    yield make_result('set_session', params, measure(
+        lambda: handler.set_session(card_num=card_num, pin=PIN, uow=uow, session_manager=session_manager),
+        # pin derivation dominates set_session, a tenth of the iterations is enough
+        max(1, iterations // 10)
+    ))
+    session_key = handler.set_session(card_num=card_num, pin=PIN, uow=uow, session_manager=session_manager)
+
+    yield make_result('get_accounts', params, measure(
+        lambda: handler.get_accounts(
+            session_key=session_key, card_num=card_num, uow=uow, session_manager=session_manager
+        ),
+        iterations, warmup=10
+    ))
+    yield make_result('account_action', params, measure(
+        lambda: handler.account_action(
+            session_key=session_key, account_id=account_id, action=AccountRecord.DEPOSIT, amount=1,
+            card_num=card_num, uow=uow, session_manager=session_manager
+        ),
+        iterations, warmup=10
+    ))
+
+
+def parse_sizes(value: str):
+    return [int(size) for size in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['fake', 'sqlite', 'ledger', 'all'], default='all')
+    parser.add_argument('--accounts', type=parse_sizes, default=[1, 10, 50], help='accounts per user')
+    parser.add_argument('--history', type=parse_sizes, default=[1, 1000], help='history records per account')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--pin-iterations', type=int, default=None,
+                        help='PBKDF2 iterations of the benchmark cards, defaults to the configured pin hasher')
+    parser.add_argument('--output', default=None, help='write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', default=None, help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative throughput drop')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    if args.pin_iterations is not None:
+        from account import pin_hash
+        pin_hash.set_default_hasher(pin_hash.Pbkdf2PinHasher(iterations=args.pin_iterations))
+
+    backends = list(BACKENDS) if args.backend == 'all' else [args.backend]
+    results = []
+    user_ids = itertools.count(1)
+    for backend, accounts, history in itertools.product(backends, args.accounts, args.history):
+        results.extend(run_backend(backend, accounts, history, args.iterations, next(user_ids)))
+
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Throughput and latency of InMemorySessionManager against RedisSessionManager on fakeredis.
+
+Every manager is filled with ``--sessions`` sessions before the operations are measured on
+random users, the ``expire`` result measures removing all of them once they expired.
+
+    python -m benchmarks.bench_session_managers --sessions 1000,100000 --output sessions.json
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+
+from benchmarks.common import make_result, measure, write_results
+
+
+def redis_manager(session_exp_seconds: int):
+    import fakeredis
+
+    from account.adaptors.session_manager import RedisSessionManager
+
+    return RedisSessionManager(
+        redis_cls=lambda **kwargs: fakeredis.FakeStrictRedis(server=fakeredis.FakeServer()),
+        session_exp_seconds=session_exp_seconds
+    )
+
+
+def memory_manager(session_exp_seconds: int):
+    from account.adaptors.memory_session_manager import InMemorySessionManager
+
+    return InMemorySessionManager(session_exp_seconds=session_exp_seconds)
+
+
+MANAGERS = dict(memory=memory_manager, fakeredis=redis_manager)
+
+
+def run(manager_name: str, sessions: int, iterations: int, seed: int):
+    session_manager = MANAGERS[manager_name](120)
+    params = dict(manager=manager_name, sessions=sessions)
+    session_keys = [session_manager.set_session(user_id) for user_id in range(sessions)]
+    user_ids = itertools.cycle(random.Random(seed).choices(range(sessions), k=iterations))
+    next_user = user_ids.__next__
+
+    def validate():
+        user_id = next_user()
+        session_manager.validate_user_session(user_id, session_keys[user_id])
+
+    def validate_and_extend():
+        user_id = next_user()
+        session_manager.validate_and_extend(user_id, session_keys[user_id])
+
+    def set_session():
+        user_id = next_user()
+        session_keys[user_id] = session_manager.set_session(user_id)
+
+    yield make_result('validate_user_session', params, measure(validate, iterations))
+    yield make_result('validate_and_extend', params, measure(validate_and_extend, iterations))
+    yield make_result('set_session', params, measure(set_session, iterations))
+
+    if manager_name == 'memory':
+        # expire everything by moving the manager's clock past the expiration
+        session_manager.clock = lambda: time.monotonic() + 121
+        started_at = time.perf_counter_ns()
+        session_manager.extend_session(0)
+        elapsed_ns = time.perf_counter_ns() - started_at
+        yield make_result('expire', params, dict(iterations=sessions, ops_per_sec=sessions / (elapsed_ns / 1e9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--manager', default='all', choices=['all', *MANAGERS])
+    parser.add_argument('--sessions', default='1000,100000', help='comma separated session counts')
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    manager_names = list(MANAGERS) if args.manager == 'all' else [args.manager]
+    results = []
+    for manager_name in manager_names:
+        for sessions in (int(value) for value in args.sessions.split(',')):
+            results.extend(run(manager_name, sessions, args.iterations, args.seed))
+
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
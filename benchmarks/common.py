@@ -0,0 +1,100 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies_ns: List[int], elapsed_ns: int) -> Dict[str, float]:
+    latencies_us = sorted(latency / 1000 for latency in latencies_ns)
+    return dict(
+        iterations=len(latencies_us),
+        ops_per_sec=len(latencies_us) / (elapsed_ns / 1e9) if elapsed_ns else 0.0,
+        mean_us=sum(latencies_us) / len(latencies_us) if latencies_us else 0.0,
+        p50_us=percentile(latencies_us, 0.50),
+        p90_us=percentile(latencies_us, 0.90),
+        p99_us=percentile(latencies_us, 0.99),
+        max_us=latencies_us[-1] if latencies_us else 0.0,
+    )
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 0) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+
+    latencies_ns = []
+    started_at = time.perf_counter_ns()
+    for _ in range(iterations):
+        call_started_at = time.perf_counter_ns()
+        fn()
+        latencies_ns.append(time.perf_counter_ns() - call_started_at)
+
+    return summarize(latencies_ns, time.perf_counter_ns() - started_at)
+
+
+def environment() -> Dict[str, Optional[str]]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return dict(
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+        cpu_count=str(os.cpu_count()),
+        commit=commit,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+    )
+
+
+def write_results(results: List[Dict], output: Optional[str]):
+    document = dict(environment=environment(), results=results)
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(document, output_file, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+def make_result(name: str, params: Dict, stats: Dict[str, float]) -> Dict:
+    return dict(name=name, params=params, **stats)
+
+
+def result_key(result: Dict) -> tuple:
+    return (result['name'], *sorted(result['params'].items()))
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Returns a line per benchmark whose throughput dropped by more than tolerance against the baseline."""
+    with open(baseline_path) as baseline_file:
+        baseline = {result_key(result): result for result in json.load(baseline_file)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None or not previous['ops_per_sec']:
+            continue
+
+        ratio = result['ops_per_sec'] / previous['ops_per_sec']
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{result['name']} {result['params']}: "
+                f"{previous['ops_per_sec']:.0f} -> {result['ops_per_sec']:.0f} ops/s"
+            )
+
+    return regressions
@@ -0,0 +1,395 @@
+"""Replays a trace of ATM operations against the handler functions and reports capacity numbers.
+
+A trace is a JSONL file with one operation per line::
+
+    {"op": "login", "card": 1001, "pin": "4321"}
+    {"op": "list_accounts", "card": 1001}
+    {"op": "deposit", "card": 1001, "account": 1, "amount": 300}
+    {"op": "withdraw", "card": 1001, "account": 1, "amount": 120}
+
+or is synthesized with ``--synthesize``. Operations of one card always run in trace order on
+the same lane, lanes run concurrently as threads, processes or asyncio tasks. The generator
+runs closed loop: every lane issues its next operation as soon as the previous one returns.
+
+The ``sqlite`` backend serializes writers, concurrent deposits and withdrawals show up as
+OperationalError there, use ``live`` against MySQL and Redis for capacity numbers.
+
+    python -m benchmarks.loadgen --synthesize 20000 --cards 200 --concurrency 16 --mode threads
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import django
+
+from benchmarks.bench_handlers import PIN, setup_django
+from benchmarks.common import environment, summarize
+
+OPERATIONS = ('login', 'list_accounts', 'deposit', 'withdraw')
+DEFAULT_MIX = dict(login=0.1, list_accounts=0.4, deposit=0.25, withdraw=0.25)
+
+Outcome = Tuple[str, int, Optional[str]]
+
+
+def card_user_id(card_num: int) -> int:
+    return card_num - 1000
+
+
+def card_account_ids(card_num: int, accounts_per_card: int) -> List[int]:
+    return [card_user_id(card_num) * 1000 + index for index in range(1, accounts_per_card + 1)]
+
+
+def synthesize(count: int, cards: int, accounts_per_card: int, mix: Dict[str, float], seed: int) -> List[Dict]:
+    generator = random.Random(seed)
+    operations, weights = zip(*mix.items())
+    trace = []
+    for _ in range(count):
+        card_num = 1001 + generator.randrange(cards)
+        op = generator.choices(operations, weights)[0]
+        entry = dict(op=op, card=card_num)
+        if op == 'login':
+            entry['pin'] = PIN
+        elif op in ('deposit', 'withdraw'):
+            entry['account'] = generator.choice(card_account_ids(card_num, accounts_per_card))
+            entry['amount'] = generator.randint(1, 500)
+
+        trace.append(entry)
+
+    return trace
+
+
+def load_trace(path: str) -> List[Dict]:
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def trace_cards(trace: List[Dict]) -> List[int]:
+    return sorted({entry['card'] for entry in trace})
+
+
+def build_backend(backend: str, cards: List[int], accounts_per_card: int):
+    """Returns a unit of work factory and a session manager for cards that all use PIN."""
+    from account.entity import Account, AccountRecord, Card
+
+    records = dict()
+    for card_num in cards:
+        records[card_num] = [
+            (account_id, AccountRecord(action=AccountRecord.DEPOSIT, balance=100000, record_index=1))
+            for account_id in card_account_ids(card_num, accounts_per_card)
+        ]
+
+    if backend == 'fake':
+        # the fakes import the Django models through the repository module
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'atmdjango.atm_django.settings')
+        django.setup()
+        from tests.conftest import FakeSessionmanager, FakeUnitOfWork
+
+        card_objects = [
+            Card(card_num=card_num, user_id=card_user_id(card_num), pin_salt_hash=Card.make_pin_hash(PIN))
+            for card_num in cards
+        ]
+        accounts = [
+            Account(account_id=account_id, user_id=card_user_id(card_num), name=str(account_id), histories=[record])
+            for card_num, card_records in records.items() for account_id, record in card_records
+        ]
+        return lambda: FakeUnitOfWork(cards=card_objects, accounts=accounts), FakeSessionmanager()
+
+    if backend == 'sqlite':
+        import fakeredis
+
+        setup_django()
+        from account.adaptors.session_manager import RedisSessionManager
+        from account.service.unit_of_work import DjangoUnitOfWork
+        from atmdjango.atm_app.models import AccountBalance, AccountHistory, BankAccount, BankCard
+
+        for card_num, card_records in records.items():
+            user_id = card_user_id(card_num)
+            BankCard.objects.create(card_number=card_num, user_id=user_id, pin_hash=Card.make_pin_hash(PIN))
+            rows = []
+            for account_id, record in card_records:
+                BankAccount.objects.create(id=account_id, user_id=user_id, account_name=str(account_id))
+                rows.append(AccountHistory(
+                    account_id=account_id, account_balance=record.balance,
+                    operation=record.action, operation_index=record.record_index
+                ))
+            AccountHistory.objects.bulk_create(rows)
+            AccountBalance.record_latest(rows)
+
+        return DjangoUnitOfWork, RedisSessionManager(redis_cls=fakeredis.FakeStrictRedis)
+
+    if backend == 'live':
+        # existing cards and accounts of the configured MySQL and Redis deployment
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'atmdjango.atm_django.settings')
+        django.setup()
+        from account.adaptors.session_manager import RedisSessionManager
+        from account.service.unit_of_work import DjangoUnitOfWork
+
+        return DjangoUnitOfWork, RedisSessionManager()
+
+    raise ValueError(f'unknown backend {backend}')
+
+
+def run_operation(entry: Dict, sessions: Dict[int, str], uow_factory, session_manager, committer=None):
+    from account.service import handler
+    from account.value_objects import AccountRecord
+
+    card_num = entry['card']
+    if entry['op'] == 'login' or card_num not in sessions:
+        sessions[card_num] = handler.set_session(
+            card_num=card_num, pin=entry.get('pin', PIN), uow=uow_factory(), session_manager=session_manager
+        )
+        if entry['op'] == 'login':
+            return
+
+    if entry['op'] == 'list_accounts':
+        handler.get_accounts(
+            session_key=sessions[card_num], card_num=card_num, uow=uow_factory(), session_manager=session_manager
+        )
+    elif committer is not None:
+        committer.account_action(
+            session_key=sessions[card_num], account_id=entry['account'],
+            action=AccountRecord.DEPOSIT if entry['op'] == 'deposit' else AccountRecord.WITHDRAWAL,
+            amount=entry['amount'], card_num=card_num
+        )
+    else:
+        handler.account_action(
+            session_key=sessions[card_num], account_id=entry['account'],
+            action=AccountRecord.DEPOSIT if entry['op'] == 'deposit' else AccountRecord.WITHDRAWAL,
+            amount=entry['amount'], card_num=card_num, uow=uow_factory(), session_manager=session_manager
+        )
+
+
+def timed_operation(entry: Dict, run) -> Outcome:
+    started_at = time.perf_counter_ns()
+    error = None
+    try:
+        run()
+    except Exception as exception:
+        error = type(exception).__name__
+
+    return entry['op'], time.perf_counter_ns() - started_at, error
+
+
+def run_lane(lane: List[Dict], uow_factory, session_manager, committer=None) -> List[Outcome]:
+    sessions = dict()
+    return [
+        timed_operation(entry, lambda: run_operation(entry, sessions, uow_factory, session_manager, committer))
+        for entry in lane
+    ]
+
+
+def run_lane_in_process(lane: List[Dict], backend: str, accounts_per_card: int) -> Tuple[List[Outcome], int]:
+    uow_factory, session_manager = build_backend(backend, trace_cards(lane), accounts_per_card)
+    started_at = time.perf_counter_ns()
+    outcomes = run_lane(lane, uow_factory, session_manager)
+    return outcomes, time.perf_counter_ns() - started_at
+
+
+async def run_lane_async(lane: List[Dict], uow_factory, session_manager) -> List[Outcome]:
+    from account.service import handler
+    from account.service.unit_of_work import ThreadBoundUnitOfWork
+    from account.value_objects import AccountRecord
+
+    sessions = dict()
+    outcomes = []
+    for entry in lane:
+        card_num = entry['card']
+        started_at = time.perf_counter_ns()
+        error = None
+        try:
+            if entry['op'] == 'login' or card_num not in sessions:
+                sessions[card_num] = await handler.set_session_async(
+                    card_num=card_num, pin=entry.get('pin', PIN),
+                    uow=ThreadBoundUnitOfWork(uow_factory()), session_manager=session_manager
+                )
+
+            if entry['op'] == 'list_accounts':
+                await handler.get_accounts_async(
+                    session_key=sessions[card_num], card_num=card_num,
+                    uow=ThreadBoundUnitOfWork(uow_factory()), session_manager=session_manager
+                )
+            elif entry['op'] in ('deposit', 'withdraw'):
+                await handler.account_action_async(
+                    session_key=sessions[card_num], account_id=entry['account'],
+                    action=AccountRecord.DEPOSIT if entry['op'] == 'deposit' else AccountRecord.WITHDRAWAL,
+                    amount=entry['amount'], card_num=card_num,
+                    uow=ThreadBoundUnitOfWork(uow_factory()), session_manager=session_manager
+                )
+        except Exception as exception:
+            error = type(exception).__name__
+
+        outcomes.append((entry['op'], time.perf_counter_ns() - started_at, error))
+
+    return outcomes
+
+
+def async_session_manager(backend: str):
+    if backend == 'fake':
+        # the fakes import the Django models through the repository module
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'atmdjango.atm_django.settings')
+        django.setup()
+        from tests.conftest import FakeAsyncSessionManager
+
+        return FakeAsyncSessionManager()
+
+    from account.adaptors.async_session_manager import AsyncRedisSessionManager
+
+    if backend == 'sqlite':
+        import fakeredis.aioredis
+
+        return AsyncRedisSessionManager(redis_cls=fakeredis.aioredis.FakeRedis)
+
+    return AsyncRedisSessionManager()
+
+
+def split_lanes(trace: List[Dict], concurrency: int) -> List[List[Dict]]:
+    lanes = [[] for _ in range(concurrency)]
+    for entry in trace:
+        lanes[entry['card'] % concurrency].append(entry)
+
+    return [lane for lane in lanes if lane]
+
+
+def replay(
+        trace: List[Dict], backend: str, mode: str, concurrency: int, accounts_per_card: int,
+        group_commit: bool = False
+):
+    lanes = split_lanes(trace, concurrency)
+
+    if mode == 'processes':
+        # every process builds its own backend with the cards of its lane, the replay lasts
+        # as long as the slowest lane without process start up and backend setup
+        with ProcessPoolExecutor(max_workers=len(lanes)) as executor:
+            lane_results = list(executor.map(
+                run_lane_in_process, lanes, [backend] * len(lanes), [accounts_per_card] * len(lanes)
+            ))
+        lane_outcomes = [outcomes for outcomes, _ in lane_results]
+        elapsed_ns = max(lane_elapsed_ns for _, lane_elapsed_ns in lane_results)
+    else:
+        uow_factory, session_manager = build_backend(backend, trace_cards(trace), accounts_per_card)
+        started_at = time.perf_counter_ns()
+        if mode == 'threads':
+            committer = None
+            if group_commit:
+                from account.service.group_commit import GroupCommitter
+                committer = GroupCommitter(uow_factory(), session_manager)
+
+            with ThreadPoolExecutor(max_workers=len(lanes)) as executor:
+                lane_outcomes = list(executor.map(
+                    lambda lane: run_lane(lane, uow_factory, session_manager, committer), lanes
+                ))
+        else:
+            async def run_lanes():
+                async_manager = async_session_manager(backend)
+                return await asyncio.gather(*(run_lane_async(lane, uow_factory, async_manager) for lane in lanes))
+
+            lane_outcomes = asyncio.run(run_lanes())
+
+        elapsed_ns = time.perf_counter_ns() - started_at
+
+    return [outcome for outcomes in lane_outcomes for outcome in outcomes], elapsed_ns
+
+
+def report(outcomes: List[Outcome], elapsed_ns: int, params: Dict) -> Dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(Counter)
+    for op, latency_ns, error in outcomes:
+        latencies[op].append(latency_ns)
+        if error is not None:
+            errors[op][error] += 1
+
+    total_errors = Counter()
+    for op_errors in errors.values():
+        total_errors.update(op_errors)
+
+    return dict(
+        environment=environment(),
+        params=params,
+        operations=len(outcomes),
+        elapsed_seconds=elapsed_ns / 1e9,
+        throughput_ops_per_sec=len(outcomes) / (elapsed_ns / 1e9) if elapsed_ns else 0.0,
+        errors=dict(total_errors),
+        per_operation={
+            op: dict(summarize(op_latencies, elapsed_ns), errors=dict(errors[op]))
+            for op, op_latencies in sorted(latencies.items())
+        },
+    )
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = dict()
+    for part in value.split(','):
+        op, weight = part.split('=')
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {op}')
+        mix[op] = float(weight)
+
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--trace', help='JSONL trace to replay')
+    source.add_argument('--synthesize', type=int, metavar='N', help='synthesize a trace of N operations')
+    parser.add_argument('--cards', type=int, default=100, help='cards of a synthesized trace')
+    parser.add_argument('--accounts-per-card', type=int, default=3)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='operation weights of a synthesized trace, e.g. login=1,deposit=3')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-trace', help='write the synthesized trace to this file')
+    parser.add_argument('--backend', choices=['fake', 'sqlite', 'live'], default='fake')
+    parser.add_argument('--mode', choices=['threads', 'processes', 'asyncio'], default='threads')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--group-commit', action='store_true',
+                        help='run deposits and withdrawals through a GroupCommitter, threads mode only')
+    parser.add_argument('--pin-iterations', type=int, default=None,
+                        help='PBKDF2 iterations of the generated cards, defaults to the configured pin hasher')
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.pin_iterations is not None:
+        from account import pin_hash
+        pin_hash.set_default_hasher(pin_hash.Pbkdf2PinHasher(iterations=args.pin_iterations))
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthesize(args.synthesize, args.cards, args.accounts_per_card, args.mix, args.seed)
+        if args.save_trace:
+            with open(args.save_trace, 'w') as trace_file:
+                trace_file.writelines(json.dumps(entry) + '\n' for entry in trace)
+
+    if args.mode == 'processes' and args.backend == 'live':
+        parser.error('the live backend replays with threads or asyncio')
+
+    if args.group_commit and args.mode != 'threads':
+        parser.error('--group-commit replays with threads')
+
+    outcomes, elapsed_ns = replay(
+        trace, args.backend, args.mode, args.concurrency, args.accounts_per_card, args.group_commit
+    )
+    result = report(outcomes, elapsed_ns, dict(
+        backend=args.backend, mode=args.mode, concurrency=args.concurrency, operations=len(trace),
+        group_commit=args.group_commit
+    ))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(result, output_file, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,18 @@
 import abc
-from typing import List, Set, Optional
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Set, Optional
 
-from django.db import IntegrityError
-from django.db.models import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import Max, ObjectDoesNotExist, Q, QuerySet
 
+from account import instrumentation
+from account.adaptors.recent_writes import RecentWrites, get_recent_writes
 from account.entity import Account, AccountRecord, Card
 from account.service import service_exceptions
-from atmdjango.atm_app.models import BankCard, BankAccount, AccountHistory
+from atmdjango.atm_app.models import BankCard, BankAccount, AccountBalance, AccountHistory
+from atmdjango.atm_django.routers import read_from
 
 
 class AccountRepository(metaclass=abc.ABCMeta):
@@ -14,6 +20,10 @@ class AccountRepository(metaclass=abc.ABCMeta):
     def get_card(self, card_num: int) -> Optional[Card]:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_user_accounts(self, user_id: int) -> List[Account]:
         raise NotImplementedError
@@ -22,13 +32,43 @@ class AccountRepository(metaclass=abc.ABCMeta):
     def get_user_account(self, user_id: int,  account_id: int) -> Optional[Account]:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_account_history(
+            self, account_id: int,
+            since: Optional[datetime] = None, until: Optional[datetime] = None,
+            after_index: Optional[int] = None, page_size: int = 1000
+    ) -> Iterator[AccountRecord]:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def update_account(self, account: Account):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def update_accounts(self, accounts: List[Account]):
+        raise NotImplementedError
+
 
 class DjangoAccountRepo(AccountRepository):
+    """Account repository on the Django models.
+
+    With ``recent`` and ``on_commit`` given, the users of updated accounts are marked in
+    ``recent`` through ``on_commit`` once the surrounding unit of work committed.
+    """
+
+    def __init__(
+            self,
+            on_commit: Optional[Callable[[Callable[[], None]], None]] = None,
+            recent: Optional[RecentWrites] = None
+    ):
+        self.on_commit = on_commit
+        self.recent_writes = recent
 
+    @instrumentation.timed('repo.get_card')
     def get_card(self, card_num: int) -> Optional[Card]:
         try:
             card = BankCard.objects.get(card_number=card_num).to_domain()
@@ -37,59 +77,235 @@ class DjangoAccountRepo(AccountRepository):
 
         return card
 
+    @instrumentation.timed('repo.update_card_pin_hash')
+    def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        cards = BankCard.objects.filter(card_number=card_num)
+        if previous_pin_hash is not None:
+            cards = cards.filter(pin_hash=previous_pin_hash)
+
+        cards.update(pin_hash=pin_hash)
+
+    @instrumentation.timed('repo.get_user_accounts')
     def get_user_accounts(self, user_id: int) -> List[Account]:
-        accounts = []
-        for account_data in BankAccount.objects.filter(user_id=user_id):
-            account_last_record = AccountHistory.objects.filter(
-                account_id=account_data.id
-            ).order_by('operation_index').last()
-            histories = []
-            if account_last_record:
-                histories = [account_last_record.to_domain()]
-
-            accounts.append(
-                Account(
-                    user_id=user_id,
-                    name=account_data.account_name,
-                    account_id=account_data.id,
-                    histories=histories
-                )
+        return self._load_accounts(BankAccount.objects.filter(user_id=user_id))
+
+    @instrumentation.timed('repo.get_user_account')
+    def get_user_account(self, user_id: int, account_id: int) -> Optional[Account]:
+        accounts = self._load_accounts(BankAccount.objects.filter(user_id=user_id, id=account_id))
+        return accounts[0] if accounts else None
+
+    @instrumentation.timed('repo.get_user_accounts_by_id')
+    def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        accounts = self._load_accounts(BankAccount.objects.filter(user_id=user_id, id__in=list(account_ids)))
+        return {account.account_id: account for account in accounts}
+
+    @instrumentation.timed('repo.iter_account_history')
+    def iter_account_history(
+            self, account_id: int,
+            since: Optional[datetime] = None, until: Optional[datetime] = None,
+            after_index: Optional[int] = None, page_size: int = 1000
+    ) -> Iterator[AccountRecord]:
+        # pages are fetched by (account_id, operation_index) keyset, so each page is an index range
+        # scan and at most page_size rows are held in memory regardless of the history length
+        rows = AccountHistory.objects.filter(account_id=account_id)
+        if since is not None:
+            rows = rows.filter(created_at__gte=since)
+        if until is not None:
+            rows = rows.filter(created_at__lt=until)
+
+        while True:
+            page_rows = rows
+            if after_index is not None:
+                page_rows = page_rows.filter(operation_index__gt=after_index)
+
+            page = list(
+                page_rows.order_by('operation_index').values_list(
+                    'operation_index', 'account_balance', 'operation', 'created_at'
+                )[:page_size]
             )
+            for operation_index, account_balance, operation, created_at in page:
+                yield AccountRecord(
+                    action=operation, balance=account_balance, record_index=operation_index, time_at=created_at
+                )
 
-        return accounts
+            if len(page) < page_size:
+                return
+
+            after_index = page[-1][0]
+
+    def update_account(self, account: Account):
+        self.update_accounts([account])
+
+    @instrumentation.timed('repo.update_accounts')
+    def update_accounts(self, accounts: List[Account]):
+        history_rows = []
+        for account in accounts:
+            account.new_histories.sort(key=lambda x: x.record_index)
+            for record in account.new_histories:
+                history_rows.append(
+                    AccountHistory(
+                        account_id=account.account_id,
+                        operation_index=record.record_index,
+                        account_balance=record.balance,
+                        operation=record.action
+                    )
+                )
+
+        if not history_rows:
+            return
 
-    def get_user_account(self, user_id: int, account_id: int) -> Optional[Account]:
         try:
-            account_data = BankAccount.objects.get(user_id=user_id, id=account_id)
-        except ObjectDoesNotExist:
+            with transaction.atomic():
+                AccountHistory.objects.bulk_create(history_rows)
+                AccountBalance.record_latest(history_rows)
+        except IntegrityError as error:
+            account_ids = ', '.join(str(account.account_id) for account in accounts)
+            raise service_exceptions.AccountHistoryIntegrityError(
+                f'Integrity error on account record update to accounts {account_ids}'
+            ) from error
+
+        if self.on_commit is not None and self.recent_writes is not None:
+            self.on_commit(partial(self.recent_writes.record, {account.user_id for account in accounts}))
+
+    @staticmethod
+    def _load_accounts(account_rows: QuerySet) -> List[Account]:
+        # the balance snapshot is joined to the accounts, history is only read for accounts
+        # whose snapshot has not been built yet (see the rebuild_account_balances command)
+        account_rows = list(account_rows.select_related('balance'))
+        last_records = dict()
+        missing_snapshots = []
+        for account_data in account_rows:
+            try:
+                last_records[account_data.id] = account_data.balance.to_domain()
+            except ObjectDoesNotExist:
+                missing_snapshots.append(account_data.id)
+
+        if missing_snapshots:
+            last_indexes = AccountHistory.objects.filter(account_id__in=missing_snapshots).values(
+                'account_id'
+            ).annotate(last_index=Max('operation_index'))
+            last_rows = Q()
+            for row in last_indexes:
+                last_rows |= Q(account_id=row['account_id'], operation_index=row['last_index'])
+            if last_rows:
+                for history in AccountHistory.objects.filter(last_rows):
+                    last_records[history.account_id] = history.to_domain()
+
+        return [
+            Account(
+                user_id=account_data.user_id,
+                name=account_data.account_name,
+                account_id=account_data.id,
+                histories=[last_records[account_data.id]] if account_data.id in last_records else []
+            )
+            for account_data in account_rows
+        ]
+
+
+class ReplicaAccountRepo(AccountRepository):
+    """Read-only repository whose queries run on a replica database alias.
+
+    Users that committed a write within the freshness window of ``recent_writes`` are read from
+    the primary instead, cards are always read from the replica. ``checkout`` is called with the
+    alias of every read before it runs, None standing for the primary.
+    """
+
+    def __init__(
+            self,
+            repo: AccountRepository,
+            replica_alias: Optional[str],
+            recent: Optional[RecentWrites] = None,
+            checkout: Optional[Callable[[Optional[str]], None]] = None
+    ):
+        self.repo = repo
+        self.replica_alias = replica_alias
+        self.recent_writes = recent if recent is not None else get_recent_writes()
+        self.checkout = checkout
+
+    @contextmanager
+    def _read_from(self, alias: Optional[str]):
+        if self.checkout is not None:
+            self.checkout(alias)
+
+        with read_from(alias):
+            yield
+
+    def _alias_for(self, user_id: int) -> Optional[str]:
+        if self.replica_alias is None or self.recent_writes is None or self.recent_writes.is_recent(user_id):
             return None
 
-        histories = []
-        account_last_record = AccountHistory.objects.filter(
-                account_id=account_data.id
-            ).order_by('operation_index').last()
-        if account_last_record:
-            histories = [account_last_record.to_domain()]
+        return self.replica_alias
+
+    def get_card(self, card_num: int) -> Optional[Card]:
+        with self._read_from(self.replica_alias):
+            return self.repo.get_card(card_num)
+
+    def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        raise service_exceptions.ReadOnlyRepository('pin hashes can not be updated through a read-only repository')
+
+    def get_user_accounts(self, user_id: int) -> List[Account]:
+        with self._read_from(self._alias_for(user_id)):
+            return self.repo.get_user_accounts(user_id)
+
+    def get_user_account(self, user_id: int, account_id: int) -> Optional[Account]:
+        with self._read_from(self._alias_for(user_id)):
+            return self.repo.get_user_account(user_id, account_id)
+
+    def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        with self._read_from(self._alias_for(user_id)):
+            return self.repo.get_user_accounts_by_id(user_id, account_ids)
+
+    def iter_account_history(
+            self, account_id: int,
+            since: Optional[datetime] = None, until: Optional[datetime] = None,
+            after_index: Optional[int] = None, page_size: int = 1000
+    ) -> Iterator[AccountRecord]:
+        # the generator runs its queries lazily, every page switches to the replica on its own
+        history = self.repo.iter_account_history(account_id, since, until, after_index, page_size)
+        while True:
+            with self._read_from(self.replica_alias):
+                record = next(history, None)
+
+            if record is None:
+                return
 
-        return Account(
-            user_id=user_id,
-            name=account_data.account_name,
-            account_id=account_data.id,
-            histories=histories
-        )
+            yield record
 
     def update_account(self, account: Account):
-        account.new_histories.sort(key=lambda x: x.record_index)
-        for record in account.new_histories:
-            try:
-                AccountHistory.objects.create(
-                    account_id=account.account_id,
-                    operation_index=record.record_index,
-                    account_balance=record.balance,
-                    operation=record.action
-                )
-            except IntegrityError as error:
-                raise service_exceptions.AccountHistoryIntegrityError(
-                    f'Integrity error on account record update '
-                    f'to account {account.account_id} with record index {record.record_index}'
-                ) from error
+        raise service_exceptions.ReadOnlyRepository('accounts can not be updated through a read-only repository')
+
+    def update_accounts(self, accounts: List[Account]):
+        raise service_exceptions.ReadOnlyRepository('accounts can not be updated through a read-only repository')
+
+
+class AsyncAccountRepo:
+    """Awaitable facade of a blocking AccountRepository.
+
+    ``run`` executes a blocking call and is supplied by the async unit of work, which pins
+    every call of one unit of work to the thread that owns its database transaction.
+    """
+
+    def __init__(self, repo: AccountRepository, run: Callable[..., Awaitable]):
+        self.repo = repo
+        self._run = run
+
+    async def get_card(self, card_num: int) -> Optional[Card]:
+        return await self._run(self.repo.get_card, card_num)
+
+    async def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        await self._run(self.repo.update_card_pin_hash, card_num, pin_hash, previous_pin_hash)
+
+    async def get_user_accounts(self, user_id: int) -> List[Account]:
+        return await self._run(self.repo.get_user_accounts, user_id)
+
+    async def get_user_account(self, user_id: int, account_id: int) -> Optional[Account]:
+        return await self._run(self.repo.get_user_account, user_id, account_id)
+
+    async def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        return await self._run(self.repo.get_user_accounts_by_id, user_id, account_ids)
+
+    async def update_account(self, account: Account):
+        await self._run(self.repo.update_account, account)
+
+    async def update_accounts(self, accounts: List[Account]):
+        await self._run(self.repo.update_accounts, accounts)
@@ -0,0 +1,78 @@
+import abc
+import os
+from typing import Optional, Type
+from uuid import uuid4
+
+from redis.asyncio import Redis
+
+from account import instrumentation
+from account.adaptors.session_manager import SESSION_EXPIRATION_SECONDS, VALIDATE_AND_EXTEND_SCRIPT
+
+
+class AsyncSessionManager(metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    async def set_session(self, user_id: int) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def extend_session(self, user_id: int):
+        raise NotImplementedError
+
+    async def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        if not await self.validate_user_session(user_id, session_key):
+            return False
+
+        await self.extend_session(user_id)
+        return True
+
+
+class AsyncRedisSessionManager(AsyncSessionManager):
+    redis: Redis
+
+    def __init__(
+            self,
+            redis_host: Optional[str] = None,
+            redis_port: Optional[int] = None,
+            session_exp_seconds: int = SESSION_EXPIRATION_SECONDS,
+            redis_cls: Type[Redis] = Redis
+    ):
+        if redis_host is None:
+            redis_host = os.getenv('REDIS_HOST')
+
+        if redis_port is not None:
+            self.redis = redis_cls(host=redis_host, port=redis_port)
+        else:
+            self.redis = redis_cls(host=redis_host)
+
+        self.session_exp_seconds = session_exp_seconds
+        self._validate_and_extend = self.redis.register_script(VALIDATE_AND_EXTEND_SCRIPT)
+
+    @instrumentation.timed('session.set_session')
+    async def set_session(self, user_id: int) -> str:
+        session_key = str(uuid4())
+        await self.redis.set(str(user_id), session_key, ex=self.session_exp_seconds)
+        return session_key
+
+    @instrumentation.timed('session.validate_user_session')
+    async def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        saved_key = await self.redis.get(str(user_id))
+        if saved_key:
+            return session_key == saved_key.decode()
+
+        return False
+
+    @instrumentation.timed('session.extend_session')
+    async def extend_session(self, user_id: int):
+        await self.redis.expire(str(user_id), self.session_exp_seconds)
+
+    @instrumentation.timed('session.validate_and_extend')
+    async def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        return bool(await self._validate_and_extend(keys=[str(user_id)], args=[session_key, self.session_exp_seconds]))
+
+    async def close(self):
+        await self.redis.close()
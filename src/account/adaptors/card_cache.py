@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from account.adaptors.account_repo import AccountRepository
+from account.entity import Account, Card
+from account.value_objects import AccountRecord
+
+
+class CardCache:
+    """Bounded LRU cache of cards whose entries expire ttl_seconds after they were loaded.
+
+    Cards are stored as plain values and a fresh Card is built on every hit, so callers can
+    not leak changes into the cache.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 120, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[int, Tuple[float, int, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, card_num: int) -> Optional[Card]:
+        with self._lock:
+            entry = self._entries.get(card_num)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expire_at, user_id, pin_salt_hash = entry
+            if expire_at <= self.clock():
+                del self._entries[card_num]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(card_num)
+            self.hits += 1
+
+        return Card(card_num=card_num, user_id=user_id, pin_salt_hash=pin_salt_hash)
+
+    def put(self, card: Card):
+        with self._lock:
+            self._entries[card.card_num] = (self.clock() + self.ttl_seconds, card.user_id, card.pin_salt_hash)
+            self._entries.move_to_end(card.card_num)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, card_num: int):
+        with self._lock:
+            self._entries.pop(card_num, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(size=len(self._entries), hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+class CachedAccountRepo(AccountRepository):
+    """Serves cards from a CardCache.
+
+    ``on_commit`` schedules a callback for when the writes of the surrounding transaction are
+    committed. Cards are invalidated through it, so a read racing the commit can not put the
+    previous pin hash back into the cache. Without it they are invalidated right away.
+    """
+
+    def __init__(
+            self, repo: AccountRepository, card_cache: CardCache,
+            on_commit: Optional[Callable[[Callable[[], None]], None]] = None
+    ):
+        self.repo = repo
+        self.card_cache = card_cache
+        self.on_commit = on_commit
+
+    def get_card(self, card_num: int) -> Optional[Card]:
+        card = self.card_cache.get(card_num)
+        if card is not None:
+            return card
+
+        card = self.repo.get_card(card_num)
+        if card is not None:
+            self.card_cache.put(card)
+
+        return card
+
+    def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        self.repo.update_card_pin_hash(card_num, pin_hash, previous_pin_hash)
+        if self.on_commit is None:
+            self.card_cache.invalidate(card_num)
+        else:
+            self.on_commit(lambda: self.card_cache.invalidate(card_num))
+
+    def get_user_accounts(self, user_id: int) -> List[Account]:
+        return self.repo.get_user_accounts(user_id)
+
+    def get_user_account(self, user_id: int, account_id: int) -> Optional[Account]:
+        return self.repo.get_user_account(user_id, account_id)
+
+    def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        return self.repo.get_user_accounts_by_id(user_id, account_ids)
+
+    def iter_account_history(
+            self, account_id: int,
+            since: Optional[datetime] = None, until: Optional[datetime] = None,
+            after_index: Optional[int] = None, page_size: int = 1000
+    ) -> Iterator[AccountRecord]:
+        return self.repo.iter_account_history(account_id, since, until, after_index, page_size)
+
+    def update_account(self, account: Account):
+        self.repo.update_account(account)
+
+    def update_accounts(self, accounts: List[Account]):
+        self.repo.update_accounts(accounts)
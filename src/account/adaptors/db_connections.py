@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+class ConnectionManager:
+    """Keeps one persistent database connection per worker thread.
+
+    Replaces close_old_connections on unit of work entry: a connection is reused until it is
+    older than ``max_age`` seconds, it is only pinged when it sat idle for ``ping_after_idle``
+    seconds, and it is closed and reopened once a query failed and left it unusable.
+    ``max_age`` defaults to CONN_MAX_AGE of the database settings, where None keeps it forever.
+    One manager covers one database alias, get_connection_manager keeps one per configured alias.
+    """
+
+    def __init__(
+            self,
+            alias: str = DEFAULT_DB_ALIAS,
+            max_age: Optional[float] = None,
+            ping_after_idle: Optional[float] = None,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        if ping_after_idle is None:
+            ping_after_idle = float(os.getenv('DB_CONN_PING_AFTER_IDLE', 30))
+
+        self.alias = alias
+        self._max_age = max_age
+        self.ping_after_idle = ping_after_idle
+        self.clock = clock
+        self.connects = 0
+        self.reuses = 0
+        self.pings = 0
+        self.recycles = 0
+        self.failures = 0
+        self._state = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def max_age(self) -> float:
+        if self._max_age is not None:
+            return self._max_age
+
+        max_age = connections[self.alias].settings_dict['CONN_MAX_AGE']
+        return float('inf') if max_age is None else max_age
+
+    def checkout(self):
+        connection = connections[self.alias]
+        now = self.clock()
+
+        if connection.connection is not None:
+            if connection.connection is not getattr(self._state, 'raw', None):
+                # opened outside of a unit of work, its age is counted from now on
+                self._state.raw = connection.connection
+                self._state.opened_at = self._state.last_used_at = now
+
+            if now - self._state.opened_at >= self.max_age:
+                self._count('recycles')
+                connection.close()
+            elif now - self._state.last_used_at < self.ping_after_idle:
+                self._count('reuses')
+                return
+            else:
+                self._count('pings')
+                if connection.is_usable():
+                    self._count('reuses')
+                    return
+
+                self._count('failures')
+                connection.close()
+
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            self._count('failures')
+            raise
+
+        self._count('connects')
+        self._state.raw = connection.connection
+        self._state.opened_at = self._state.last_used_at = now
+
+    def checkin(self):
+        connection = connections[self.alias]
+        self._state.last_used_at = self.clock()
+        if connection.errors_occurred:
+            connection.errors_occurred = False
+            if connection.connection is not None and not connection.is_usable():
+                self._count('failures')
+                connection.close()
+                self._state.raw = None
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                connects=self.connects, reuses=self.reuses, pings=self.pings,
+                recycles=self.recycles, failures=self.failures
+            )
+
+
+_connection_managers: Dict[str, ConnectionManager] = dict()
+_connection_managers_lock = threading.Lock()
+
+
+def get_connection_manager(alias: Optional[str] = None) -> ConnectionManager:
+    """Returns the process-wide manager of ``alias``, None is the default database."""
+    if alias is None:
+        alias = DEFAULT_DB_ALIAS
+
+    with _connection_managers_lock:
+        if alias not in _connection_managers:
+            _connection_managers[alias] = ConnectionManager(alias)
+
+        return _connection_managers[alias]
+
@@ -0,0 +1,360 @@
+"""Memory-mapped, append-only ledger for single-node deployments without MySQL.
+
+The file starts with an 8 byte magic followed by entries::
+
+    <payload length: uint32><crc32 of payload: uint32><payload>
+
+A payload holds every operation of one commit, so a commit is replayed completely or not at
+all. Operations start with a type byte:
+
+    card     <B q card_num q user_id H length><pin hash>
+    account  <B q account_id q user_id H length><account name>
+    record   <B q account_id q record_index q balance B action q microseconds since epoch UTC>
+
+The file is grown in ``grow_bytes`` steps and the unused tail is zero filled, recovery stops at
+the first zero length or checksum mismatch, which drops a commit torn by a crash.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from account import instrumentation
+from account.service import service_exceptions
+from account.value_objects import AccountRecord, AccountRecords
+
+MAGIC = b'ATMLDG01'
+ENTRY_HEADER = struct.Struct('<II')
+CARD = struct.Struct('<BqqH')
+ACCOUNT = struct.Struct('<BqqH')
+RECORD = struct.Struct('<BqqqBq')
+
+CARD_OP, ACCOUNT_OP, RECORD_OP = 1, 2, 3
+
+_ACTIONS = (AccountRecord.DEPOSIT, AccountRecord.WITHDRAWAL)
+_ACTION_CODES = {action: code for code, action in enumerate(_ACTIONS)}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class LedgerCorrupted(Exception):
+    pass
+
+
+class LedgerFailed(Exception):
+    """Raised once a flush of the ledger failed, the store has to be reopened to replay what is durable."""
+
+
+class LedgerFile:
+    """Appends checksummed entries to a memory-mapped file and fsyncs them in groups.
+
+    Concurrent committers that call ``sync`` while a flush is running wait for it and share the
+    next one, so N commits arriving together cost one or two fsyncs instead of N. A failed flush
+    is final: the kernel may have dropped the unwritten pages, so a later fsync succeeding proves
+    nothing and every further append or sync raises LedgerFailed.
+    """
+
+    def __init__(self, path: str, grow_bytes: int = 1 << 20, fsync: bool = True):
+        self.path = path
+        self.grow_bytes = grow_bytes
+        self.fsync = fsync
+        self.syncs = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            os.ftruncate(self._fd, grow_bytes)
+            os.pwrite(self._fd, MAGIC, 0)
+            os.fsync(self._fd)
+            size = grow_bytes
+        elif os.pread(self._fd, len(MAGIC), 0) != MAGIC:
+            os.close(self._fd)
+            raise LedgerCorrupted(f'{path} is not an account ledger')
+
+        self._map = mmap.mmap(self._fd, size)
+        self._end = len(MAGIC)
+        self._synced_end = self._end
+        self._syncing = False
+        self._sync_condition = threading.Condition()
+        self.failure: Optional[BaseException] = None
+
+    def replay(self) -> Iterator[bytes]:
+        """Yields the payload of every intact entry and positions appends after the last one."""
+        offset = len(MAGIC)
+        size = len(self._map)
+        while offset + ENTRY_HEADER.size <= size:
+            length, checksum = ENTRY_HEADER.unpack_from(self._map, offset)
+            payload_start = offset + ENTRY_HEADER.size
+            if length == 0 or payload_start + length > size:
+                break
+
+            payload = bytes(self._map[payload_start:payload_start + length])
+            if zlib.crc32(payload) != checksum:
+                break
+
+            yield payload
+            offset = payload_start + length
+
+        # a torn entry is overwritten by the next append, zero its header so it can not resurface
+        if offset + ENTRY_HEADER.size <= size:
+            self._map[offset:offset + ENTRY_HEADER.size] = bytes(ENTRY_HEADER.size)
+
+        self._end = self._synced_end = offset
+
+    def check(self):
+        if self.failure is not None:
+            raise LedgerFailed(f'flushing {self.path} failed, it has to be reopened') from self.failure
+
+    def append(self, payload: bytes) -> int:
+        """Writes one entry and returns the file offset it ends at. Callers serialize appends."""
+        self.check()
+        entry_size = ENTRY_HEADER.size + len(payload)
+        # keep room for the zero header that terminates the ledger
+        required = self._end + entry_size + ENTRY_HEADER.size
+        if required > len(self._map):
+            self._grow(required)
+
+        ENTRY_HEADER.pack_into(self._map, self._end, len(payload), zlib.crc32(payload))
+        self._map[self._end + ENTRY_HEADER.size:self._end + entry_size] = payload
+        self._end += entry_size
+        self._map[self._end:self._end + ENTRY_HEADER.size] = bytes(ENTRY_HEADER.size)
+        return self._end
+
+    def _grow(self, required: int):
+        size = len(self._map)
+        while size < required:
+            size += self.grow_bytes
+
+        # the mapping is replaced, a flush running concurrently must not use the old one
+        with self._sync_condition:
+            while self._syncing:
+                self._sync_condition.wait()
+
+            self._map.flush()
+            self._map.close()
+            os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+
+    @instrumentation.timed('ledger.sync')
+    def sync(self, offset: int):
+        """Returns once the ledger is durable up to offset."""
+        if not self.fsync:
+            return
+
+        with self._sync_condition:
+            while self._synced_end < offset:
+                self.check()
+                if self._syncing:
+                    self._sync_condition.wait()
+                    continue
+
+                self._syncing = True
+                target = self._end
+                self._sync_condition.release()
+                try:
+                    self._map.flush()
+                    os.fsync(self._fd)
+                except OSError as error:
+                    self.failure = error
+                    raise LedgerFailed(f'flushing {self.path} failed, it has to be reopened') from error
+                finally:
+                    self._sync_condition.acquire()
+                    self._syncing = False
+                    self._sync_condition.notify_all()
+
+                self.syncs += 1
+                self._synced_end = max(self._synced_end, target)
+
+    @property
+    def size(self) -> int:
+        return self._end
+
+    def close(self):
+        if self._map.closed:
+            return
+
+        self._map.flush()
+        self._map.close()
+        os.close(self._fd)
+
+
+def encode_card(card_num: int, user_id: int, pin_hash: str) -> bytes:
+    encoded = pin_hash.encode()
+    return CARD.pack(CARD_OP, card_num, user_id, len(encoded)) + encoded
+
+
+def encode_account(account_id: int, user_id: int, name: str) -> bytes:
+    encoded = name.encode()
+    return ACCOUNT.pack(ACCOUNT_OP, account_id, user_id, len(encoded)) + encoded
+
+
+def encode_record(account_id: int, record: AccountRecord) -> bytes:
+    return RECORD.pack(
+        RECORD_OP, account_id, record.record_index, record.balance,
+        _ACTION_CODES[record.action], (record.time_at - _EPOCH) // _MICROSECOND
+    )
+
+
+def decode(payload: bytes) -> Iterator[Tuple]:
+    offset = 0
+    while offset < len(payload):
+        op = payload[offset]
+        if op == CARD_OP or op == ACCOUNT_OP:
+            _, key, user_id, length = CARD.unpack_from(payload, offset)
+            offset += CARD.size
+            yield op, key, user_id, payload[offset:offset + length].decode()
+            offset += length
+        elif op == RECORD_OP:
+            _, account_id, record_index, balance, action, microseconds = RECORD.unpack_from(payload, offset)
+            offset += RECORD.size
+            yield op, account_id, AccountRecord(
+                action=_ACTIONS[action], balance=balance, record_index=record_index,
+                time_at=_EPOCH + microseconds * _MICROSECOND
+            )
+        else:
+            raise LedgerCorrupted(f'unknown ledger operation {op}')
+
+
+class LedgerStore:
+    """Cards, accounts and account histories held in memory and persisted to a LedgerFile.
+
+    Opening a store replays its ledger. Writes are validated, appended and applied under one
+    lock, and durable once ``commit`` returns. Writes are applied before they are flushed, so
+    once a flush failed the store refuses reads and writes with LedgerFailed instead of serving
+    changes that may be lost.
+    """
+
+    def __init__(self, path: str, grow_bytes: int = 1 << 20, fsync: Optional[bool] = None):
+        if fsync is None:
+            fsync = os.getenv('LEDGER_FSYNC', '1') != '0'
+
+        self.cards: Dict[int, Tuple[int, str]] = dict()
+        self.accounts: Dict[int, Tuple[int, str]] = dict()
+        self.user_accounts: Dict[int, List[int]] = dict()
+        self.histories: Dict[int, AccountRecords] = dict()
+        self.last_records: Dict[int, AccountRecord] = dict()
+        self._lock = threading.Lock()
+        self.ledger = LedgerFile(path, grow_bytes=grow_bytes, fsync=fsync)
+        for payload in self.ledger.replay():
+            self._apply(list(decode(payload)))
+
+    def _apply(self, operations: List[Tuple]):
+        for operation in operations:
+            op = operation[0]
+            if op == CARD_OP:
+                _, card_num, user_id, pin_hash = operation
+                self.cards[card_num] = (user_id, pin_hash)
+            elif op == ACCOUNT_OP:
+                _, account_id, user_id, name = operation
+                if account_id not in self.accounts:
+                    self.user_accounts.setdefault(user_id, []).append(account_id)
+                self.accounts[account_id] = (user_id, name)
+            else:
+                _, account_id, record = operation
+                history = self.histories.get(account_id)
+                if history is None:
+                    history = self.histories[account_id] = AccountRecords()
+                history.append(record)
+                self.last_records[account_id] = record
+
+    def check(self):
+        self.ledger.check()
+
+    def last_record(self, account_id: int) -> Optional[AccountRecord]:
+        # replaced in one assignment, readers need no lock
+        self.check()
+        return self.last_records.get(account_id)
+
+    def last_record_index(self, account_id: int) -> Optional[int]:
+        record = self.last_records.get(account_id)
+        return record.record_index if record is not None else None
+
+    def iter_history(self, account_id: int) -> Iterator[AccountRecord]:
+        # the columns of a history are appended one after another, only records that were
+        # complete when the iteration started are read
+        self.check()
+        with self._lock:
+            history = self.histories.get(account_id)
+            length = len(history) if history is not None else 0
+
+        for position in range(length):
+            yield history[position]
+
+    def add_card(self, card_num: int, user_id: int, pin_hash: str):
+        self.commit([(CARD_OP, card_num, user_id, pin_hash)])
+
+    def add_account(self, user_id: int, name: str, account_id: Optional[int] = None) -> int:
+        with self._lock:
+            if account_id is None:
+                account_id = max(self.accounts, default=0) + 1
+
+            end = self._write([(ACCOUNT_OP, account_id, user_id, name)])
+
+        self.ledger.sync(end)
+        return account_id
+
+    @instrumentation.timed('ledger.commit')
+    def commit(self, operations: List[Tuple], expected_pin_hashes: Optional[Dict[int, str]] = None):
+        """Validates, persists and applies the operations of one commit atomically.
+
+        Record operations must continue the history of their account and raise
+        AccountHistoryIntegrityError otherwise. A card operation listed in
+        ``expected_pin_hashes`` is skipped when the stored hash changed meanwhile.
+        """
+        with self._lock:
+            end = self._write(operations, expected_pin_hashes)
+
+        # the lock is released before the fsync so commits arriving meanwhile share the next one
+        if end is not None:
+            self.ledger.sync(end)
+
+    def _write(self, operations: List[Tuple], expected_pin_hashes: Optional[Dict[int, str]] = None) -> Optional[int]:
+        now = datetime.now(timezone.utc)
+        last_indexes = dict()
+        operations_to_write = []
+        for operation in operations:
+            if operation[0] == RECORD_OP:
+                _, account_id, record = operation
+                last_index = last_indexes.get(account_id, self.last_record_index(account_id))
+                if last_index is not None and record.record_index <= last_index:
+                    raise service_exceptions.AccountHistoryIntegrityError(
+                        f'Integrity error on account record update to account {account_id}'
+                    )
+
+                last_indexes[account_id] = record.record_index
+                time_at = record.time_at
+                if time_at is None:
+                    time_at = now
+                elif time_at.tzinfo is None:
+                    time_at = time_at.replace(tzinfo=timezone.utc)
+                operation = (
+                    RECORD_OP, account_id, AccountRecord(record.action, record.balance, record.record_index, time_at)
+                )
+
+            elif operation[0] == CARD_OP and expected_pin_hashes and operation[1] in expected_pin_hashes:
+                card = self.cards.get(operation[1])
+                if card is None or card[1] != expected_pin_hashes[operation[1]]:
+                    continue
+
+            operations_to_write.append(operation)
+
+        if not operations_to_write:
+            return None
+
+        end = self.ledger.append(b''.join(self._encode(operation) for operation in operations_to_write))
+        self._apply(operations_to_write)
+        return end
+
+    @staticmethod
+    def _encode(operation: Tuple) -> bytes:
+        if operation[0] == CARD_OP:
+            return encode_card(*operation[1:])
+        if operation[0] == ACCOUNT_OP:
+            return encode_account(*operation[1:])
+
+        return encode_record(*operation[1:])
+
+    def close(self):
+        self.ledger.close()
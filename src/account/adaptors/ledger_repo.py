@@ -0,0 +1,142 @@
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from account import instrumentation
+from account.adaptors.account_repo import AccountRepository
+from account.adaptors.ledger import CARD_OP, RECORD_OP, LedgerStore
+from account.entity import Account, AccountRecord, Card
+from account.service import service_exceptions
+
+
+class LedgerTransaction:
+    """Writes of one unit of work, stored by LedgerStore.commit in a single ledger entry."""
+
+    def __init__(self):
+        self.operations: List[Tuple] = []
+        self.expected_pin_hashes: Dict[int, str] = dict()
+        self.last_indexes: Dict[int, int] = dict()
+
+    def clear(self):
+        self.operations = []
+        self.expected_pin_hashes = dict()
+        self.last_indexes = dict()
+
+
+class LedgerAccountRepo(AccountRepository):
+    """AccountRepository on a LedgerStore.
+
+    Without a transaction every write is committed right away, like DjangoAccountRepo in
+    autocommit mode. Inside LedgerUnitOfWork writes are collected and stored on commit.
+    """
+
+    def __init__(self, store: LedgerStore, ledger_transaction: Optional[LedgerTransaction] = None):
+        self.store = store
+        self.ledger_transaction = ledger_transaction
+
+    @instrumentation.timed('ledger_repo.get_card')
+    def get_card(self, card_num: int) -> Optional[Card]:
+        self.store.check()
+        card = self.store.cards.get(card_num)
+        if card is None:
+            return None
+
+        user_id, pin_hash = card
+        return Card(card_num=card_num, user_id=user_id, pin_salt_hash=pin_hash)
+
+    @instrumentation.timed('ledger_repo.update_card_pin_hash')
+    def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        card = self.store.cards.get(card_num)
+        if card is None:
+            return
+
+        expected_pin_hashes = dict()
+        if previous_pin_hash is not None:
+            expected_pin_hashes[card_num] = previous_pin_hash
+
+        self._write([(CARD_OP, card_num, card[0], pin_hash)], expected_pin_hashes)
+
+    @instrumentation.timed('ledger_repo.get_user_accounts')
+    def get_user_accounts(self, user_id: int) -> List[Account]:
+        return [self._to_account(account_id) for account_id in self.store.user_accounts.get(user_id, ())]
+
+    @instrumentation.timed('ledger_repo.get_user_account')
+    def get_user_account(self, user_id: int, account_id: int) -> Optional[Account]:
+        account = self.store.accounts.get(account_id)
+        if account is None or account[0] != user_id:
+            return None
+
+        return self._to_account(account_id)
+
+    @instrumentation.timed('ledger_repo.get_user_accounts_by_id')
+    def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        accounts = dict()
+        for account_id in account_ids:
+            account = self.get_user_account(user_id, account_id)
+            if account is not None:
+                accounts[account_id] = account
+
+        return accounts
+
+    @instrumentation.timed('ledger_repo.iter_account_history')
+    def iter_account_history(
+            self, account_id: int,
+            since: Optional[datetime] = None, until: Optional[datetime] = None,
+            after_index: Optional[int] = None, page_size: int = 1000
+    ) -> Iterator[AccountRecord]:
+        for record in self.store.iter_history(account_id):
+            if after_index is not None and record.record_index <= after_index:
+                continue
+            if since is not None and record.time_at < since:
+                continue
+            if until is not None and record.time_at >= until:
+                continue
+
+            yield record
+
+    def update_account(self, account: Account):
+        self.update_accounts([account])
+
+    @instrumentation.timed('ledger_repo.update_accounts')
+    def update_accounts(self, accounts: List[Account]):
+        operations = []
+        last_indexes = dict()
+        for account in accounts:
+            account.new_histories.sort(key=lambda x: x.record_index)
+            for record in account.new_histories:
+                last_index = last_indexes.get(account.account_id)
+                if last_index is None and self.ledger_transaction is not None:
+                    last_index = self.ledger_transaction.last_indexes.get(account.account_id)
+                if last_index is None:
+                    last_index = self.store.last_record_index(account.account_id)
+
+                # fail on the update like the unique history index does, the commit checks again
+                if last_index is not None and record.record_index <= last_index:
+                    raise service_exceptions.AccountHistoryIntegrityError(
+                        f'Integrity error on account record update to account {account.account_id}'
+                    )
+
+                last_indexes[account.account_id] = record.record_index
+                operations.append((RECORD_OP, account.account_id, record))
+
+        self._write(operations)
+        if self.ledger_transaction is not None:
+            self.ledger_transaction.last_indexes.update(last_indexes)
+
+    def _write(self, operations: List[Tuple], expected_pin_hashes: Optional[Dict[int, str]] = None):
+        if self.ledger_transaction is None:
+            self.store.commit(operations, expected_pin_hashes)
+            return
+
+        self.ledger_transaction.operations.extend(operations)
+        if expected_pin_hashes:
+            self.ledger_transaction.expected_pin_hashes.update(expected_pin_hashes)
+
+    def _to_account(self, account_id: int) -> Account:
+        user_id, name = self.store.accounts[account_id]
+        last_record = self.store.last_record(account_id)
+        return Account(
+            account_id=account_id,
+            user_id=user_id,
+            name=name,
+            histories=[last_record] if last_record is not None else []
+        )
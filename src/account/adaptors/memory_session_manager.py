@@ -0,0 +1,105 @@
+import heapq
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from account import instrumentation
+from account.adaptors.session_manager import SESSION_EXPIRATION_SECONDS, SessionManager
+
+
+class InMemorySessionManager(SessionManager):
+    """Sessions of a single process, with the semantics of RedisSessionManager.
+
+    Expiry times are kept in a heap next to the sessions. Every call first removes the sessions
+    whose time passed, so memory is bounded by the sessions alive. An extension pushes a new
+    heap entry and leaves the old one behind, it is skipped when popped, and the heap is
+    rebuilt once such entries outnumber the sessions.
+    """
+
+    def __init__(
+            self,
+            session_exp_seconds: int = SESSION_EXPIRATION_SECONDS,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.session_exp_seconds = session_exp_seconds
+        self.clock = clock
+        self._sessions: Dict[int, Tuple[str, float]] = dict()
+        self._expirations: List[Tuple[float, int]] = []
+        self._lock = threading.Lock()
+        self.expired = 0
+
+    def _expire(self, now: float):
+        expirations = self._expirations
+        while expirations and expirations[0][0] <= now:
+            expires_at, user_id = heapq.heappop(expirations)
+            session = self._sessions.get(user_id)
+            if session is not None and session[1] == expires_at:
+                del self._sessions[user_id]
+                self.expired += 1
+
+    def _push(self, user_id: int, expires_at: float):
+        heapq.heappush(self._expirations, (expires_at, user_id))
+        if len(self._expirations) > 2 * len(self._sessions) + 1024:
+            self._expirations = [(expires_at, user_id) for user_id, (_, expires_at) in self._sessions.items()]
+            heapq.heapify(self._expirations)
+
+    def _get(self, user_id: int) -> Optional[str]:
+        now = self.clock()
+        self._expire(now)
+        session = self._sessions.get(user_id)
+        return session[0] if session is not None else None
+
+    def _extend(self, user_id: int, now: float):
+        session = self._sessions.get(user_id)
+        if session is None:
+            return
+
+        expires_at = now + self.session_exp_seconds
+        self._sessions[user_id] = (session[0], expires_at)
+        self._push(user_id, expires_at)
+
+    @instrumentation.timed('session_memory.set_session')
+    def set_session(self, user_id: int) -> str:
+        session_key = str(uuid4())
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            expires_at = now + self.session_exp_seconds
+            self._sessions[user_id] = (session_key, expires_at)
+            self._push(user_id, expires_at)
+
+        return session_key
+
+    @instrumentation.timed('session_memory.validate_user_session')
+    def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        with self._lock:
+            return self._get(user_id) == session_key
+
+    @instrumentation.timed('session_memory.extend_session')
+    def extend_session(self, user_id: int):
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            self._extend(user_id, now)
+
+    @instrumentation.timed('session_memory.validate_and_extend')
+    def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        with self._lock:
+            if self._get(user_id) != session_key:
+                return False
+
+            self._extend(user_id, self.clock())
+            return True
+
+    @instrumentation.timed('session_memory.extend_sessions')
+    def extend_sessions(self, user_ids: Iterable[int]):
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            for user_id in user_ids:
+                self._extend(user_id, now)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sessions=len(self._sessions), heap=len(self._expirations), expired=self.expired)
@@ -0,0 +1,204 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from account import instrumentation
+from account.adaptors.session_manager import SessionManager
+
+_KEYSPACE_CHANNEL = re.compile(r'^__keyspace@\d+__:(\d+)$')
+
+
+class NearCacheSessionManager(SessionManager):
+    """In-process cache of validated sessions in front of another SessionManager.
+
+    A session validated by the backend within the last ``staleness_seconds`` is validated
+    locally, so a logout or a login on another terminal is noticed after at most that long,
+    or right away when keyspace notifications are enabled. Extensions of locally validated
+    sessions are collected and sent to the backend in batches, at the latest after
+    ``flush_interval`` seconds or once ``max_pending`` users wait for one.
+    """
+
+    def __init__(
+            self,
+            backend: SessionManager,
+            staleness_seconds: Optional[float] = None,
+            flush_interval: float = 1.0,
+            max_pending: int = 256,
+            max_size: int = 100000,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        if staleness_seconds is None:
+            staleness_seconds = float(os.getenv('SESSION_CACHE_STALENESS_SECONDS', 1))
+
+        self.backend = backend
+        self.staleness_seconds = staleness_seconds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._sessions: Dict[int, Tuple[str, float]] = dict()
+        self._pending_extensions: Set[int] = set()
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._listener = None
+
+    def _cached(self, user_id: int, session_key: str) -> bool:
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is not None and entry[0] == session_key and self.clock() - entry[1] < self.staleness_seconds:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+    def _remember(self, user_id: int, session_key: str):
+        with self._lock:
+            if len(self._sessions) >= self.max_size and user_id not in self._sessions:
+                # entries are only trusted for the staleness bound, dropping any of them is safe
+                self._sessions.pop(next(iter(self._sessions)))
+
+            self._sessions[user_id] = (session_key, self.clock())
+
+    def _forget(self, user_id: int, session_key: str):
+        # a rejected key says nothing about another cached key of the user or its pending extension
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is not None and entry[0] == session_key:
+                del self._sessions[user_id]
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+            self._pending_extensions.discard(user_id)
+
+    @instrumentation.timed('session_cache.set_session')
+    def set_session(self, user_id: int) -> str:
+        session_key = self.backend.set_session(user_id)
+        with self._lock:
+            self._pending_extensions.discard(user_id)
+
+        self._remember(user_id, session_key)
+        return session_key
+
+    @instrumentation.timed('session_cache.validate_user_session')
+    def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        if self._cached(user_id, session_key):
+            return True
+
+        if not self.backend.validate_user_session(user_id, session_key):
+            self._forget(user_id, session_key)
+            return False
+
+        self._remember(user_id, session_key)
+        return True
+
+    def extend_session(self, user_id: int):
+        with self._lock:
+            self._pending_extensions.add(user_id)
+
+        try:
+            self.flush(force=False)
+        except Exception:
+            # a failed batch stays pending, the session itself was validated
+            pass
+
+    @instrumentation.timed('session_cache.validate_and_extend')
+    def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        if self._cached(user_id, session_key):
+            self.extend_session(user_id)
+            return True
+
+        # the backend validates and extends in one call, nothing needs to be queued
+        if not self.backend.validate_and_extend(user_id, session_key):
+            self._forget(user_id, session_key)
+            return False
+
+        self._remember(user_id, session_key)
+        return True
+
+    def flush(self, force: bool = True):
+        """Sends pending extensions to the backend, when forced or when a batch is due."""
+        with self._lock:
+            due = self._pending_extensions and (
+                force or len(self._pending_extensions) >= self.max_pending
+                or self.clock() - self._last_flush >= self.flush_interval
+            )
+            if not due:
+                return
+
+            user_ids = self._pending_extensions
+            self._pending_extensions = set()
+            self._last_flush = self.clock()
+
+        with self._flush_lock:
+            try:
+                self.backend.extend_sessions(user_ids)
+            except Exception:
+                with self._lock:
+                    self._pending_extensions.update(user_ids)
+                raise
+
+    def start_flusher(self) -> threading.Event:
+        """Flushes pending extensions every flush_interval seconds until the returned event is set."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception:
+                    # the extensions stay pending and are sent with the next batch
+                    pass
+
+            self.flush()
+
+        threading.Thread(target=run, name='atm-session-flush', daemon=True).start()
+        return stop
+
+    def handle_keyspace_event(self, message: dict):
+        channel = message.get('channel')
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+
+        event = message.get('data')
+        if isinstance(event, bytes):
+            event = event.decode()
+
+        # extensions, including the batched ones of this cache, do not change the session key
+        if event == 'expire':
+            return
+
+        match = _KEYSPACE_CHANNEL.match(channel or '')
+        if match:
+            self.invalidate(int(match.group(1)))
+
+    def start_invalidation_listener(self, redis_db: int = 0, sleep_time: float = 0.1):
+        """Drops cached sessions as soon as Redis changes their key.
+
+        Requires a Redis backend and keyspace notifications for generic and string commands
+        and expirations (``notify-keyspace-events Kg$x``).
+        """
+        pubsub = self.backend.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{f'__keyspace@{redis_db}__:*': self.handle_keyspace_event})
+        self._listener = pubsub.run_in_thread(sleep_time=sleep_time, daemon=True)
+        return self._listener
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                size=len(self._sessions), hits=self.hits, misses=self.misses,
+                pending_extensions=len(self._pending_extensions)
+            )
@@ -0,0 +1,80 @@
+import abc
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, Type
+
+from account import instrumentation
+from account.entity import Card
+from account.pin_hash import PinHasher
+from account.service import service_exceptions
+
+
+class PinVerifier(metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    def verify(self, card: Card, pin: str) -> bool:
+        raise NotImplementedError
+
+    @instrumentation.timed('pin.hash')
+    def make_pin_hash(self, pin: str, hasher: PinHasher) -> str:
+        return Card.make_pin_hash(pin, hasher)
+
+    def shutdown(self):
+        pass
+
+
+class InlinePinVerifier(PinVerifier):
+
+    @instrumentation.timed('pin.verify')
+    def verify(self, card: Card, pin: str) -> bool:
+        return card.validate_pin(pin)
+
+
+class ProcessPoolPinVerifier(PinVerifier):
+    """Runs the pin key derivation on a pool of worker processes.
+
+    At most ``max_pending`` verifications are queued or running at once, callers beyond that
+    wait up to ``wait_timeout`` seconds for a free slot and get ``PinVerificationBusy`` otherwise.
+    """
+
+    def __init__(
+            self,
+            max_workers: Optional[int] = None,
+            max_pending: Optional[int] = None,
+            wait_timeout: Optional[float] = None,
+            executor_cls: Type[Executor] = ProcessPoolExecutor
+    ):
+        if max_workers is None:
+            max_workers = int(os.getenv('PIN_VERIFIER_WORKERS', os.cpu_count() or 1))
+
+        if max_pending is None:
+            max_pending = int(os.getenv('PIN_VERIFIER_MAX_PENDING', max_workers * 4))
+
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.wait_timeout = wait_timeout
+        self.executor = executor_cls(max_workers=max_workers)
+        self._pending_slots = threading.BoundedSemaphore(max_pending)
+
+    @instrumentation.timed('pin.verify')
+    def verify(self, card: Card, pin: str) -> bool:
+        return self._run(Card.check_pin, card.pin_salt_hash, pin)
+
+    @instrumentation.timed('pin.hash')
+    def make_pin_hash(self, pin: str, hasher: PinHasher) -> str:
+        return self._run(Card.make_pin_hash, pin, hasher)
+
+    def _run(self, fn, *args):
+        if not self._pending_slots.acquire(timeout=self.wait_timeout):
+            raise service_exceptions.PinVerificationBusy(
+                f'more than {self.max_pending} pin verifications are pending'
+            )
+
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self._pending_slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown()
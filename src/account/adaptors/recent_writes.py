@@ -0,0 +1,83 @@
+import threading
+from typing import Dict, Iterable, Optional, Type
+
+from django.conf import settings
+from redis.client import Redis
+from redis.connection import ConnectionPool
+from redis.exceptions import RedisError
+
+from account.adaptors.session_manager import connect_redis
+
+RECENT_WRITE_KEY_PREFIX = 'recent_write:'
+
+
+class RecentWrites:
+    """Marks users that wrote within the last window_seconds in Redis, next to their sessions.
+
+    Reads for those users go to the primary so a user never reads a replica that has not
+    replayed their own deposit or withdrawal yet. The marks are shared by every worker and
+    expire on their own. When Redis can not be reached every user counts as recent, so reads
+    fall back to the primary instead of possibly stale replicas.
+    """
+
+    def __init__(
+            self,
+            redis_host: Optional[str] = None,
+            redis_port: Optional[int] = None,
+            window_seconds: Optional[float] = None,
+            redis_cls: Type[Redis] = Redis,
+            connection_pool: Optional[ConnectionPool] = None
+    ):
+        self.redis = connect_redis(redis_host, redis_port, redis_cls, connection_pool)
+        self._window_seconds = window_seconds
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def window_seconds(self) -> float:
+        if self._window_seconds is None:
+            return settings.REPLICA_FRESHNESS_SECONDS
+
+        return self._window_seconds
+
+    def record(self, user_ids: Iterable[int]):
+        window_ms = max(1, int(self.window_seconds * 1000))
+        pipeline = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.set(f'{RECENT_WRITE_KEY_PREFIX}{user_id}', 1, px=window_ms)
+
+        try:
+            pipeline.execute()
+        except RedisError:
+            # the write is already committed, failing its caller would report it as lost
+            self._count_failure()
+
+    def is_recent(self, user_id: int) -> bool:
+        try:
+            return bool(self.redis.exists(f'{RECENT_WRITE_KEY_PREFIX}{user_id}'))
+        except RedisError:
+            self._count_failure()
+            return True
+
+    def _count_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(failures=self.failures)
+
+
+_recent_writes: Optional[RecentWrites] = None
+
+
+def get_recent_writes() -> Optional[RecentWrites]:
+    """Returns the shared RecentWrites, or None when no REPLICA_DATABASE is configured and nothing needs marking."""
+    global _recent_writes
+    if settings.REPLICA_DATABASE is None:
+        return None
+
+    if _recent_writes is None:
+        _recent_writes = RecentWrites()
+
+    return _recent_writes
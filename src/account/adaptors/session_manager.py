@@ -1,12 +1,123 @@
 import abc
 import os
-from typing import Optional, Type
+import threading
+from typing import Dict, Iterable, Optional, Type
 from uuid import uuid4
 
 from redis.client import Redis
+from redis.connection import ConnectionPool
+
+from account import instrumentation
 
 SESSION_EXPIRATION_SECONDS = 120
 
+# extends the session only if the stored key matches, in one round trip and without a window
+# in which the key can expire between the check and the extension
+VALIDATE_AND_EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_connection_pools: Dict[tuple, ConnectionPool] = dict()
+_connection_pools_lock = threading.Lock()
+
+
+def _env_number(name: str, cast, default=None):
+    value = os.getenv(name)
+    if value is None:
+        return default
+
+    return cast(value)
+
+
+def get_connection_pool(
+        redis_host: Optional[str] = None,
+        redis_port: Optional[int] = None,
+        redis_db: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        socket_timeout: Optional[float] = None,
+        socket_connect_timeout: Optional[float] = None,
+        health_check_interval: Optional[int] = None,
+        retry_on_timeout: bool = False,
+        **connection_kwargs
+) -> ConnectionPool:
+    """Returns the process-wide connection pool for the given configuration, creating it on first use.
+
+    Unset options are read from the REDIS_* environment variables.
+    """
+    if redis_host is None:
+        redis_host = os.getenv('REDIS_HOST')
+    if redis_port is None:
+        redis_port = _env_number('REDIS_PORT', int, 6379)
+    if redis_db is None:
+        redis_db = _env_number('REDIS_DB', int, 0)
+    if max_connections is None:
+        max_connections = _env_number('REDIS_MAX_CONNECTIONS', int)
+    if socket_timeout is None:
+        socket_timeout = _env_number('REDIS_SOCKET_TIMEOUT', float)
+    if socket_connect_timeout is None:
+        socket_connect_timeout = _env_number('REDIS_SOCKET_CONNECT_TIMEOUT', float)
+    if health_check_interval is None:
+        health_check_interval = _env_number('REDIS_HEALTH_CHECK_INTERVAL', int, 0)
+
+    options = dict(
+        host=redis_host,
+        port=redis_port,
+        db=redis_db,
+        max_connections=max_connections,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=socket_connect_timeout,
+        health_check_interval=health_check_interval,
+        retry_on_timeout=retry_on_timeout,
+        **connection_kwargs
+    )
+    pool_key = tuple(sorted(options.items()))
+    with _connection_pools_lock:
+        if pool_key not in _connection_pools:
+            _connection_pools[pool_key] = ConnectionPool(**options)
+
+        return _connection_pools[pool_key]
+
+
+def get_pool_stats(pool: ConnectionPool) -> Dict[str, Optional[int]]:
+    return dict(
+        max_connections=pool.max_connections,
+        created=pool._created_connections,
+        available=len(pool._available_connections),
+        in_use=len(pool._in_use_connections),
+    )
+
+
+def disconnect_connection_pools():
+    with _connection_pools_lock:
+        for pool in _connection_pools.values():
+            pool.disconnect()
+
+        _connection_pools.clear()
+
+
+def connect_redis(
+        redis_host: Optional[str] = None,
+        redis_port: Optional[int] = None,
+        redis_cls: Type[Redis] = Redis,
+        connection_pool: Optional[ConnectionPool] = None
+) -> Redis:
+    if connection_pool is None and redis_cls is Redis:
+        connection_pool = get_connection_pool(redis_host, redis_port)
+
+    if connection_pool is not None:
+        return redis_cls(connection_pool=connection_pool)
+
+    if redis_host is None:
+        redis_host = os.getenv('REDIS_HOST')
+
+    if redis_port is not None:
+        return redis_cls(host=redis_host, port=redis_port)
+
+    return redis_cls(host=redis_host)
+
 
 class SessionManager(metaclass=abc.ABCMeta):
 
@@ -22,6 +133,17 @@ class SessionManager(metaclass=abc.ABCMeta):
     def extend_session(self, user_id: int):
         raise NotImplementedError
 
+    def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        if not self.validate_user_session(user_id, session_key):
+            return False
+
+        self.extend_session(user_id)
+        return True
+
+    def extend_sessions(self, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            self.extend_session(user_id)
+
 
 class RedisSessionManager(SessionManager):
     redis: Redis
@@ -31,23 +153,20 @@ class RedisSessionManager(SessionManager):
             redis_host: Optional[str] = None,
             redis_port: Optional[int] = None,
             session_exp_seconds: int =SESSION_EXPIRATION_SECONDS,
-            redis_cls: Type[Redis] = Redis
+            redis_cls: Type[Redis] = Redis,
+            connection_pool: Optional[ConnectionPool] = None
     ):
-        if redis_host is None:
-            redis_host = os.getenv('REDIS_HOST')
-
-        if redis_port is not None:
-            self.redis = redis_cls(host=redis_host, port=redis_port)
-        else:
-            self.redis = redis_cls(host=redis_host)
-
+        self.redis = connect_redis(redis_host, redis_port, redis_cls, connection_pool)
         self.session_exp_seconds = session_exp_seconds
+        self._validate_and_extend = self.redis.register_script(VALIDATE_AND_EXTEND_SCRIPT)
 
+    @instrumentation.timed('session.set_session')
     def set_session(self, user_id: int) -> str:
         session_key = str(uuid4())
         self.redis.set(str(user_id), session_key, ex=self.session_exp_seconds)
         return session_key
 
+    @instrumentation.timed('session.validate_user_session')
     def validate_user_session(self, user_id: int, session_key: str) -> bool:
         saved_key = self.redis.get(str(user_id))
         if saved_key:
@@ -55,5 +174,18 @@ class RedisSessionManager(SessionManager):
 
         return False
 
+    @instrumentation.timed('session.extend_session')
     def extend_session(self, user_id: int) -> bool:
-        self.redis.expire(str(user_id), SESSION_EXPIRATION_SECONDS)
\ No newline at end of file
+        self.redis.expire(str(user_id), self.session_exp_seconds)
+
+    @instrumentation.timed('session.validate_and_extend')
+    def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        return bool(self._validate_and_extend(keys=[str(user_id)], args=[session_key, self.session_exp_seconds]))
+
+    @instrumentation.timed('session.extend_sessions')
+    def extend_sessions(self, user_ids: Iterable[int]):
+        pipeline = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.expire(str(user_id), self.session_exp_seconds)
+
+        pipeline.execute()
@@ -0,0 +1,228 @@
+import bisect
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from redis.client import Redis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from account import instrumentation
+from account.adaptors.session_manager import (
+    SESSION_EXPIRATION_SECONDS, RedisSessionManager, SessionManager, get_connection_pool
+)
+
+_NODE_ERRORS = (ConnectionError, TimeoutError)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with ``vnodes`` points per node.
+
+    Adding or removing a node only moves the keys between its points and their predecessors,
+    about 1/N of all keys.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = dict()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        for replica in range(self.vnodes):
+            point = _hash(f'{node}#{replica}')
+            if point in self._owners:
+                continue
+
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str):
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owners.values()))
+
+    def node_for(self, key: str) -> Optional[str]:
+        return next(self.nodes_for(key), None)
+
+    def nodes_for(self, key: str) -> Iterator[str]:
+        """Yields every node once, starting with the owner of key and going clockwise."""
+        if not self._points:
+            return
+
+        start = bisect.bisect(self._points, _hash(key))
+        seen = set()
+        for position in range(start, start + len(self._points)):
+            node = self._owners[self._points[position % len(self._points)]]
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.partition(':')
+    return host, int(port) if port else 6379
+
+
+class ShardedRedisSessionManager(SessionManager):
+    """Spreads sessions over several Redis nodes, ``host:port`` separated by commas in REDIS_NODES.
+
+    Each user id belongs to the first healthy node clockwise from it on a HashRing. A node that
+    fails a command is marked down and its users are served by the next node on the ring until
+    a health check sees it answer again. Sessions are not copied between nodes, users whose
+    node changed, by a failover or by add_node and remove_node, log in again.
+
+    Connecting to and reading from a node time out after ``node_timeout`` seconds, so a node that
+    stopped answering is failed over instead of blocking its callers.
+    """
+
+    def __init__(
+            self,
+            nodes: Optional[Iterable[str]] = None,
+            session_exp_seconds: int = SESSION_EXPIRATION_SECONDS,
+            redis_cls: Type[Redis] = Redis,
+            vnodes: Optional[int] = None,
+            health_check_interval: Optional[float] = None,
+            node_timeout: Optional[float] = None,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        if nodes is None:
+            nodes = [node.strip() for node in os.getenv('REDIS_NODES', '').split(',') if node.strip()]
+        if vnodes is None:
+            vnodes = int(os.getenv('REDIS_RING_VNODES', 160))
+        if health_check_interval is None:
+            health_check_interval = float(os.getenv('REDIS_NODE_HEALTH_CHECK_INTERVAL', 5))
+        if node_timeout is None:
+            node_timeout = float(os.getenv('REDIS_NODE_TIMEOUT', 0.5))
+
+        self.session_exp_seconds = session_exp_seconds
+        self.redis_cls = redis_cls
+        self.health_check_interval = health_check_interval
+        self.node_timeout = node_timeout
+        self.clock = clock
+        self.ring = HashRing(vnodes=vnodes)
+        self.managers: Dict[str, RedisSessionManager] = dict()
+        self.failovers = 0
+        self._down: Dict[str, float] = dict()
+        self._lock = threading.Lock()
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, address: str):
+        host, port = _parse_address(address)
+        connection_pool = None
+        if self.redis_cls is Redis:
+            connection_pool = get_connection_pool(
+                host, port, socket_timeout=self.node_timeout, socket_connect_timeout=self.node_timeout
+            )
+
+        manager = RedisSessionManager(
+            redis_host=host, redis_port=port, session_exp_seconds=self.session_exp_seconds,
+            redis_cls=self.redis_cls, connection_pool=connection_pool
+        )
+        with self._lock:
+            self.managers[address] = manager
+            self.ring.add(address)
+
+    def remove_node(self, address: str):
+        with self._lock:
+            self.ring.remove(address)
+            self.managers.pop(address, None)
+            self._down.pop(address, None)
+
+    def _mark_down(self, node: str):
+        with self._lock:
+            if node in self.managers and node not in self._down:
+                self._down[node] = self.clock()
+                self.failovers += 1
+
+    def _is_up(self, node: str) -> bool:
+        with self._lock:
+            down_since = self._down.get(node)
+            if down_since is None:
+                return True
+
+            due = self.clock() - down_since >= self.health_check_interval
+            if due:
+                # this caller checks the node, the others keep skipping it meanwhile
+                self._down[node] = self.clock()
+
+        return due and self.check_node(node)
+
+    def check_node(self, node: str) -> bool:
+        manager = self.managers.get(node)
+        if manager is None:
+            return False
+
+        try:
+            manager.redis.ping()
+        except _NODE_ERRORS:
+            with self._lock:
+                self._down.setdefault(node, self.clock())
+            return False
+
+        with self._lock:
+            self._down.pop(node, None)
+        return True
+
+    def check_health(self) -> Dict[str, bool]:
+        return {node: self.check_node(node) for node in list(self.managers)}
+
+    def node_for(self, user_id: int) -> str:
+        for node in self.ring.nodes_for(str(user_id)):
+            if self._is_up(node):
+                return node
+
+        raise ConnectionError('no Redis node of the session ring is available')
+
+    def _call(self, user_id: int, method: str, *args):
+        while True:
+            node = self.node_for(user_id)
+            try:
+                return getattr(self.managers[node], method)(user_id, *args)
+            except _NODE_ERRORS:
+                self._mark_down(node)
+
+    @instrumentation.timed('session_ring.set_session')
+    def set_session(self, user_id: int) -> str:
+        return self._call(user_id, 'set_session')
+
+    @instrumentation.timed('session_ring.validate_user_session')
+    def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        return self._call(user_id, 'validate_user_session', session_key)
+
+    @instrumentation.timed('session_ring.extend_session')
+    def extend_session(self, user_id: int):
+        self._call(user_id, 'extend_session')
+
+    @instrumentation.timed('session_ring.validate_and_extend')
+    def validate_and_extend(self, user_id: int, session_key: str) -> bool:
+        return self._call(user_id, 'validate_and_extend', session_key)
+
+    @instrumentation.timed('session_ring.extend_sessions')
+    def extend_sessions(self, user_ids: Iterable[int]):
+        by_node: Dict[str, List[int]] = dict()
+        for user_id in user_ids:
+            by_node.setdefault(self.node_for(user_id), []).append(user_id)
+
+        for node, node_user_ids in by_node.items():
+            try:
+                self.managers[node].extend_sessions(node_user_ids)
+            except _NODE_ERRORS:
+                # the sessions of a failed node are gone for its users anyway
+                self._mark_down(node)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return dict(
+                nodes=len(self.managers), down=sorted(self._down), failovers=self.failovers
+            )
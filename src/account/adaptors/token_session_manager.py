@@ -0,0 +1,231 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Type
+
+from redis.client import Redis
+from redis.connection import ConnectionPool
+
+from account import instrumentation
+from account.adaptors.session_manager import SESSION_EXPIRATION_SECONDS, SessionManager, connect_redis
+
+LOGINS_KEY = 'session_tokens:logins'
+EXTENSIONS_KEY = 'session_tokens:extensions'
+REVOKED_KEY = 'session_tokens:revoked'
+
+# drops logins issued before ARGV[1] unless the user's session was extended past ARGV[2], an
+# extension is stored per user and would make the tokens the login superseded valid again
+PRUNE_LOGINS_SCRIPT = """
+local removed = 0
+for _, user_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])) do
+    local deadline = redis.call('ZSCORE', KEYS[2], user_id)
+    if not deadline or tonumber(deadline) <= tonumber(ARGV[2]) then
+        removed = removed + redis.call('ZREM', KEYS[1], user_id)
+    end
+end
+return removed
+"""
+
+
+class SessionToken(NamedTuple):
+    user_id: int
+    issued_ms: int
+    expires_ms: int
+    token_id: str
+
+
+class SignedTokenSessionManager(SessionManager):
+    """Issues HMAC-signed session tokens that are validated without a Redis round trip.
+
+    A token is ``<user_id>.<issued ms>.<expires ms>.<nonce>.<signature>``. Redis only holds
+    what can not be derived from the token, in three sorted sets:
+
+    * logins: user id to the issue time of the latest token, older tokens of the user are
+      superseded like a re-login overwrites the key of RedisSessionManager
+    * extensions: user id to the time the session was extended to, past the token's expiry
+    * revoked: ids of single revoked tokens
+
+    Every process keeps a copy of the recent entries and reads the changes at most every
+    ``refresh_seconds``, so a login elsewhere or a revocation takes up to that long to be
+    noticed. Entries are dropped once no token they could affect is still valid, a login is kept
+    until the session extensions of its user ended as well.
+    """
+
+    def __init__(
+            self,
+            redis_host: Optional[str] = None,
+            redis_port: Optional[int] = None,
+            session_exp_seconds: int = SESSION_EXPIRATION_SECONDS,
+            redis_cls: Type[Redis] = Redis,
+            connection_pool: Optional[ConnectionPool] = None,
+            secret: Optional[str] = None,
+            refresh_seconds: Optional[float] = None,
+            extend_granularity_seconds: float = 1.0,
+            clock_skew_seconds: float = 5.0,
+            clock: Callable[[], float] = time.time
+    ):
+        if secret is None:
+            secret = os.getenv('SESSION_TOKEN_SECRET')
+        if not secret:
+            raise ValueError('SESSION_TOKEN_SECRET is required to sign session tokens')
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv('SESSION_TOKEN_REFRESH_SECONDS', 1))
+
+        self.redis = connect_redis(redis_host, redis_port, redis_cls, connection_pool)
+        self.session_exp_seconds = session_exp_seconds
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self._secret = secret.encode()
+        self._exp_ms = session_exp_seconds * 1000
+        self._granularity_ms = int(extend_granularity_seconds * 1000)
+        self._skew_ms = int(clock_skew_seconds * 1000)
+        self._logins: Dict[int, int] = dict()
+        self._extensions: Dict[int, int] = dict()
+        self._revoked: Dict[str, int] = dict()
+        self._refreshed_ms: Optional[int] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+        self._prune_logins = self.redis.register_script(PRUNE_LOGINS_SCRIPT)
+
+    def _now_ms(self) -> int:
+        return int(self.clock() * 1000)
+
+    def _sign(self, message: str) -> str:
+        return hmac.new(self._secret, message.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _parse(self, session_key: str) -> Optional[SessionToken]:
+        message, _, signature = session_key.rpartition('.')
+        try:
+            # compare_digest only takes ASCII strings, a forged key may hold anything
+            signed = hmac.compare_digest(self._sign(message).encode(), signature.encode())
+        except UnicodeEncodeError:
+            return None
+
+        if not signed:
+            return None
+
+        try:
+            user_id, issued_ms, expires_ms, _ = message.split('.')
+            return SessionToken(int(user_id), int(issued_ms), int(expires_ms), signature[:16])
+        except ValueError:
+            return None
+
+    @instrumentation.timed('session_token.set_session')
+    def set_session(self, user_id: int) -> str:
+        now = self._now_ms()
+        message = f'{user_id}.{now}.{now + self._exp_ms}.{secrets.token_hex(8)}'
+        self.redis.zadd(LOGINS_KEY, {str(user_id): now}, gt=True)
+        with self._lock:
+            self._logins[user_id] = max(now, self._logins.get(user_id, 0))
+            # the token itself is good until then, extensions are only stored past it
+            self._extensions[user_id] = now + self._exp_ms
+
+        return f'{message}.{self._sign(message)}'
+
+    @instrumentation.timed('session_token.validate_user_session')
+    def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        token = self._parse(session_key)
+        if token is None or token.user_id != user_id:
+            return False
+
+        now = self._now_ms()
+        self._refresh_if_due(now)
+        with self._lock:
+            if token.issued_ms < self._logins.get(user_id, 0) or token.token_id in self._revoked:
+                return False
+
+            return now < token.expires_ms or now < self._extensions.get(user_id, 0)
+
+    @instrumentation.timed('session_token.extend_session')
+    def extend_session(self, user_id: int):
+        deadline = self._now_ms() + self._exp_ms
+        with self._lock:
+            # extensions closer together than the granularity are not stored again
+            if deadline - self._extensions.get(user_id, 0) < self._granularity_ms:
+                return
+
+            self._extensions[user_id] = deadline
+
+        self.redis.zadd(EXTENSIONS_KEY, {str(user_id): deadline}, gt=True)
+
+    def revoke(self, session_key: str):
+        """Invalidates one token, as a logout of its session."""
+        token = self._parse(session_key)
+        if token is None:
+            return
+
+        now = self._now_ms()
+        self.redis.zadd(REVOKED_KEY, {token.token_id: now})
+        with self._lock:
+            self._revoked[token.token_id] = now
+
+    def revoke_user(self, user_id: int):
+        """Invalidates every token issued to the user so far."""
+        now = self._now_ms()
+        self.redis.zadd(LOGINS_KEY, {str(user_id): now + 1}, gt=True)
+        with self._lock:
+            self._logins[user_id] = max(now + 1, self._logins.get(user_id, 0))
+
+    def _refresh_if_due(self, now: int):
+        if self._refreshed_ms is not None and now - self._refreshed_ms < self.refresh_seconds * 1000:
+            return
+
+        # one caller refreshes, the others keep validating against the current copy
+        if self._refresh_lock.acquire(blocking=self._refreshed_ms is None):
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+
+    @instrumentation.timed('session_token.refresh')
+    def refresh(self):
+        """Reads the entries changed since the last refresh and drops the ones no longer needed."""
+        now = self._now_ms()
+        if self._refreshed_ms is None:
+            since = 0
+        else:
+            # overlaps the previous read by the clock skew between writers, reapplying is harmless
+            since = self._refreshed_ms - self._skew_ms
+
+        # a superseded or revoked token can be extended until the moment it stops being valid
+        keep_after = now - self._exp_ms - self._skew_ms
+        extended_after = now - self._skew_ms
+        pipeline = self.redis.pipeline(transaction=False)
+        self._prune_logins(keys=[LOGINS_KEY, EXTENSIONS_KEY], args=[keep_after, extended_after], client=pipeline)
+        pipeline.zremrangebyscore(REVOKED_KEY, '-inf', keep_after)
+        pipeline.zremrangebyscore(EXTENSIONS_KEY, '-inf', extended_after)
+        pipeline.zrangebyscore(LOGINS_KEY, f'({since}', '+inf', withscores=True)
+        pipeline.zrangebyscore(REVOKED_KEY, f'({since}', '+inf', withscores=True)
+        # an extension stored at time t ends at t + session expiration
+        pipeline.zrangebyscore(EXTENSIONS_KEY, f'({since + self._exp_ms}', '+inf', withscores=True)
+        _, _, _, logins, revoked, extensions = pipeline.execute()
+
+        with self._lock:
+            for user_id, issued_ms in logins:
+                user_id = int(user_id)
+                self._logins[user_id] = max(int(issued_ms), self._logins.get(user_id, 0))
+            for token_id, revoked_ms in revoked:
+                self._revoked[token_id.decode()] = int(revoked_ms)
+            for user_id, deadline in extensions:
+                user_id = int(user_id)
+                self._extensions[user_id] = max(int(deadline), self._extensions.get(user_id, 0))
+
+            self._logins = {
+                k: v for k, v in self._logins.items()
+                if v > keep_after or self._extensions.get(k, 0) > extended_after
+            }
+            self._revoked = {k: v for k, v in self._revoked.items() if v > keep_after}
+            self._extensions = {k: v for k, v in self._extensions.items() if v > extended_after}
+            self._refreshed_ms = now
+            self.refreshes += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                logins=len(self._logins), extensions=len(self._extensions), revoked=len(self._revoked),
+                refreshes=self.refreshes
+            )
@@ -1,7 +1,7 @@
-import hashlib
 from typing import List, Optional
 
-from account.value_objects import AccountRecord
+from account import pin_hash
+from account.value_objects import AccountRecord, AccountRecords
 from account.domain_exception import InvalidAmount, NegativeAccountBalanceException
 
 
@@ -12,33 +12,50 @@ class Card:
         self.pin_salt_hash = pin_salt_hash
 
     def validate_pin(self, pin: str):
-        salt = self.pin_salt_hash[:32]
-        pin_hash = self.pin_salt_hash[32:]
-        return pin_hash == self.hash_pin(pin, salt)
+        return self.check_pin(self.pin_salt_hash, pin)
+
+    def needs_rehash(self, hasher: Optional[pin_hash.PinHasher] = None) -> bool:
+        return pin_hash.needs_rehash(self.pin_salt_hash, hasher)
+
+    @staticmethod
+    def check_pin(pin_salt_hash: str, pin: str):
+        return pin_hash.verify_pin(pin, pin_salt_hash)
+
+    @staticmethod
+    def make_pin_hash(pin: str, hasher: Optional[pin_hash.PinHasher] = None) -> str:
+        if hasher is None:
+            hasher = pin_hash.get_default_hasher()
+
+        return hasher.encode(pin)
 
     @staticmethod
     def hash_pin(pin: str, salt: str):
-        return hashlib.pbkdf2_hmac('sha256', pin.encode(), salt.encode(), 100000).hex()
+        # hash part of the legacy "<32 char salt><hash>" layout
+        return pin_hash.Pbkdf2PinHasher(pin_hash.LEGACY_ITERATIONS).derive(pin, salt)
 
 
 class Account:
+    __slots__ = ('account_id', 'user_id', 'histories', 'new_histories', 'name', 'last_record_index')
+
     def __init__(self, account_id: int, user_id: int, name: str, histories: List[AccountRecord]):
         self.account_id = account_id
         self.user_id = user_id
-        self.histories = histories
-        self.histories.sort(key=lambda x: x.record_index)
+        self.histories = AccountRecords.from_records(histories)
         self.new_histories: List[AccountRecord] = []
         self.name = name
         self.last_record_index = 0
 
         if self.histories:
-            self.last_record_index = self.histories[-1].record_index
+            self.last_record_index = self.histories.last_record_index
 
     def get_balance(self) -> int:
+        if self.new_histories:
+            return self.new_histories[-1].balance
+
         if not self.histories:
             return 0
 
-        return self.histories[-1].balance
+        return self.histories.last_balance
 
     def withdraw(self, amount):
         if amount <= 0:
@@ -48,10 +65,7 @@ class Account:
         if balance < 0:
             raise NegativeAccountBalanceException(f'Not enough account blance to withdraw {amount}')
 
-        if self.new_histories:
-            new_record_index = self.new_histories[-1].record_index + 1
-        else:
-            new_record_index = self.histories[-1].record_index + 1
+        new_record_index = self._next_record_index()
 
         new_record = AccountRecord(
             action=AccountRecord.WITHDRAWAL,
@@ -66,10 +80,7 @@ class Account:
             raise InvalidAmount('Deposit amount must be lareger than zero')
 
         balance = self.get_balance() + amount
-        if self.new_histories:
-            new_record_index = self.new_histories[-1].record_index + 1
-        else:
-            new_record_index = self.histories[-1].record_index + 1
+        new_record_index = self._next_record_index()
 
         new_record = AccountRecord(
             action=AccountRecord.WITHDRAWAL,
@@ -79,7 +90,16 @@ class Account:
         )
         self.new_histories.append(new_record)
 
+    def _next_record_index(self) -> int:
+        if self.new_histories:
+            return self.new_histories[-1].record_index + 1
+
+        if self.histories:
+            return self.histories.last_record_index + 1
+
+        return 1
+
     def commit_new_histories(self):
-        self.histories = self.histories + self.new_histories
+        self.histories.extend(self.new_histories)
         self.new_histories = []
 
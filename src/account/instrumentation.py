@@ -0,0 +1,254 @@
+"""Per-phase latency histograms for units of work, repositories, session managers and pin checks.
+
+Instrumentation is off by default, a disabled ``timed`` wrapper only checks one module flag
+before calling through. ``enable`` turns recording on and installs the exporters that
+``export`` (or the export thread) feeds with histogram snapshots.
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+_enabled = False
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.bucket_counts[bucket] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given quantile."""
+        return _quantile_bound(self.snapshot(), fraction)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(
+                buckets=self.buckets,
+                bucket_counts=list(self.bucket_counts),
+                count=self.count,
+                sum=self.sum,
+            )
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = dict()
+        self._lock = threading.Lock()
+
+    def histogram(self, phase: str) -> Histogram:
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(phase, Histogram())
+
+        return histogram
+
+    def observe(self, phase: str, seconds: float):
+        self.histogram(phase).observe(seconds)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            histograms = dict(self.histograms)
+
+        return {phase: histogram.snapshot() for phase, histogram in sorted(histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+class Exporter:
+    def export(self, snapshot: Dict[str, Dict]):
+        raise NotImplementedError
+
+
+class LogExporter(Exporter):
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger('account.instrumentation')
+        self.level = level
+
+    def export(self, snapshot: Dict[str, Dict]):
+        for phase, histogram in snapshot.items():
+            if not histogram['count']:
+                continue
+
+            mean_ms = histogram['sum'] / histogram['count'] * 1000
+            self.logger.log(
+                self.level, 'phase=%s count=%d mean_ms=%.3f p50_ms<=%s p99_ms<=%s',
+                phase, histogram['count'], mean_ms,
+                _format_ms(_quantile_bound(histogram, 0.5)), _format_ms(_quantile_bound(histogram, 0.99))
+            )
+
+
+class PrometheusFileExporter(Exporter):
+    """Writes the histograms in the Prometheus text format, e.g. for the node exporter textfile collector."""
+
+    def __init__(self, path: str, metric_name: str = 'atm_phase_duration_seconds'):
+        self.path = path
+        self.metric_name = metric_name
+
+    def export(self, snapshot: Dict[str, Dict]):
+        lines = [
+            f'# HELP {self.metric_name} Duration of ATM service phases.',
+            f'# TYPE {self.metric_name} histogram',
+        ]
+        for phase, histogram in snapshot.items():
+            cumulative = 0
+            for bound, bucket_count in zip(histogram['buckets'], histogram['bucket_counts']):
+                cumulative += bucket_count
+                lines.append(f'{self.metric_name}_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+
+            lines.append(f'{self.metric_name}_bucket{{phase="{phase}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{self.metric_name}_sum{{phase="{phase}"}} {histogram["sum"]}')
+            lines.append(f'{self.metric_name}_count{{phase="{phase}"}} {histogram["count"]}')
+
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as metric_file:
+            metric_file.write('\n'.join(lines) + '\n')
+
+        os.replace(temporary_path, self.path)
+
+
+class CallbackExporter(Exporter):
+    def __init__(self, callback: Callable[[Dict[str, Dict]], None]):
+        self.callback = callback
+
+    def export(self, snapshot: Dict[str, Dict]):
+        self.callback(snapshot)
+
+
+_exporters: List[Exporter] = []
+
+
+def enable(*exporters: Exporter):
+    global _enabled
+    _exporters[:] = exporters
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def export():
+    snapshot = registry.snapshot()
+    for exporter in _exporters:
+        exporter.export(snapshot)
+
+
+def start_export_thread(interval_seconds: float) -> threading.Event:
+    """Exports every interval_seconds until the returned event is set."""
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval_seconds):
+            export()
+
+    threading.Thread(target=run, name='atm-instrumentation-export', daemon=True).start()
+    return stopped
+
+
+def timed(phase: str):
+    """Records the duration of every call of the decorated function, coroutine or generator under phase."""
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await fn(*args, **kwargs)
+
+                started_at = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    registry.observe(phase, time.perf_counter() - started_at)
+
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from fn(*args, **kwargs))
+
+                # only the time spent producing items counts, not the caller's work between them
+                generator = fn(*args, **kwargs)
+                elapsed = 0.0
+                try:
+                    while True:
+                        started_at = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            elapsed += time.perf_counter() - started_at
+
+                        yield item
+                finally:
+                    generator.close()
+                    registry.observe(phase, elapsed)
+
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+
+            started_at = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe(phase, time.perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+def _quantile_bound(histogram: Dict, fraction: float) -> float:
+    if not histogram['count']:
+        return 0.0
+
+    rank = fraction * histogram['count']
+    seen = 0
+    for bound, bucket_count in zip(histogram['buckets'], histogram['bucket_counts']):
+        seen += bucket_count
+        if bucket_count and seen >= rank:
+            return bound
+
+    return float('inf')
+
+
+def _format_ms(seconds: float) -> str:
+    return f'{seconds * 1000:g}'
@@ -0,0 +1,183 @@
+import abc
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Optional
+
+LEGACY_SALT_LENGTH = 32
+LEGACY_ITERATIONS = 100000
+SEPARATOR = '$'
+MAX_SCRYPT_N = 2 ** 20
+
+
+class InvalidPinHash(ValueError):
+    pass
+
+
+class PinHasher(metaclass=abc.ABCMeta):
+    """Derives pin hashes stored as ``<algorithm>$<cost parameters...>$<salt>$<hash>``."""
+    algorithm: str
+
+    @abc.abstractmethod
+    def params(self) -> tuple:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def derive(self, pin: str, salt: str) -> str:
+        raise NotImplementedError
+
+    def encode(self, pin: str, salt: Optional[str] = None) -> str:
+        if salt is None:
+            salt = secrets.token_hex(16)
+
+        fields = [self.algorithm, *map(str, self.params()), salt, self.derive(pin, salt)]
+        return SEPARATOR.join(fields)
+
+    def verify(self, pin: str, encoded: str) -> bool:
+        *_, salt, pin_hash = encoded.split(SEPARATOR)
+        return hmac.compare_digest(pin_hash, self.derive(pin, salt))
+
+
+class Pbkdf2PinHasher(PinHasher):
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations: int = LEGACY_ITERATIONS):
+        self.iterations = iterations
+
+    def params(self) -> tuple:
+        return self.iterations,
+
+    def derive(self, pin: str, salt: str) -> str:
+        return hashlib.pbkdf2_hmac('sha256', pin.encode(), salt.encode(), self.iterations).hex()
+
+
+class ScryptPinHasher(PinHasher):
+    algorithm = 'scrypt'
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def params(self) -> tuple:
+        return self.n, self.r, self.p
+
+    def derive(self, pin: str, salt: str) -> str:
+        # scrypt needs 128 * r * n bytes, leave headroom over openssl's 32MB default
+        maxmem = 256 * self.r * self.n * self.p + 2 ** 20
+        return hashlib.scrypt(
+            pin.encode(), salt=salt.encode(), n=self.n, r=self.r, p=self.p, maxmem=maxmem, dklen=32
+        ).hex()
+
+
+HASHER_CLASSES = {
+    Pbkdf2PinHasher.algorithm: Pbkdf2PinHasher,
+    ScryptPinHasher.algorithm: ScryptPinHasher,
+}
+
+_default_hasher: Optional[PinHasher] = None
+
+
+def from_encoded(encoded: str) -> Optional[PinHasher]:
+    """Returns the hasher an encoded pin hash was made with, None for the legacy salt+hash layout."""
+    if SEPARATOR not in encoded:
+        return None
+
+    algorithm, *fields = encoded.split(SEPARATOR)
+    hasher_cls = HASHER_CLASSES.get(algorithm)
+    if hasher_cls is None or len(fields) < 2:
+        raise InvalidPinHash(f'stored pin hash has an unknown format {algorithm!r}')
+
+    try:
+        return hasher_cls(*(int(field) for field in fields[:-2]))
+    except (TypeError, ValueError) as error:
+        raise InvalidPinHash(f'stored pin hash has invalid {algorithm} parameters') from error
+
+
+def verify_pin(pin: str, encoded: str) -> bool:
+    hasher = from_encoded(encoded)
+    if hasher is None:
+        salt = encoded[:LEGACY_SALT_LENGTH]
+        pin_hash = encoded[LEGACY_SALT_LENGTH:]
+        return hmac.compare_digest(pin_hash, Pbkdf2PinHasher(LEGACY_ITERATIONS).derive(pin, salt))
+
+    return hasher.verify(pin, encoded)
+
+
+def needs_rehash(encoded: str, hasher: Optional[PinHasher] = None) -> bool:
+    if hasher is None:
+        hasher = get_default_hasher()
+
+    try:
+        current = from_encoded(encoded)
+    except InvalidPinHash:
+        return True
+
+    if current is None:
+        return True
+
+    return current.algorithm != hasher.algorithm or current.params() != hasher.params()
+
+
+def get_default_hasher() -> PinHasher:
+    global _default_hasher
+    if _default_hasher is None:
+        _default_hasher = hasher_from_env()
+
+    return _default_hasher
+
+
+def set_default_hasher(hasher: Optional[PinHasher]):
+    global _default_hasher
+    _default_hasher = hasher
+
+
+def hasher_from_env() -> PinHasher:
+    algorithm = os.getenv('PIN_KDF', Pbkdf2PinHasher.algorithm)
+    if algorithm == ScryptPinHasher.algorithm:
+        return ScryptPinHasher(
+            n=int(os.getenv('PIN_KDF_SCRYPT_N', 2 ** 14)),
+            r=int(os.getenv('PIN_KDF_SCRYPT_R', 8)),
+            p=int(os.getenv('PIN_KDF_SCRYPT_P', 1)),
+        )
+
+    if algorithm == Pbkdf2PinHasher.algorithm:
+        return Pbkdf2PinHasher(iterations=int(os.getenv('PIN_KDF_ITERATIONS', LEGACY_ITERATIONS)))
+
+    raise ValueError(f'unknown pin kdf {algorithm}')
+
+
+def measure(hasher: PinHasher, rounds: int = 3) -> float:
+    """Best-of-n wall time in seconds of one pin verification with the given hasher."""
+    best = None
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        hasher.derive('0000', 'x' * LEGACY_SALT_LENGTH)
+        elapsed = time.perf_counter() - started_at
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def calibrate(algorithm: str, target_seconds: float) -> PinHasher:
+    """Picks the largest cost for which one verification stays within target_seconds on this host."""
+    if algorithm == Pbkdf2PinHasher.algorithm:
+        probe = Pbkdf2PinHasher(iterations=10000)
+        iterations = int(probe.iterations * target_seconds / measure(probe))
+        return Pbkdf2PinHasher(iterations=max(iterations, 1000))
+
+    if algorithm == ScryptPinHasher.algorithm:
+        hasher = ScryptPinHasher(n=2 ** 10)
+        while hasher.n < MAX_SCRYPT_N:
+            candidate = ScryptPinHasher(n=hasher.n * 2, r=hasher.r, p=hasher.p)
+            if measure(candidate) > target_seconds:
+                break
+
+            hasher = candidate
+
+        return hasher
+
+    raise ValueError(f'unknown pin kdf {algorithm}')
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from account.entity import Account
+from account.adaptors.session_manager import SessionManager
+from account.service import handler
+from account.service.unit_of_work import UnitOfWork
+
+
+class AccountLaneExecutor:
+    """Runs operations of one account in submission order on one of a fixed set of lanes.
+
+    Each lane is a single-thread executor and an account is always hashed onto the same lane,
+    so two operations of one account never read the same last operation_index, while accounts
+    on different lanes run in parallel.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        if size is None:
+            size = int(os.getenv('ACCOUNT_LANES', 8))
+
+        self.lanes: List[ThreadPoolExecutor] = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix='atm-lane') for _ in range(size)
+        ]
+        self.max_depths = [0] * size
+        self._depths = [0] * size
+        self._lock = threading.Lock()
+
+    def lane_of(self, account_id: int) -> int:
+        return hash(account_id) % len(self.lanes)
+
+    def submit(self, account_id: int, fn: Callable, *args, **kwargs) -> Future:
+        lane = self.lane_of(account_id)
+        with self._lock:
+            self._depths[lane] += 1
+            self.max_depths[lane] = max(self.max_depths[lane], self._depths[lane])
+
+        try:
+            future = self.lanes[lane].submit(fn, *args, **kwargs)
+        except BaseException:
+            self._finish(lane)
+            raise
+
+        future.add_done_callback(lambda _: self._finish(lane))
+        return future
+
+    async def run(self, account_id: int, fn: Callable, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(account_id, fn, *args, **kwargs))
+
+    def account_action(
+            self,
+            session_key: str,
+            account_id: int,
+            action: str, amount: int,
+            card_num: int, uow_factory: Callable[[], UnitOfWork],
+            session_manager: SessionManager
+    ) -> Account:
+        # a fresh unit of work per call, lanes run concurrently and a unit of work holds its repository
+        return self.submit(
+            account_id, self._account_action,
+            session_key, account_id, action, amount, card_num, uow_factory, session_manager
+        ).result()
+
+    async def account_action_async(
+            self,
+            session_key: str,
+            account_id: int,
+            action: str, amount: int,
+            card_num: int, uow_factory: Callable[[], UnitOfWork],
+            session_manager: SessionManager
+    ) -> Account:
+        return await self.run(
+            account_id, self._account_action,
+            session_key, account_id, action, amount, card_num, uow_factory, session_manager
+        )
+
+    @staticmethod
+    def _account_action(session_key, account_id, action, amount, card_num, uow_factory, session_manager):
+        return handler.account_action(
+            session_key=session_key, account_id=account_id, action=action, amount=amount,
+            card_num=card_num, uow=uow_factory(), session_manager=session_manager
+        )
+
+    def queue_depths(self) -> List[int]:
+        """Operations queued or running per lane."""
+        with self._lock:
+            return list(self._depths)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                lanes=len(self.lanes),
+                pending=sum(self._depths),
+                max_depth=max(self._depths),
+                peak_depth=max(self.max_depths),
+            )
+
+    def _finish(self, lane: int):
+        with self._lock:
+            self._depths[lane] -= 1
+
+    def shutdown(self):
+        for lane in self.lanes:
+            lane.shutdown()
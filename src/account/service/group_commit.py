@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from account import instrumentation
+from account.entity import Account
+from account.adaptors.session_manager import SessionManager
+from account.service import service_exceptions
+from account.service.handler import _apply_action
+from account.service.unit_of_work import UnitOfWork
+
+
+class _PendingAction:
+    __slots__ = ('session_key', 'account_id', 'action', 'amount', 'card_num', 'done', 'lead', 'result', 'error')
+
+    def __init__(self, session_key: str, account_id: int, action: str, amount: int, card_num: int):
+        self.session_key = session_key
+        self.account_id = account_id
+        self.action = action
+        self.amount = amount
+        self.card_num = card_num
+        self.done = threading.Event()
+        self.lead = False
+        self.result: Optional[Account] = None
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter:
+    """Coalesces concurrent account actions into one transaction and one bulk history insert.
+
+    The first caller to arrive leads. A leader that is alone commits right away, otherwise it
+    keeps collecting up to ``max_batch_size`` actions for at most ``window_seconds`` while more
+    callers keep arriving, then applies them in arrival order inside a single unit of work and
+    commits once. Callers queued meanwhile block until their action is committed, the next of
+    them takes over as leader. Every caller gets its own account or exception, an action that
+    fails validation never fails the rest of its batch. When the batch can not be stored, its
+    actions are retried one transaction each so only the conflicting action fails.
+
+    Only one batch runs at a time, so ``uow`` is used by one leader thread at a time.
+    """
+
+    def __init__(
+            self,
+            uow: UnitOfWork,
+            session_manager: SessionManager,
+            max_batch_size: Optional[int] = None,
+            window_seconds: Optional[float] = None
+    ):
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv('GROUP_COMMIT_MAX_BATCH', 64))
+
+        if window_seconds is None:
+            window_seconds = float(os.getenv('GROUP_COMMIT_WINDOW_MS', 2)) / 1000
+
+        self.uow = uow
+        self.session_manager = session_manager
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self.batches = 0
+        self.actions = 0
+        self.fallbacks = 0
+        self._queue: Deque[_PendingAction] = deque()
+        self._leading = False
+        self._condition = threading.Condition()
+
+    def account_action(self, session_key: str, account_id: int, action: str, amount: int, card_num: int) -> Account:
+        pending = _PendingAction(session_key, account_id, action, amount, card_num)
+        with self._condition:
+            self._queue.append(pending)
+            if self._leading:
+                self._condition.notify_all()
+            else:
+                self._leading = pending.lead = True
+
+        if not pending.lead:
+            pending.done.wait()
+
+        if pending.lead:
+            self._lead()
+
+        if pending.error is not None:
+            raise pending.error
+
+        return pending.result
+
+    def stats(self) -> Dict[str, int]:
+        return dict(batches=self.batches, actions=self.actions, fallbacks=self.fallbacks)
+
+    def _lead(self):
+        deadline = time.monotonic() + self.window_seconds
+        # the leader stops waiting once no caller arrived for a quarter of the window
+        arrival_gap = self.window_seconds / 4
+        with self._condition:
+            queued = 1
+            while queued < len(self._queue) < self.max_batch_size:
+                queued = len(self._queue)
+                remaining = min(deadline - time.monotonic(), arrival_gap)
+                if remaining <= 0:
+                    break
+
+                self._condition.wait(remaining)
+
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+
+        try:
+            self._commit_batch(batch)
+        finally:
+            with self._condition:
+                if self._queue:
+                    # hand over to the oldest waiting caller, the current leader returns right away
+                    successor = self._queue[0]
+                    successor.lead = True
+                    successor.done.set()
+                else:
+                    self._leading = False
+
+    @instrumentation.timed('group_commit.batch')
+    def _commit_batch(self, batch: List[_PendingAction]):
+        self.batches += 1
+        self.actions += len(batch)
+        try:
+            try:
+                outcomes = self._run_batch(batch)
+            except Exception as error:
+                # _run_batch only raises when nothing was committed, the actions can be run again
+                if len(batch) == 1:
+                    outcomes = [(None, error)]
+                else:
+                    self.fallbacks += 1
+                    outcomes = []
+                    for pending in batch:
+                        try:
+                            outcomes.extend(self._run_batch([pending]))
+                        except Exception as single_error:
+                            outcomes.append((None, single_error))
+
+            for pending, (result, error) in zip(batch, outcomes):
+                pending.result = result
+                pending.error = error
+        finally:
+            for pending in batch:
+                if pending.result is None and pending.error is None:
+                    pending.error = service_exceptions.GroupCommitAborted('the batch of this action was aborted')
+
+                pending.lead = False
+                pending.done.set()
+
+    def _run_batch(self, batch: List[_PendingAction]) -> List[Tuple[Optional[Account], Optional[BaseException]]]:
+        """Applies and commits the actions of batch, raises only when nothing was committed."""
+        outcomes = []
+        accounts: Dict[int, Account] = dict()
+        committed = False
+        try:
+            with self.uow:
+                cards = dict()
+                for pending in batch:
+                    try:
+                        if pending.card_num not in cards:
+                            cards[pending.card_num] = self.uow.account_data.get_card(pending.card_num)
+
+                        card = cards[pending.card_num]
+                        if not card:
+                            raise service_exceptions.InvalidCardNum(
+                                f'card with number {pending.card_num} does not exist!'
+                            )
+
+                        if not self.session_manager.validate_and_extend(card.user_id, pending.session_key):
+                            raise service_exceptions.InvalidSesionKey(
+                                f'seession key {pending.session_key} is invalid!'
+                            )
+
+                        account = accounts.get(pending.account_id)
+                        if account is None or account.user_id != card.user_id:
+                            account = self.uow.account_data.get_user_account(card.user_id, pending.account_id)
+                            if account is None:
+                                raise service_exceptions.InvalidAccount(
+                                    f'account {pending.account_id} does not exist!'
+                                )
+
+                            accounts[pending.account_id] = account
+
+                        # a failing action leaves the account untouched, later actions build on the earlier ones
+                        _apply_action(account, pending.action, pending.amount)
+                        outcomes.append((account.new_histories[-1], None))
+                    except Exception as error:
+                        outcomes.append((None, error))
+
+                touched_accounts = [account for account in accounts.values() if account.new_histories]
+                if touched_accounts:
+                    self.uow.account_data.update_accounts(touched_accounts)
+                    self.uow.commit()
+
+                committed = True
+
+            for account in touched_accounts:
+                account.commit_new_histories()
+
+            # every caller sees the account as of its own action, not of the whole batch
+            return [
+                (None, error) if error is not None else (
+                    Account(
+                        account_id=pending.account_id,
+                        user_id=accounts[pending.account_id].user_id,
+                        name=accounts[pending.account_id].name,
+                        histories=[record]
+                    ),
+                    None
+                )
+                for pending, (record, error) in zip(batch, outcomes)
+            ]
+        except Exception as error:
+            if not committed:
+                raise
+
+            # the actions are stored, running them again would apply them twice
+            return [(None, action_error or error) for _, action_error in outcomes]
@@ -1,23 +1,44 @@
-from typing import List
+import asyncio
+from typing import Callable, List, Optional, Tuple
 
+from account import pin_hash
 from account.entity import Account
 from account.value_objects import AccountRecord
-from account.service import service_exceptions
+from account.service import retry, service_exceptions
+from account.adaptors.pin_verifier import InlinePinVerifier, PinVerifier
+from account.adaptors.async_session_manager import AsyncSessionManager
 from account.adaptors.session_manager import SessionManager
-from account.service.unit_of_work import UnitOfWork
+from account.service.unit_of_work import AsyncUnitOfWork, UnitOfWork
 
 
-def set_session(card_num: int, pin: str, uow: UnitOfWork, session_manager: SessionManager) -> str:
+def set_session(
+        card_num: int, pin: str,
+        uow: UnitOfWork, session_manager: SessionManager,
+        pin_verifier: Optional[PinVerifier] = None
+) -> str:
+    if pin_verifier is None:
+        pin_verifier = InlinePinVerifier()
+
     with uow:
         card = uow.account_data.get_card(card_num)
-        if not card:
-            raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
 
-        if not card.validate_pin(pin):
-            raise service_exceptions.IncorrectPin('Invalild pin code!')
+    if not card:
+        raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
+
+    # the key derivation is slow, so it runs after the unit of work has released its transaction
+    if not pin_verifier.verify(card, pin):
+        raise service_exceptions.IncorrectPin('Invalild pin code!')
 
-        session_key = session_manager.set_session(card.user_id)
-        return session_key
+    hasher = pin_hash.get_default_hasher()
+    if card.needs_rehash(hasher):
+        new_pin_hash = pin_verifier.make_pin_hash(pin, hasher)
+        with uow:
+            # only replace the hash the pin was verified against, a concurrent pin change wins
+            uow.account_data.update_card_pin_hash(card.card_num, new_pin_hash, card.pin_salt_hash)
+            uow.commit()
+
+    session_key = session_manager.set_session(card.user_id)
+    return session_key
 
 
 def get_accounts(session_key: str, card_num: int, uow: UnitOfWork, session_manager: SessionManager) -> List[Account]:
@@ -26,11 +47,10 @@ def get_accounts(session_key: str, card_num: int, uow: UnitOfWork, session_manag
         if not card:
             raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
 
-        if not session_manager.validate_user_session(card.user_id, session_key):
+        if not session_manager.validate_and_extend(card.user_id, session_key):
             raise service_exceptions.InvalidSesionKey(f'seession key {session_key} is invalid!')
 
         accounts = uow.account_data.get_user_accounts(card.user_id)
-        session_manager.extend_session(card.user_id)
         return accounts
 
 
@@ -46,20 +66,158 @@ def account_action(
         if not card:
             raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
 
-        if not session_manager.validate_user_session(card.user_id, session_key):
+        if not session_manager.validate_and_extend(card.user_id, session_key):
             raise service_exceptions.InvalidSesionKey(f'seession key {session_key} is invalid!')
 
         account = uow.account_data.get_user_account(card.user_id, account_id)
+        _apply_action(account, action, amount)
 
-        if action == AccountRecord.DEPOSIT:
-            account.deposit(amount)
+        uow.account_data.update_account(account)
+        uow.commit()
+        account.commit_new_histories()
+        return account
 
-        elif action == AccountRecord.WITHDRAWAL:
-            account.withdraw(amount)
-        else:
-            raise ValueError('action must be either "deposit" or "withdrawal"')
 
-        uow.account_data.update_account(account)
-        session_manager.extend_session(card.user_id)
+def account_action_with_retry(
+        session_key: str,
+        account_id: int,
+        action: str, amount: int,
+        card_num: int, uow_factory: Callable[[], UnitOfWork],
+        session_manager: SessionManager,
+        policy: Optional[retry.RetryPolicy] = None,
+        contention: Optional[retry.ContentionStats] = None
+) -> Account:
+    if policy is None:
+        policy = retry.default_policy
+
+    if contention is None:
+        contention = retry.contention
+
+    policy.started()
+    attempt = 1
+    while True:
+        try:
+            # every attempt reloads the account under a fresh unit of work and applies the action again
+            return account_action(
+                session_key=session_key, account_id=account_id, action=action, amount=amount,
+                card_num=card_num, uow=uow_factory(), session_manager=session_manager
+            )
+        except service_exceptions.AccountHistoryIntegrityError:
+            contention.record_conflict(account_id)
+            if not policy.allow_retry(attempt):
+                contention.record_failure(account_id)
+                raise
+
+        contention.record_retry(account_id)
+        policy.sleep(policy.backoff(attempt))
+        attempt += 1
+
+
+def batch_account_action(
+        session_key: str,
+        operations: List[Tuple[int, str, int]],
+        card_num: int, uow: UnitOfWork,
+        session_manager: SessionManager
+) -> List[Account]:
+    with uow:
+        card = uow.account_data.get_card(card_num)
+        if not card:
+            raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
+
+        if not session_manager.validate_and_extend(card.user_id, session_key):
+            raise service_exceptions.InvalidSesionKey(f'seession key {session_key} is invalid!')
+
+        account_ids = list(dict.fromkeys(account_id for account_id, _, _ in operations))
+        accounts = uow.account_data.get_user_accounts_by_id(card.user_id, account_ids)
+
+        for account_id, action, amount in operations:
+            if account_id not in accounts:
+                raise service_exceptions.InvalidAccount(f'account {account_id} does not exist!')
+
+            _apply_action(accounts[account_id], action, amount)
+
+        touched_accounts = [accounts[account_id] for account_id in account_ids]
+        uow.account_data.update_accounts(touched_accounts)
+        uow.commit()
+        for account in touched_accounts:
+            account.commit_new_histories()
+
+        return touched_accounts
+
+
+def _apply_action(account: Account, action: str, amount: int):
+    if action == AccountRecord.DEPOSIT:
+        account.deposit(amount)
+
+    elif action == AccountRecord.WITHDRAWAL:
+        account.withdraw(amount)
+    else:
+        raise ValueError('action must be either "deposit" or "withdrawal"')
+
+
+async def set_session_async(
+        card_num: int, pin: str,
+        uow: AsyncUnitOfWork, session_manager: AsyncSessionManager,
+        pin_verifier: Optional[PinVerifier] = None
+) -> str:
+    if pin_verifier is None:
+        pin_verifier = InlinePinVerifier()
+
+    async with uow:
+        card = await uow.account_data.get_card(card_num)
+
+    if not card:
+        raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
+
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, pin_verifier.verify, card, pin):
+        raise service_exceptions.IncorrectPin('Invalild pin code!')
+
+    hasher = pin_hash.get_default_hasher()
+    if card.needs_rehash(hasher):
+        new_pin_hash = await loop.run_in_executor(None, pin_verifier.make_pin_hash, pin, hasher)
+        async with uow:
+            await uow.account_data.update_card_pin_hash(card.card_num, new_pin_hash, card.pin_salt_hash)
+            await uow.commit()
+
+    session_key = await session_manager.set_session(card.user_id)
+    return session_key
+
+
+async def get_accounts_async(
+        session_key: str, card_num: int, uow: AsyncUnitOfWork, session_manager: AsyncSessionManager
+) -> List[Account]:
+    async with uow:
+        card = await uow.account_data.get_card(card_num)
+        if not card:
+            raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
+
+        if not await session_manager.validate_and_extend(card.user_id, session_key):
+            raise service_exceptions.InvalidSesionKey(f'seession key {session_key} is invalid!')
+
+        accounts = await uow.account_data.get_user_accounts(card.user_id)
+        return accounts
+
+
+async def account_action_async(
+        session_key: str,
+        account_id: int,
+        action: str, amount: int,
+        card_num: int, uow: AsyncUnitOfWork,
+        session_manager: AsyncSessionManager
+) -> Account:
+    async with uow:
+        card = await uow.account_data.get_card(card_num)
+        if not card:
+            raise service_exceptions.InvalidCardNum(f'card with number {card_num} does not exist!')
+
+        if not await session_manager.validate_and_extend(card.user_id, session_key):
+            raise service_exceptions.InvalidSesionKey(f'seession key {session_key} is invalid!')
+
+        account = await uow.account_data.get_user_account(card.user_id, account_id)
+        _apply_action(account, action, amount)
+
+        await uow.account_data.update_account(account)
+        await uow.commit()
         account.commit_new_histories()
         return account
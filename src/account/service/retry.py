@@ -0,0 +1,107 @@
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class RetryPolicy:
+    """Jittered exponential backoff limited by a retry budget.
+
+    Attempt n waits a random time up to ``min(max_delay, base_delay * 2 ** (n - 1))``. Every
+    first attempt adds ``budget_ratio`` tokens to the budget, up to ``budget_max``, and every
+    retry takes one, so retries stay a bounded share of the traffic when an account is
+    contended for a long time instead of multiplying the load.
+    """
+
+    def __init__(
+            self,
+            max_attempts: Optional[int] = None,
+            base_delay: float = 0.005,
+            max_delay: float = 0.2,
+            budget_ratio: float = 0.2,
+            budget_max: float = 20,
+            sleep: Callable[[float], None] = time.sleep,
+            random_fn: Callable[[], float] = random.random
+    ):
+        if max_attempts is None:
+            max_attempts = int(os.getenv('ACCOUNT_ACTION_MAX_ATTEMPTS', 5))
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+        self.sleep = sleep
+        self.random_fn = random_fn
+        self._budget = budget_max
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        return self.random_fn() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+    def started(self):
+        with self._lock:
+            self._budget = min(self.budget_max, self._budget + self.budget_ratio)
+
+    def allow_retry(self, attempt: int) -> bool:
+        if attempt >= self.max_attempts:
+            return False
+
+        with self._lock:
+            if self._budget < 1:
+                return False
+
+            self._budget -= 1
+            return True
+
+    @property
+    def budget(self) -> float:
+        return self._budget
+
+
+class ContentionStats:
+    """Conflicts, retries and final failures per account."""
+
+    def __init__(self):
+        self.conflicts = Counter()
+        self.retries = Counter()
+        self.failures = Counter()
+        self._lock = threading.Lock()
+
+    def record_conflict(self, account_id: int):
+        with self._lock:
+            self.conflicts[account_id] += 1
+
+    def record_retry(self, account_id: int):
+        with self._lock:
+            self.retries[account_id] += 1
+
+    def record_failure(self, account_id: int):
+        with self._lock:
+            self.failures[account_id] += 1
+
+    def hot_accounts(self, count: int = 10) -> List[Tuple[int, int]]:
+        with self._lock:
+            return self.conflicts.most_common(count)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                conflicts=sum(self.conflicts.values()),
+                retries=sum(self.retries.values()),
+                failures=sum(self.failures.values()),
+            )
+
+    def clear(self):
+        with self._lock:
+            self.conflicts.clear()
+            self.retries.clear()
+            self.failures.clear()
+
+
+contention = ContentionStats()
+
+# shared by every call that passes no policy, so the budget limits retries process-wide
+default_policy = RetryPolicy()
@@ -17,3 +17,15 @@ class IncorrectPin(Exception):
 
 class AccountHistoryIntegrityError(Exception):
     pass
+
+
+class PinVerificationBusy(Exception):
+    pass
+
+
+class ReadOnlyRepository(Exception):
+    pass
+
+
+class GroupCommitAborted(Exception):
+    pass
@@ -1,8 +1,20 @@
 import abc
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 
-from django.db import close_old_connections, transaction
+from django.conf import settings
+from django.db import transaction
 
-from account.adaptors.account_repo import AccountRepository, DjangoAccountRepo
+from account import instrumentation
+from account.adaptors.account_repo import AccountRepository, AsyncAccountRepo, DjangoAccountRepo, ReplicaAccountRepo
+from account.adaptors.card_cache import CachedAccountRepo, CardCache
+from account.adaptors.db_connections import ConnectionManager, get_connection_manager
+from account.adaptors.ledger import LedgerStore
+from account.adaptors.ledger_repo import LedgerAccountRepo, LedgerTransaction
+from account.adaptors.recent_writes import RecentWrites, get_recent_writes
+from account.service import service_exceptions
 
 
 class UnitOfWork(abc.ABC):
@@ -27,23 +39,243 @@ class UnitOfWork(abc.ABC):
 
 
 class DjangoUnitOfWork(UnitOfWork):
-    account_data: DjangoAccountRepo
+    account_data: AccountRepository
+
+    def __init__(
+            self,
+            card_cache: Optional[CardCache] = None,
+            connection_manager: Optional[ConnectionManager] = None,
+            recent_writes: Optional[RecentWrites] = None
+    ):
+        self.card_cache = card_cache
+        self.connection_manager = connection_manager if connection_manager is not None else get_connection_manager()
+        self.recent_writes = recent_writes if recent_writes is not None else get_recent_writes()
+        self._after_commit: List[Callable[[], None]] = []
 
     def get_data_repo(self):
-        return DjangoAccountRepo()
+        # transaction.on_commit is not available with manual transaction management
+        repo = DjangoAccountRepo(on_commit=self._after_commit.append, recent=self.recent_writes)
+        if self.card_cache is not None:
+            return CachedAccountRepo(repo, self.card_cache, on_commit=self._after_commit.append)
+
+        return repo
 
+    @instrumentation.timed('uow.enter')
     def __enter__(self):
+        self._after_commit.clear()
         self.account_data = self.get_data_repo()
-        close_old_connections()
+        self.connection_manager.checkout()
         transaction.set_autocommit(False)
         return super().__enter__()
 
     def __exit__(self, *args):
-        super().__exit__(*args)
-        transaction.set_autocommit(True)
+        try:
+            super().__exit__(*args)
+        finally:
+            self._release()
 
+    @instrumentation.timed('uow.exit')
+    def _release(self):
+        # the rollback of __exit__ is timed on its own, this covers the rest of leaving
+        try:
+            transaction.set_autocommit(True)
+        finally:
+            self.connection_manager.checkin()
+
+    @instrumentation.timed('uow.commit')
     def _commit(self):
         transaction.commit()
+        callbacks = list(self._after_commit)
+        self._after_commit.clear()
+        for callback in callbacks:
+            callback()
 
+    @instrumentation.timed('uow.rollback')
     def rollback(self):
-        transaction.rollback()
\ No newline at end of file
+        transaction.rollback()
+        self._after_commit.clear()
+
+
+class ReadOnlyUnitOfWork(UnitOfWork):
+    """Unit of work for read paths such as get_accounts.
+
+    It opens no transaction, every query runs in autocommit mode on the REPLICA_DATABASE alias
+    when one is configured, and on the primary for users that wrote recently. The connection of
+    every alias a read goes to is checked out through its ConnectionManager on first use and
+    checked in on exit.
+    """
+    account_data: AccountRepository
+
+    def __init__(
+            self,
+            card_cache: Optional[CardCache] = None,
+            replica_alias: Optional[str] = None,
+            connection_managers: Callable[[Optional[str]], ConnectionManager] = get_connection_manager
+    ):
+        self.card_cache = card_cache
+        self.replica_alias = replica_alias if replica_alias is not None else settings.REPLICA_DATABASE
+        self.connection_managers = connection_managers
+        self._checked_out: Dict[Optional[str], ConnectionManager] = dict()
+
+    def get_data_repo(self):
+        repo = DjangoAccountRepo()
+        if self.card_cache is not None:
+            repo = CachedAccountRepo(repo, self.card_cache)
+
+        return ReplicaAccountRepo(repo, self.replica_alias, checkout=self._checkout)
+
+    def _checkout(self, alias: Optional[str]):
+        if alias not in self._checked_out:
+            connection_manager = self.connection_managers(alias)
+            connection_manager.checkout()
+            self._checked_out[alias] = connection_manager
+
+    @instrumentation.timed('uow.enter')
+    def __enter__(self):
+        self._checked_out.clear()
+        self.account_data = self.get_data_repo()
+        return self
+
+    @instrumentation.timed('uow.exit')
+    def __exit__(self, *args):
+        checked_out = list(self._checked_out.values())
+        self._checked_out.clear()
+        for connection_manager in checked_out:
+            connection_manager.checkin()
+
+    def _commit(self):
+        raise service_exceptions.ReadOnlyRepository('a read-only unit of work can not commit')
+
+    def rollback(self):
+        pass
+
+
+class LedgerUnitOfWork(UnitOfWork):
+    """Unit of work on an embedded LedgerStore for deployments without MySQL.
+
+    Writes are collected while the unit of work is open and stored as one ledger entry on
+    commit, history conflicts surface as AccountHistoryIntegrityError on update or commit.
+    """
+    account_data: LedgerAccountRepo
+
+    def __init__(self, store: LedgerStore):
+        self.store = store
+        self.ledger_transaction = LedgerTransaction()
+
+    def __enter__(self):
+        self.ledger_transaction.clear()
+        self.account_data = LedgerAccountRepo(self.store, self.ledger_transaction)
+        return super().__enter__()
+
+    @instrumentation.timed('uow.commit')
+    def _commit(self):
+        operations = self.ledger_transaction.operations
+        expected_pin_hashes = self.ledger_transaction.expected_pin_hashes
+        self.ledger_transaction.clear()
+        self.store.commit(operations, expected_pin_hashes)
+
+    def rollback(self):
+        self.ledger_transaction.clear()
+
+
+class AsyncUnitOfWork(abc.ABC):
+    account_data: AsyncAccountRepo
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.rollback()
+
+    async def commit(self):
+        await self._commit()
+
+    @abc.abstractmethod
+    async def _commit(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def rollback(self):
+        raise NotImplementedError
+
+
+class DatabaseThreads:
+    """Fixed set of single-thread executors that blocking units of work are pinned to.
+
+    Django keeps connections and transactions per thread, so every call made by one unit of
+    work has to run on the same thread and no other unit of work may use that thread meanwhile.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        if size is None:
+            size = int(os.getenv('ASYNC_DB_THREADS', 8))
+
+        self.executors: List[ThreadPoolExecutor] = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix='atm-db') for _ in range(size)
+        ]
+        self._free_executors: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def acquire(self) -> ThreadPoolExecutor:
+        # the queue belongs to one event loop, it is rebuilt when used from a new loop
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._free_executors = asyncio.Queue()
+            for executor in self.executors:
+                self._free_executors.put_nowait(executor)
+
+        return await self._free_executors.get()
+
+    def release(self, executor: ThreadPoolExecutor):
+        self._free_executors.put_nowait(executor)
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown()
+
+
+_database_threads: Optional[DatabaseThreads] = None
+
+
+def get_database_threads() -> DatabaseThreads:
+    global _database_threads
+    if _database_threads is None:
+        _database_threads = DatabaseThreads()
+
+    return _database_threads
+
+
+class ThreadBoundUnitOfWork(AsyncUnitOfWork):
+    """Runs a blocking unit of work, by default DjangoUnitOfWork, on a dedicated database thread."""
+
+    def __init__(self, uow: Optional[UnitOfWork] = None, threads: Optional[DatabaseThreads] = None):
+        self.uow = uow if uow is not None else DjangoUnitOfWork()
+        self.threads = threads if threads is not None else get_database_threads()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def __aenter__(self):
+        self._executor = await self.threads.acquire()
+        try:
+            await self._run(self.uow.__enter__)
+        except BaseException:
+            self.threads.release(self._executor)
+            raise
+
+        self.account_data = AsyncAccountRepo(self.uow.account_data, self._run)
+        return self
+
+    async def __aexit__(self, *args):
+        try:
+            await self._run(self.uow.__exit__, *args)
+        finally:
+            self.threads.release(self._executor)
+            self._executor = None
+
+    async def _commit(self):
+        await self._run(self.uow.commit)
+
+    async def rollback(self):
+        await self._run(self.uow.rollback)
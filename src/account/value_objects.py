@@ -1,8 +1,12 @@
-from typing import Optional
-from datetime import datetime
+from array import array
+from collections.abc import Sequence
+from typing import Iterable, List, Optional, Union
+from datetime import datetime, timedelta, timezone
 
 
 class AccountRecord:
+    __slots__ = ('record_index', 'action', 'balance', 'time_at')
+
     DEPOSIT = 'deposit'
     WITHDRAWAL = 'withdrawal'
 
@@ -14,3 +18,104 @@ class AccountRecord:
         self.action = action
         self.balance = balance
         self.time_at = time_at
+
+
+_ACTIONS = (AccountRecord.DEPOSIT, AccountRecord.WITHDRAWAL)
+_ACTION_CODES = {action: code for code, action in enumerate(_ACTIONS)}
+
+_NO_TIME, _NAIVE_TIME, _UTC_TIME = 0, 1, 2
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class AccountRecords(Sequence):
+    """Append-only, record_index ordered account history stored column-wise in arrays.
+
+    A record takes 26 bytes of array storage instead of a Python object per record,
+    AccountRecord instances are only built when an element is read.
+    """
+    __slots__ = ('_indexes', '_balances', '_actions', '_times', '_time_kinds')
+
+    def __init__(self, records: Iterable[AccountRecord] = ()):
+        self._indexes = array('q')
+        self._balances = array('q')
+        self._actions = bytearray()
+        self._times = array('q')
+        self._time_kinds = bytearray()
+        self.extend(records)
+
+    @classmethod
+    def from_records(cls, records: Union['AccountRecords', List[AccountRecord]]) -> 'AccountRecords':
+        if isinstance(records, AccountRecords):
+            return records
+
+        if any(records[position - 1].record_index > records[position].record_index
+               for position in range(1, len(records))):
+            records = sorted(records, key=lambda x: x.record_index)
+
+        return cls(records)
+
+    def append(self, record: AccountRecord):
+        if self._indexes and record.record_index <= self._indexes[-1]:
+            raise ValueError(f'record index {record.record_index} is not after {self._indexes[-1]}')
+
+        self._indexes.append(record.record_index)
+        self._balances.append(record.balance)
+        self._actions.append(_ACTION_CODES[record.action])
+
+        time_at = record.time_at
+        if time_at is None:
+            self._time_kinds.append(_NO_TIME)
+            self._times.append(0)
+        elif time_at.tzinfo is None:
+            self._time_kinds.append(_NAIVE_TIME)
+            self._times.append((time_at - _EPOCH) // _MICROSECOND)
+        else:
+            self._time_kinds.append(_UTC_TIME)
+            self._times.append((time_at.astimezone(timezone.utc).replace(tzinfo=None) - _EPOCH) // _MICROSECOND)
+
+    def extend(self, records: Iterable[AccountRecord]):
+        for record in records:
+            self.append(record)
+
+    def _record(self, position: int) -> AccountRecord:
+        time_kind = self._time_kinds[position]
+        time_at = None
+        if time_kind != _NO_TIME:
+            time_at = _EPOCH + self._times[position] * _MICROSECOND
+            if time_kind == _UTC_TIME:
+                time_at = time_at.replace(tzinfo=timezone.utc)
+
+        return AccountRecord(
+            action=_ACTIONS[self._actions[position]],
+            balance=self._balances[position],
+            record_index=self._indexes[position],
+            time_at=time_at
+        )
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._record(position)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._record(index) for index in range(*position.indices(len(self)))]
+
+        if position < 0:
+            position += len(self)
+
+        if not 0 <= position < len(self):
+            raise IndexError('account record index out of range')
+
+        return self._record(position)
+
+    @property
+    def last_record_index(self) -> Optional[int]:
+        return self._indexes[-1] if self._indexes else None
+
+    @property
+    def last_balance(self) -> Optional[int]:
+        return self._balances[-1] if self._balances else None
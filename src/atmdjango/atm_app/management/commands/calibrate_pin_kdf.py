@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from account import pin_hash
+
+
+class Command(BaseCommand):
+    help = 'Pick the pin KDF cost so one verification fits the target latency on this host'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=sorted(pin_hash.HASHER_CLASSES),
+                            default=pin_hash.Pbkdf2PinHasher.algorithm)
+        parser.add_argument('--target-ms', type=float, default=50.0,
+                            help='target latency of one pin verification in milliseconds')
+
+    def handle(self, *args, algorithm, target_ms, **options):
+        hasher = pin_hash.calibrate(algorithm, target_ms / 1000)
+        elapsed_ms = pin_hash.measure(hasher) * 1000
+
+        self.stdout.write(f'# {algorithm} verification takes {elapsed_ms:.1f}ms on this host')
+        self.stdout.write(f'PIN_KDF={hasher.algorithm}')
+        if isinstance(hasher, pin_hash.ScryptPinHasher):
+            self.stdout.write(f'PIN_KDF_SCRYPT_N={hasher.n}')
+            self.stdout.write(f'PIN_KDF_SCRYPT_R={hasher.r}')
+            self.stdout.write(f'PIN_KDF_SCRYPT_P={hasher.p}')
+        else:
+            self.stdout.write(f'PIN_KDF_ITERATIONS={hasher.iterations}')
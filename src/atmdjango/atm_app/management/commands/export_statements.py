@@ -0,0 +1,140 @@
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import BoundedSemaphore
+from typing import Optional, TextIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+
+from account.adaptors.account_repo import DjangoAccountRepo
+from atmdjango.atm_app.models import BankAccount
+
+FIELDS = ['account_id', 'user_id', 'account_name', 'operation_index', 'operation', 'balance', 'created_at']
+
+
+def parse_time(value: str) -> datetime:
+    parsed = parse_datetime(value)
+    if parsed is None:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'invalid date {value}')
+
+    return parsed
+
+
+class StatementWriter:
+    def __init__(self, out: TextIO, output_format: str):
+        self.out = out
+        self.output_format = output_format
+        self._csv = csv.writer(out) if output_format == 'csv' else None
+
+    def header(self):
+        if self._csv is not None:
+            self._csv.writerow(FIELDS)
+
+    def write(self, row: list):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self.out.write(json.dumps(dict(zip(FIELDS, row)), default=str) + '\n')
+
+
+class Command(BaseCommand):
+    help = 'Export account statements as CSV or JSONL, streaming the history page by page'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--account-id', type=int, action='append', dest='account_ids')
+        target.add_argument('--user-id', type=int)
+        target.add_argument('--all', action='store_true', dest='all_accounts')
+        parser.add_argument('--since', type=parse_time, help='first created_at to include')
+        parser.add_argument('--until', type=parse_time, help='created_at to stop before')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', dest='output_format')
+        parser.add_argument('--output', default='-',
+                            help='output file, "-" for stdout, or a directory with one file per account when '
+                                 'exporting with more than one worker')
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=1000, help='history rows fetched per query')
+
+    def handle(
+            self, *args,
+            account_ids=None, user_id=None, all_accounts=False, since=None, until=None,
+            output_format='csv', output='-', workers=1, chunk_size=1000, **options
+    ):
+        accounts = BankAccount.objects.order_by('id')
+        if account_ids:
+            accounts = accounts.filter(id__in=account_ids)
+        elif user_id is not None:
+            accounts = accounts.filter(user_id=user_id)
+
+        accounts = accounts.values_list('id', 'user_id', 'account_name').iterator(chunk_size=chunk_size)
+        export_options = dict(since=since, until=until, output_format=output_format, chunk_size=chunk_size)
+
+        if workers <= 1:
+            self._export_to_single_output(accounts, output, export_options)
+            return
+
+        if output == '-':
+            raise CommandError('exporting with several workers needs an output directory')
+
+        os.makedirs(output, exist_ok=True)
+        self._export_in_parallel(accounts, output, workers, export_options)
+
+    def _export_to_single_output(self, accounts, output: str, export_options: dict):
+        out = self.stdout if output == '-' else open(output, 'w', newline='')
+        try:
+            writer = StatementWriter(out, export_options['output_format'])
+            writer.header()
+            for account in accounts:
+                self._export_account(account, writer, **export_options)
+        finally:
+            if out is not self.stdout:
+                out.close()
+
+    def _export_in_parallel(self, accounts, output_dir: str, workers: int, export_options: dict):
+        # keeps at most two accounts queued per worker, so the account list is streamed as well
+        slots = BoundedSemaphore(workers * 2)
+        pending = set()
+
+        def export_file(account):
+            try:
+                path = os.path.join(output_dir, f'{account[0]}.{export_options["output_format"]}')
+                with open(path, 'w', newline='') as out:
+                    writer = StatementWriter(out, export_options['output_format'])
+                    writer.header()
+                    self._export_account(account, writer, **export_options)
+            finally:
+                connection.close()
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for account in accounts:
+                slots.acquire()
+                pending.add(executor.submit(export_file, account))
+                finished = {future for future in pending if future.done()}
+                for future in finished:
+                    future.result()
+
+                pending -= finished
+
+        for future in pending:
+            future.result()
+
+    @staticmethod
+    def _export_account(
+            account: tuple, writer: StatementWriter,
+            since: Optional[datetime], until: Optional[datetime], output_format: str, chunk_size: int
+    ):
+        account_id, user_id, account_name = account
+        records = DjangoAccountRepo().iter_account_history(account_id, since=since, until=until, page_size=chunk_size)
+        for record in records:
+            writer.write([
+                account_id, user_id, account_name,
+                record.record_index, record.action, record.balance,
+                record.time_at.isoformat() if record.time_at else None
+            ])
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from atmdjango.atm_app.models import AccountBalance, AccountHistory
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the account balance snapshots from the account history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account-id', type=int, action='append', dest='account_ids',
+                            help='only rebuild the given account (can be repeated)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='number of accounts rebuilt per transaction')
+
+    def handle(self, *args, account_ids=None, chunk_size=1000, **options):
+        if account_ids is None:
+            account_ids = AccountHistory.objects.values_list(
+                'account_id', flat=True
+            ).distinct().order_by('account_id').iterator()
+
+        rebuilt = 0
+        chunk = []
+        for account_id in account_ids:
+            chunk.append(account_id)
+            if len(chunk) >= chunk_size:
+                rebuilt += self._rebuild(chunk)
+                chunk = []
+
+        if chunk:
+            rebuilt += self._rebuild(chunk)
+
+        self.stdout.write(f'rebuilt {rebuilt} account balances')
+
+    @staticmethod
+    def _rebuild(account_ids):
+        last_index = AccountHistory.objects.filter(
+            account_id=OuterRef('account_id')
+        ).order_by('-operation_index').values('operation_index')[:1]
+        with transaction.atomic():
+            # writers moving one of these snapshots wait for this transaction, and record_latest
+            # never moves a snapshot back to an older row than the one it holds
+            list(AccountBalance.objects.select_for_update().filter(account_id__in=account_ids).values_list('id'))
+            latest_rows = list(
+                AccountHistory.objects.filter(account_id__in=account_ids, operation_index=Subquery(last_index))
+            )
+            AccountBalance.record_latest(latest_rows)
+
+        return len(latest_rows)
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atm_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.BigIntegerField(unique=True)),
+                ('account_balance', models.BigIntegerField()),
+                ('operation', models.CharField(max_length=32)),
+                ('operation_index', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
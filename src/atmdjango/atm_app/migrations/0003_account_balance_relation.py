@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atm_app', '0002_account_balance'),
+    ]
+
+    # the column and its unique index stay as they are, only the model learns the relation
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='accountbalance',
+                    name='account_id',
+                ),
+                migrations.AddField(
+                    model_name='accountbalance',
+                    name='account',
+                    field=models.OneToOneField(
+                        db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name='balance', to='atm_app.bankaccount'
+                    ),
+                    preserve_default=False,
+                ),
+            ],
+        ),
+    ]
@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from django.db import models
 
 from account.entity import Account, AccountRecord, Card
@@ -52,3 +54,62 @@ class AccountHistory(models.Model):
         )
 
 
+class AccountBalance(models.Model):
+    # no database constraint, snapshots are written next to history rows that have none either
+    account = models.OneToOneField(
+        BankAccount, on_delete=models.DO_NOTHING, db_constraint=False, related_name='balance'
+    )
+    account_balance = models.BigIntegerField()
+    operation = models.CharField(max_length=32)
+    operation_index = models.BigIntegerField()
+    updated_at = models.DateTimeField()
+
+    def to_domain(self):
+        return AccountRecord(
+            action=self.operation,
+            balance=self.account_balance,
+            time_at=self.updated_at,
+            record_index=self.operation_index
+        )
+
+    @staticmethod
+    def record_latest(history_rows: Iterable[AccountHistory]):
+        """Moves the snapshots of the accounts to their latest row of history_rows, never backwards.
+
+        Runs inside a transaction, the snapshot rows are locked until it ends.
+        """
+        latest_rows = dict()
+        for history in history_rows:
+            latest = latest_rows.get(history.account_id)
+            if latest is None or latest.operation_index < history.operation_index:
+                latest_rows[history.account_id] = history
+
+        if not latest_rows:
+            return
+
+        balances = {
+            balance.account_id: balance
+            for balance in AccountBalance.objects.select_for_update().filter(account_id__in=list(latest_rows))
+        }
+        new_balances = []
+        changed_balances = []
+        for account_id, history in latest_rows.items():
+            balance = balances.get(account_id)
+            if balance is None:
+                balance = AccountBalance(account_id=account_id)
+                new_balances.append(balance)
+            elif balance.operation_index >= history.operation_index:
+                # a newer write already moved the snapshot, rows read before it must not roll it back
+                continue
+            else:
+                changed_balances.append(balance)
+
+            balance.account_balance = history.account_balance
+            balance.operation = history.operation
+            balance.operation_index = history.operation_index
+            balance.updated_at = history.created_at
+
+        AccountBalance.objects.bulk_update(
+            changed_balances, ['account_balance', 'operation', 'operation_index', 'updated_at']
+        )
+        AccountBalance.objects.bulk_create(new_balances)
@@ -0,0 +1,36 @@
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+_routing = threading.local()
+
+
+def get_read_alias() -> Optional[str]:
+    return getattr(_routing, 'read_alias', None)
+
+
+@contextmanager
+def read_from(alias: Optional[str]):
+    """Routes reads of the current thread to ``alias``, None keeps the default database."""
+    previous_alias = get_read_alias()
+    _routing.read_alias = alias
+    try:
+        yield
+    finally:
+        _routing.read_alias = previous_alias
+
+
+class ReplicaRouter:
+    """Sends reads to the alias selected with read_from, writes and migrations always go to default."""
+
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -54,6 +54,8 @@ if os.getenv('MYSQL_DATABASE'):
             'PASSWORD': os.getenv('MYSQL_PASSWORD'),
             'HOST': os.getenv('MYSQL_HOST', 'db'),
             'PORT': os.getenv('MYSQL_PORT', 3306),
+            # workers keep their connection, see account.adaptors.db_connections.ConnectionManager
+            'CONN_MAX_AGE': int(os.getenv('MYSQL_CONN_MAX_AGE', 600)),
         }
     }
 else:
@@ -64,6 +66,24 @@ else:
         }
     }
 
+# read-only units of work send their queries to this alias when it is configured
+REPLICA_DATABASE = None
+if os.getenv('MYSQL_DATABASE') and os.getenv('MYSQL_REPLICA_HOST'):
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = dict(
+        DATABASES['default'],
+        HOST=os.getenv('MYSQL_REPLICA_HOST'),
+        PORT=os.getenv('MYSQL_REPLICA_PORT', DATABASES['default']['PORT']),
+        # replica connections get their own lifetime, they are managed by their own ConnectionManager
+        CONN_MAX_AGE=int(os.getenv('MYSQL_REPLICA_CONN_MAX_AGE', DATABASES['default']['CONN_MAX_AGE'])),
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['atmdjango.atm_django.routers.ReplicaRouter']
+
+# seconds a user keeps reading from the primary after one of their writes
+REPLICA_FRESHNESS_SECONDS = float(os.getenv('REPLICA_FRESHNESS_SECONDS', 5))
+
 
 
 # Internationalization
@@ -1,16 +1,69 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
 import pytest
 
 from account.adaptors.account_repo import DjangoAccountRepo
+from account.adaptors.ledger import RECORD_OP, LedgerStore
+from account.adaptors.ledger_repo import LedgerAccountRepo
 from account.entity import Account
 from account.value_objects import AccountRecord
 from account.service.service_exceptions import AccountHistoryIntegrityError
-from atmdjango.atm_app.models import AccountHistory, BankAccount, BankCard
+from atmdjango.atm_app.models import AccountBalance, AccountHistory, BankAccount, BankCard
+
+
+class DjangoBackend:
+    def repo(self):
+        return DjangoAccountRepo()
+
+    def add_card(self, card_num, user_id, pin_hash):
+        BankCard.objects.create(card_number=card_num, user_id=user_id, pin_hash=pin_hash)
+
+    def add_account(self, user_id, name):
+        return BankAccount.objects.create(user_id=user_id, account_name=name).id
+
+    def add_history(self, account_id, operation, balance, record_index, created_at=None):
+        AccountHistory.objects.create(
+            account_id=account_id,
+            operation=operation,
+            account_balance=balance,
+            operation_index=record_index
+        )
+        if created_at is not None:
+            AccountHistory.objects.filter(account_id=account_id, operation_index=record_index).update(
+                created_at=created_at
+            )
+
+
+class LedgerBackend:
+    def __init__(self, path):
+        self.store = LedgerStore(path, grow_bytes=4096)
+
+    def repo(self):
+        return LedgerAccountRepo(self.store)
+
+    def add_card(self, card_num, user_id, pin_hash):
+        self.store.add_card(card_num, user_id, pin_hash)
+
+    def add_account(self, user_id, name):
+        return self.store.add_account(user_id, name)
+
+    def add_history(self, account_id, operation, balance, record_index, created_at=None):
+        self.store.commit([(RECORD_OP, account_id, AccountRecord(operation, balance, record_index, created_at))])
+
+
+@pytest.fixture(params=['django', 'ledger'])
+def backend(request, tmp_path):
+    if request.param == 'django':
+        yield DjangoBackend()
+        return
+
+    ledger_backend = LedgerBackend(str(tmp_path / 'accounts.ledger'))
+    yield ledger_backend
+    ledger_backend.store.close()
 
 
 @pytest.fixture
-def setup_cards():
+def setup_cards(backend):
     cards = {
         32323: dict(user_id=38282, pin_hash='Iam-king-of-the-world!'),
         17: dict(user_id=38282, pin_hash='Showmethemoney'),
@@ -18,14 +71,14 @@ def setup_cards():
     }
 
     for card_num, card_info in cards.items():
-        BankCard.objects.create(card_number=card_num, user_id=card_info['user_id'], pin_hash=card_info['pin_hash'])
+        backend.add_card(card_num, card_info['user_id'], card_info['pin_hash'])
 
     yield cards
 
 
 @pytest.mark.django_db
-def test_get_card(setup_cards):
-    repo = DjangoAccountRepo()
+def test_get_card(backend, setup_cards):
+    repo = backend.repo()
     for card_num, card_info in setup_cards.items():
         card = repo.get_card(card_num)
 
@@ -35,16 +88,29 @@ def test_get_card(setup_cards):
 
 
 @pytest.mark.django_db
-def test_non_existing_card(setup_cards):
-    repo = DjangoAccountRepo()
+def test_non_existing_card(backend, setup_cards):
+    repo = backend.repo()
 
     card_num = max(setup_cards) + 1
     card = repo.get_card(card_num)
     assert card is None
 
 
+@pytest.mark.django_db
+def test_update_card_pin_hash(backend, setup_cards):
+    repo = backend.repo()
+    repo.update_card_pin_hash(17, 'new-hash', previous_pin_hash='stale-hash')
+    assert repo.get_card(17).pin_salt_hash == 'Showmethemoney'
+
+    repo.update_card_pin_hash(17, 'new-hash', previous_pin_hash='Showmethemoney')
+    assert repo.get_card(17).pin_salt_hash == 'new-hash'
+
+    repo.update_card_pin_hash(17, 'newer-hash')
+    assert repo.get_card(17).pin_salt_hash == 'newer-hash'
+
+
 @pytest.fixture
-def setup_accounts():
+def setup_accounts(backend):
     user_account_names = {
         379: ['Mudamuda!', 'you are already dead', 'Dora'],
         101: ['Gandalf', 'another one bites the dust']
@@ -56,17 +122,17 @@ def setup_accounts():
     account_names = dict()
     for user_id, account_name_list in user_account_names.items():
         for name in account_name_list:
-            account = BankAccount.objects.create(user_id=user_id, account_name=name)
-            user_account_ids[user_id].add(account.id)
-            account_names[account.id] = name
+            account_id = backend.add_account(user_id, name)
+            user_account_ids[user_id].add(account_id)
+            account_names[account_id] = name
 
     yield user_account_ids, account_names
 
 
 @pytest.mark.django_db
-def test_get_user_accounts(setup_accounts):
+def test_get_user_accounts(backend, setup_accounts):
     user_account_ids, account_names = setup_accounts
-    repo = DjangoAccountRepo()
+    repo = backend.repo()
 
     for user_id, account_ids in user_account_ids.items():
         accounts = repo.get_user_accounts(user_id)
@@ -78,9 +144,9 @@ def test_get_user_accounts(setup_accounts):
 
 
 @pytest.mark.django_db
-def test_get_non_existing_user_accounts(setup_accounts):
+def test_get_non_existing_user_accounts(backend, setup_accounts):
     user_account_ids, _ = setup_accounts
-    repo = DjangoAccountRepo()
+    repo = backend.repo()
 
     user_id = max(user_account_ids.keys()) + 1
     accounts = repo.get_user_accounts(user_id)
@@ -88,28 +154,22 @@ def test_get_non_existing_user_accounts(setup_accounts):
 
 
 @pytest.fixture
-def account_with_history():
+def account_with_history(backend):
     user_id = 185
     account_name = 'bankrupt'
     last_record_index = 38271
     balance = 37273
     last_operation = AccountRecord.DEPOSIT
-    account = BankAccount.objects.create(user_id=user_id, account_name=account_name)
+    account_id = backend.add_account(user_id, account_name)
+    backend.add_history(account_id, AccountRecord.DEPOSIT, balance, last_record_index)
 
-    AccountHistory.objects.create(
-        account_id=account.id,
-        operation=AccountRecord.DEPOSIT,
-        account_balance=balance,
-        operation_index=last_record_index
-    )
-
-    yield user_id, account.id, last_record_index, account_name, balance, last_operation
+    yield user_id, account_id, last_record_index, account_name, balance, last_operation
 
 
 @pytest.mark.django_db
-def test_get_user_account(account_with_history):
+def test_get_user_account(backend, account_with_history):
     user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
-    repo = DjangoAccountRepo()
+    repo = backend.repo()
 
     account = repo.get_user_account(user_id=user_id, account_id=account_id)
 
@@ -119,21 +179,17 @@ def test_get_user_account(account_with_history):
     assert account.name == account_name
     assert account.user_id == user_id
     assert account.get_balance() == balance
+    assert repo.get_user_account(user_id=user_id + 1, account_id=account_id) is None
 
 
 @pytest.mark.django_db
-def test_get_user_accout_overwrite_last_record(account_with_history):
+def test_get_user_accout_overwrite_last_record(backend, account_with_history):
     user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
 
     new_balance = 11
-    AccountHistory.objects.create(
-        account_id=account_id,
-        operation=AccountRecord.WITHDRAWAL,
-        account_balance=new_balance,
-        operation_index=last_record_index + 1
-    )
+    backend.add_history(account_id, AccountRecord.WITHDRAWAL, new_balance, last_record_index + 1)
 
-    repo = DjangoAccountRepo()
+    repo = backend.repo()
 
     account = repo.get_user_account(user_id=user_id, account_id=account_id)
 
@@ -146,7 +202,7 @@ def test_get_user_accout_overwrite_last_record(account_with_history):
 
 
 @pytest.mark.django_db
-def test_update_account():
+def test_update_account(backend):
     account = Account(
         account_id=3232,
         user_id=822,
@@ -161,18 +217,18 @@ def test_update_account():
         AccountRecord(action=AccountRecord.WITHDRAWAL, balance=400, record_index=41)
     ]
     account.new_histories = new_histories
-    repo = DjangoAccountRepo()
+    repo = backend.repo()
 
     repo.update_account(account)
 
-    for record in new_histories:
-        history_data = AccountHistory.objects.get(account_id=account.account_id, operation_index=record.record_index)
-        assert history_data.operation == record.action
-        assert history_data.account_balance == record.balance
+    records = list(repo.iter_account_history(account.account_id))
+    assert [(record.record_index, record.action, record.balance) for record in records] == [
+        (record.record_index, record.action, record.balance) for record in new_histories
+    ]
 
 
 @pytest.mark.django_db(transaction=True)
-def test_update_account_integrity_failure():
+def test_update_account_integrity_failure(backend):
     account = Account(
         account_id=3232,
         user_id=822,
@@ -188,16 +244,151 @@ def test_update_account_integrity_failure():
     ]
     account.new_histories = new_histories
 
-    AccountHistory.objects.create(
-        account_id=account.account_id,
-        operation_index=40, account_balance=7899,
-        operation=AccountRecord.WITHDRAWAL
-    )
+    backend.add_history(account.account_id, AccountRecord.WITHDRAWAL, 7899, 40)
 
-    repo = DjangoAccountRepo()
+    repo = backend.repo()
 
     with pytest.raises(AccountHistoryIntegrityError):
         repo.update_account(account)
 
     # check if no new history is created by repo
-    assert len(AccountHistory.objects.all()) == 1
+    assert len(list(repo.iter_account_history(account.account_id))) == 1
+
+
+@pytest.mark.django_db
+def test_get_user_accounts_by_id(backend, account_with_history, setup_accounts):
+    user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
+    user_account_ids, _ = setup_accounts
+    other_account_id = next(iter(user_account_ids[379]))
+    repo = backend.repo()
+
+    accounts = repo.get_user_accounts_by_id(user_id, [account_id, other_account_id])
+
+    assert list(accounts) == [account_id]
+    account = accounts[account_id]
+    assert account.name == account_name
+    assert account.histories[-1].record_index == last_record_index
+    assert account.get_balance() == balance
+
+
+@pytest.mark.django_db
+def test_update_accounts(backend):
+    accounts = [
+        Account(
+            account_id=account_id,
+            user_id=822,
+            name=f'account {account_id}',
+            histories=[
+                AccountRecord(action=AccountRecord.DEPOSIT, balance=376, record_index=39, time_at=datetime.utcnow())
+            ]
+        )
+        for account_id in (3232, 3233)
+    ]
+    for account in accounts:
+        account.deposit(10)
+        account.withdraw(6)
+
+    repo = backend.repo()
+    repo.update_accounts(accounts)
+
+    for account in accounts:
+        assert [record.balance for record in repo.iter_account_history(account.account_id)] == [386, 380]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', ['django'], indirect=True)
+def test_update_account_maintains_balance_snapshot(account_with_history):
+    user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
+    repo = DjangoAccountRepo()
+
+    for amount in (10, 20):
+        account = repo.get_user_account(user_id=user_id, account_id=account_id)
+        account.deposit(amount)
+        repo.update_account(account)
+
+    account_balance = AccountBalance.objects.get(account_id=account_id)
+    assert account_balance.operation_index == last_record_index + 2
+    assert account_balance.account_balance == balance + 30
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', ['django'], indirect=True)
+def test_get_user_account_reads_balance_snapshot(account_with_history):
+    user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
+    history = AccountHistory.objects.get(account_id=account_id)
+    AccountBalance.objects.create(
+        account_id=account_id,
+        account_balance=balance + 1,
+        operation=AccountRecord.WITHDRAWAL,
+        operation_index=last_record_index,
+        updated_at=history.created_at
+    )
+    repo = DjangoAccountRepo()
+
+    assert repo.get_user_account(user_id=user_id, account_id=account_id).get_balance() == balance + 1
+    assert repo.get_user_accounts(user_id)[0].get_balance() == balance + 1
+    assert repo.get_user_accounts_by_id(user_id, [account_id])[account_id].get_balance() == balance + 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('account_count', [1, 5, 30])
+def test_get_user_accounts_query_count(django_assert_num_queries, account_count):
+    user_id = 4242
+    history_rows = []
+    for account_index in range(account_count):
+        account = BankAccount.objects.create(user_id=user_id, account_name=f'account {account_index}')
+        history_rows.append(AccountHistory.objects.create(
+            account_id=account.id,
+            operation=AccountRecord.DEPOSIT,
+            account_balance=account_index,
+            operation_index=1
+        ))
+    repo = DjangoAccountRepo()
+
+    # without snapshots the last records are read from history in two more queries
+    with django_assert_num_queries(3):
+        accounts = repo.get_user_accounts(user_id)
+
+    assert sorted(account.get_balance() for account in accounts) == list(range(account_count))
+
+    AccountBalance.record_latest(history_rows)
+    with django_assert_num_queries(1):
+        accounts = repo.get_user_accounts(user_id)
+
+    assert sorted(account.get_balance() for account in accounts) == list(range(account_count))
+
+
+@pytest.fixture
+def long_history(backend):
+    account_id = 9911
+    created_at = [datetime(2021, 3, day, tzinfo=timezone.utc) for day in range(1, 8)]
+    for operation_index, day in enumerate(created_at, start=1):
+        backend.add_history(account_id, AccountRecord.DEPOSIT, operation_index * 10, operation_index, day)
+
+    yield account_id, created_at
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', ['django'], indirect=True)
+def test_iter_account_history_pages(long_history, django_assert_num_queries):
+    account_id, created_at = long_history
+    repo = DjangoAccountRepo()
+
+    with django_assert_num_queries(3):
+        records = list(repo.iter_account_history(account_id, page_size=3))
+
+    assert [record.record_index for record in records] == list(range(1, 8))
+    assert [record.balance for record in records] == [index * 10 for index in range(1, 8)]
+    assert records[0].time_at == created_at[0]
+
+
+@pytest.mark.django_db
+def test_iter_account_history_filters(backend, long_history):
+    account_id, created_at = long_history
+    repo = backend.repo()
+
+    records = repo.iter_account_history(account_id, since=created_at[1], until=created_at[5], page_size=2)
+    assert [record.record_index for record in records] == [2, 3, 4, 5]
+
+    records = repo.iter_account_history(account_id, after_index=5, page_size=2)
+    assert [record.record_index for record in records] == [6, 7]
@@ -0,0 +1,126 @@
+import pytest
+
+from account.adaptors.card_cache import CachedAccountRepo, CardCache
+from account.entity import Card
+from account.service.unit_of_work import DjangoUnitOfWork
+from atmdjango.atm_app.models import BankCard
+from tests.conftest import FakeAccountRepo
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingAccountRepo(FakeAccountRepo):
+    def __init__(self, cards):
+        super().__init__(cards=cards, accounts=[], raise_update_failure=False)
+        self.card_loads = 0
+
+    def get_card(self, card_num: int):
+        self.card_loads += 1
+        return super().get_card(card_num)
+
+
+def setup_cache_test(**cache_kwargs):
+    clock = FakeClock()
+    cards = [Card(card_num=card_num, user_id=card_num * 10, pin_salt_hash=f'hash-{card_num}') for card_num in (1, 2, 3)]
+    repo = CountingAccountRepo(cards)
+    cache = CardCache(clock=clock, **cache_kwargs)
+    return clock, repo, cache, CachedAccountRepo(repo, cache)
+
+
+def test_cached_card_lookup():
+    clock, repo, cache, cached_repo = setup_cache_test()
+
+    for _ in range(5):
+        card = cached_repo.get_card(1)
+        assert card.user_id == 10
+        assert card.pin_salt_hash == 'hash-1'
+
+    assert repo.card_loads == 1
+    assert cache.stats() == dict(size=1, hits=4, misses=1, evictions=0)
+
+
+def test_missing_card_is_not_cached():
+    clock, repo, cache, cached_repo = setup_cache_test()
+
+    assert cached_repo.get_card(99) is None
+    assert cached_repo.get_card(99) is None
+    assert repo.card_loads == 2
+
+
+def test_card_ttl():
+    clock, repo, cache, cached_repo = setup_cache_test(ttl_seconds=10)
+
+    cached_repo.get_card(1)
+    clock.now = 9
+    cached_repo.get_card(1)
+    assert repo.card_loads == 1
+
+    clock.now = 10
+    cached_repo.get_card(1)
+    assert repo.card_loads == 2
+
+
+def test_card_lru_eviction():
+    clock, repo, cache, cached_repo = setup_cache_test(max_size=2)
+
+    cached_repo.get_card(1)
+    cached_repo.get_card(2)
+    cached_repo.get_card(1)
+    cached_repo.get_card(3)
+
+    assert cache.stats()['evictions'] == 1
+    cached_repo.get_card(1)
+    assert repo.card_loads == 3
+    cached_repo.get_card(2)
+    assert repo.card_loads == 4
+
+
+def test_pin_change_invalidates_card():
+    clock, repo, cache, cached_repo = setup_cache_test()
+
+    cached_repo.get_card(1)
+    cached_repo.update_card_pin_hash(1, 'new-hash')
+
+    assert cached_repo.get_card(1).pin_salt_hash == 'new-hash'
+    assert repo.card_loads == 2
+
+
+def test_pin_change_invalidates_card_on_commit():
+    clock, repo, cache, _ = setup_cache_test()
+    after_commit = []
+    cached_repo = CachedAccountRepo(repo, cache, on_commit=after_commit.append)
+
+    cached_repo.get_card(1)
+    cached_repo.update_card_pin_hash(1, 'new-hash')
+    # a read before the commit is served from the cache and does not re-cache the old hash
+    assert cached_repo.get_card(1).pin_salt_hash == 'hash-1'
+    assert repo.card_loads == 1
+
+    for callback in after_commit:
+        callback()
+
+    assert cached_repo.get_card(1).pin_salt_hash == 'new-hash'
+    assert repo.card_loads == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unit_of_work_invalidates_card_after_commit():
+    BankCard.objects.create(card_number=5, user_id=50, pin_hash='old-hash')
+    cache = CardCache()
+    uow = DjangoUnitOfWork(card_cache=cache)
+
+    with uow:
+        assert uow.account_data.get_card(5).pin_salt_hash == 'old-hash'
+        uow.account_data.update_card_pin_hash(5, 'new-hash')
+        assert cache.get(5) is not None
+        uow.commit()
+
+    assert cache.get(5) is None
+    with uow:
+        assert uow.account_data.get_card(5).pin_salt_hash == 'new-hash'
@@ -0,0 +1,196 @@
+import pytest
+from django.db import OperationalError
+
+from account.adaptors import db_connections
+from account.adaptors.account_repo import ReplicaAccountRepo
+from account.adaptors.db_connections import ConnectionManager, get_connection_manager
+from account.entity import Account, Card
+from account.service.unit_of_work import DjangoUnitOfWork, ReadOnlyUnitOfWork
+from tests.conftest import FakeAccountRepo
+
+
+class FakeConnection:
+    def __init__(self, max_age=600):
+        self.settings_dict = dict(CONN_MAX_AGE=max_age)
+        self.connection = None
+        self.errors_occurred = False
+        self.usable = True
+        self.fail_connect = False
+        self.opened = 0
+
+    def ensure_connection(self):
+        if self.connection is None:
+            if self.fail_connect:
+                raise OperationalError('can not connect')
+
+            self.opened += 1
+            self.connection = object()
+
+    def is_usable(self):
+        return self.usable
+
+    def close(self):
+        self.connection = None
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    fake_connection = FakeConnection()
+    monkeypatch.setattr(db_connections, 'connections', dict(default=fake_connection))
+    return fake_connection
+
+
+class RecordingManager:
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+
+    def checkout(self):
+        self.checkouts += 1
+
+    def checkin(self):
+        self.checkins += 1
+
+
+class RecentUsers:
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+
+    def is_recent(self, user_id):
+        return user_id in self.user_ids
+
+
+def test_connection_is_reused(connection):
+    manager = ConnectionManager(ping_after_idle=30, clock=FakeClock())
+    for _ in range(3):
+        manager.checkout()
+        manager.checkin()
+
+    assert connection.opened == 1
+    assert manager.stats() == dict(connects=1, reuses=2, pings=0, recycles=0, failures=0)
+
+
+def test_connection_older_than_max_age_is_recycled(connection):
+    clock = FakeClock()
+    manager = ConnectionManager(ping_after_idle=1000, clock=clock)
+    manager.checkout()
+    manager.checkin()
+
+    clock.now += 599
+    manager.checkout()
+    manager.checkin()
+    clock.now += 1
+    manager.checkout()
+
+    assert connection.opened == 2
+    assert manager.stats() == dict(connects=2, reuses=1, pings=0, recycles=1, failures=0)
+
+
+def test_idle_connection_is_pinged(connection):
+    clock = FakeClock()
+    manager = ConnectionManager(ping_after_idle=30, clock=clock)
+    manager.checkout()
+    manager.checkin()
+
+    clock.now += 30
+    manager.checkout()
+    manager.checkin()
+    assert connection.opened == 1
+
+    clock.now += 30
+    connection.usable = False
+    manager.checkout()
+
+    assert connection.opened == 2
+    assert manager.stats() == dict(connects=2, reuses=1, pings=2, recycles=0, failures=1)
+
+
+def test_connection_is_closed_after_error(connection):
+    manager = ConnectionManager(ping_after_idle=30, clock=FakeClock())
+    manager.checkout()
+    connection.errors_occurred = True
+    connection.usable = False
+    manager.checkin()
+
+    assert connection.connection is None
+    connection.usable = True
+    manager.checkout()
+    assert manager.stats() == dict(connects=2, reuses=0, pings=0, recycles=0, failures=1)
+
+
+def test_connect_failure_is_counted(connection):
+    manager = ConnectionManager(clock=FakeClock())
+    connection.fail_connect = True
+    with pytest.raises(OperationalError):
+        manager.checkout()
+
+    assert manager.stats()['failures'] == 1
+
+
+def test_max_age_from_settings(connection):
+    assert ConnectionManager().max_age == 600
+    connection.settings_dict['CONN_MAX_AGE'] = None
+    assert ConnectionManager().max_age == float('inf')
+    assert ConnectionManager(max_age=5).max_age == 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unit_of_work_checks_out_connection():
+    manager = ConnectionManager(max_age=600)
+    uow = DjangoUnitOfWork(connection_manager=manager)
+    for _ in range(2):
+        with uow:
+            uow.account_data.get_card(1)
+
+    assert manager.stats()['reuses'] == 2
+
+
+def test_connection_manager_per_alias(monkeypatch):
+    connections = dict(default=FakeConnection(), replica=FakeConnection(max_age=60))
+    monkeypatch.setattr(db_connections, 'connections', connections)
+    monkeypatch.setattr(db_connections, '_connection_managers', dict())
+
+    assert get_connection_manager() is get_connection_manager('default')
+    replica_manager = get_connection_manager('replica')
+    assert replica_manager is not get_connection_manager()
+    assert replica_manager.max_age == 60
+
+    replica_manager.checkout()
+    assert connections['replica'].opened == 1
+    assert connections['default'].opened == 0
+
+
+def test_read_only_unit_of_work_checks_out_aliases_it_reads_from():
+    managers = dict(replica=RecordingManager())
+    managers[None] = RecordingManager()
+    fake_repo = FakeAccountRepo(
+        cards=[Card(card_num=70, user_id=7, pin_salt_hash='hash')],
+        accounts=[Account(account_id=1, user_id=7, name='checking', histories=[])]
+    )
+
+    class FakeReadOnlyUnitOfWork(ReadOnlyUnitOfWork):
+        def get_data_repo(self):
+            return ReplicaAccountRepo(fake_repo, self.replica_alias, RecentUsers({7}), checkout=self._checkout)
+
+    uow = FakeReadOnlyUnitOfWork(replica_alias='replica', connection_managers=managers.__getitem__)
+    with uow:
+        uow.account_data.get_card(70)
+        uow.account_data.get_card(70)
+
+    assert (managers['replica'].checkouts, managers['replica'].checkins) == (1, 1)
+    assert managers[None].checkouts == 0
+
+    with uow:
+        uow.account_data.get_card(70)
+        uow.account_data.get_user_accounts(7)
+
+    assert (managers['replica'].checkouts, managers['replica'].checkins) == (2, 2)
+    assert (managers[None].checkouts, managers[None].checkins) == (1, 1)
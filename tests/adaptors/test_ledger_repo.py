@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from account.adaptors.ledger import ENTRY_HEADER, MAGIC, LedgerCorrupted, LedgerFailed, LedgerStore
+from account.adaptors.ledger_repo import LedgerAccountRepo
+from account.entity import Account, Card
+from account.service import handler
+from account.service.service_exceptions import AccountHistoryIntegrityError
+from account.service.unit_of_work import LedgerUnitOfWork
+from account.value_objects import AccountRecord
+from tests.conftest import FakeSessionmanager
+
+
+@pytest.fixture
+def ledger_path(tmp_path):
+    return str(tmp_path / 'accounts.ledger')
+
+
+@pytest.fixture
+def store(ledger_path):
+    ledger_store = LedgerStore(ledger_path, grow_bytes=4096)
+    yield ledger_store
+    ledger_store.close()
+
+
+def reopen(store):
+    store.close()
+    return LedgerStore(store.ledger.path, grow_bytes=4096)
+
+
+@pytest.fixture
+def account_with_history(store):
+    user_id = 185
+    account_name = 'bankrupt'
+    last_record_index = 38271
+    balance = 37273
+    last_operation = AccountRecord.DEPOSIT
+    account_id = store.add_account(user_id, account_name)
+    LedgerAccountRepo(store).update_account(_with_new_records(account_id, user_id, account_name, [
+        AccountRecord(action=last_operation, balance=balance, record_index=last_record_index)
+    ]))
+
+    yield user_id, account_id, last_record_index, account_name, balance, last_operation
+
+
+def _with_new_records(account_id, user_id, name, records):
+    account = Account(account_id=account_id, user_id=user_id, name=name, histories=[])
+    account.new_histories = records
+    return account
+
+
+def test_writes_survive_reopen(store):
+    store.add_card(17, 38282, 'Showmethemoney')
+    repo = LedgerAccountRepo(store)
+    repo.update_card_pin_hash(17, 'new-hash', previous_pin_hash='Showmethemoney')
+    account_id = store.add_account(822, 'France is Bacon')
+    repo.update_account(_with_new_records(account_id, 822, 'France is Bacon', [
+        AccountRecord(action=AccountRecord.DEPOSIT, balance=5000, record_index=40),
+        AccountRecord(action=AccountRecord.WITHDRAWAL, balance=400, record_index=41, time_at=datetime.utcnow())
+    ]))
+
+    reopened = LedgerAccountRepo(reopen(store))
+    assert reopened.get_card(17).pin_salt_hash == 'new-hash'
+    assert reopened.get_user_account(822, account_id).get_balance() == 400
+    records = list(reopened.iter_account_history(account_id))
+    assert [(record.record_index, record.action, record.balance) for record in records] == [
+        (40, AccountRecord.DEPOSIT, 5000), (41, AccountRecord.WITHDRAWAL, 400)
+    ]
+    assert all(record.time_at.tzinfo is not None for record in records)
+
+
+def test_unit_of_work_commit_and_rollback(store, account_with_history):
+    user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
+    uow = LedgerUnitOfWork(store)
+
+    with uow:
+        account = uow.account_data.get_user_account(user_id, account_id)
+        account.deposit(5)
+        uow.account_data.update_account(account)
+
+    assert LedgerAccountRepo(store).get_user_account(user_id, account_id).get_balance() == balance
+
+    with uow:
+        account = uow.account_data.get_user_account(user_id, account_id)
+        account.withdraw(7)
+        uow.account_data.update_account(account)
+        uow.commit()
+
+    assert LedgerAccountRepo(reopen(store)).get_user_account(user_id, account_id).get_balance() == balance - 7
+
+
+def test_unit_of_work_conflict_on_commit(store, account_with_history):
+    user_id, account_id, last_record_index, account_name, balance, last_operation = account_with_history
+    first, second = LedgerUnitOfWork(store), LedgerUnitOfWork(store)
+
+    with first, second:
+        for uow, amount in ((first, 1), (second, 2)):
+            account = uow.account_data.get_user_account(user_id, account_id)
+            account.deposit(amount)
+            uow.account_data.update_account(account)
+
+        first.commit()
+        with pytest.raises(AccountHistoryIntegrityError):
+            second.commit()
+
+    assert LedgerAccountRepo(store).get_user_account(user_id, account_id).get_balance() == balance + 1
+
+
+def test_handlers_on_ledger(store):
+    store.add_card(5555, 12, Card.make_pin_hash('1234'))
+    account_id = store.add_account(12, 'kiosk')
+    LedgerAccountRepo(store).update_account(_with_new_records(account_id, 12, 'kiosk', [
+        AccountRecord(action=AccountRecord.DEPOSIT, balance=0, record_index=1)
+    ]))
+    session_manager = FakeSessionmanager()
+    uow = LedgerUnitOfWork(store)
+
+    session_key = handler.set_session(card_num=5555, pin='1234', uow=uow, session_manager=session_manager)
+    for amount in (100, 50):
+        handler.account_action(
+            session_key=session_key, account_id=account_id, action=AccountRecord.DEPOSIT, amount=amount,
+            card_num=5555, uow=uow, session_manager=session_manager
+        )
+    accounts = handler.get_accounts(session_key=session_key, card_num=5555, uow=uow, session_manager=session_manager)
+
+    assert [account.get_balance() for account in accounts] == [150]
+    history = LedgerAccountRepo(reopen(store)).iter_account_history(account_id)
+    assert [record.balance for record in history] == [0, 100, 150]
+
+
+def test_recovery_drops_torn_commit(store, ledger_path):
+    account_id = store.add_account(1, 'torn')
+    repo = LedgerAccountRepo(store)
+    for index in (1, 2):
+        repo.update_account(_with_new_records(account_id, 1, 'torn', [
+            AccountRecord(action=AccountRecord.DEPOSIT, balance=index, record_index=index)
+        ]))
+    end = store.ledger.size
+    store.close()
+
+    # flip the last byte of the last entry, as if the crash hit while it was written
+    with open(ledger_path, 'r+b') as ledger_file:
+        ledger_file.seek(end - 1)
+        last_byte = ledger_file.read(1)
+        ledger_file.seek(end - 1)
+        ledger_file.write(bytes([last_byte[0] ^ 0xff]))
+
+    recovered = LedgerStore(ledger_path, grow_bytes=4096)
+    recovered_repo = LedgerAccountRepo(recovered)
+    assert [record.balance for record in recovered_repo.iter_account_history(account_id)] == [1]
+
+    recovered_repo.update_account(_with_new_records(account_id, 1, 'torn', [
+        AccountRecord(action=AccountRecord.DEPOSIT, balance=3, record_index=2)
+    ]))
+    assert [record.balance for record in LedgerAccountRepo(reopen(recovered)).iter_account_history(account_id)] == [1, 3]
+
+
+def test_ledger_grows_and_groups_fsync(store, monkeypatch):
+    account_id = store.add_account(1, 'busy')
+    repo = LedgerAccountRepo(store)
+    repo.update_account(_with_new_records(account_id, 1, 'busy', [
+        AccountRecord(action=AccountRecord.DEPOSIT, balance=0, record_index=1)
+    ]))
+    syncs_before = store.ledger.syncs
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        # a real disk takes milliseconds, commits arriving meanwhile have to share the next fsync
+        time.sleep(0.002)
+        fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+
+    def deposit(start):
+        for index in range(start, start + 400, 4):
+            account = repo.get_user_account(1, account_id)
+            while True:
+                account.deposit(1)
+                try:
+                    repo.update_account(account)
+                    break
+                except AccountHistoryIntegrityError:
+                    account = repo.get_user_account(1, account_id)
+
+    threads = [threading.Thread(target=deposit, args=(start,)) for start in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.ledger.size > 4096
+    # 400 commits from 4 threads, one fsync each would be 400
+    assert store.ledger.syncs - syncs_before < 250
+    reopened = LedgerAccountRepo(reopen(store))
+    assert reopened.get_user_account(1, account_id).get_balance() == 400
+    assert len(list(reopened.iter_account_history(account_id))) == 401
+
+
+def test_failed_fsync_poisons_store(store, monkeypatch):
+    account_id = store.add_account(1, 'unlucky')
+    repo = LedgerAccountRepo(store)
+    fsync = os.fsync
+
+    def failing_fsync(fd):
+        raise OSError(5, 'Input/output error')
+
+    monkeypatch.setattr(os, 'fsync', failing_fsync)
+    with pytest.raises(LedgerFailed):
+        repo.update_account(_with_new_records(account_id, 1, 'unlucky', [
+            AccountRecord(action=AccountRecord.DEPOSIT, balance=10, record_index=1)
+        ]))
+
+    # a later fsync may succeed without the lost pages, the store stays unusable
+    monkeypatch.setattr(os, 'fsync', fsync)
+    with pytest.raises(LedgerFailed):
+        repo.get_user_account(1, account_id)
+    with pytest.raises(LedgerFailed):
+        repo.get_card(1)
+    with pytest.raises(LedgerFailed):
+        store.add_account(1, 'another')
+
+    reopened = LedgerAccountRepo(reopen(store))
+    assert reopened.get_user_account(1, account_id).name == 'unlucky'
+
+
+def test_rejects_foreign_file(ledger_path):
+    with open(ledger_path, 'wb') as foreign_file:
+        foreign_file.write(b'not a ledger' + bytes(ENTRY_HEADER.size + len(MAGIC)))
+
+    with pytest.raises(LedgerCorrupted):
+        LedgerStore(ledger_path)
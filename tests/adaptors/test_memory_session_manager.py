@@ -0,0 +1,93 @@
+import threading
+
+from account.adaptors.memory_session_manager import InMemorySessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_session():
+    session_manager = InMemorySessionManager()
+    session_key = session_manager.set_session(1)
+
+    assert session_manager.session_exp_seconds == 120
+    assert session_manager.validate_user_session(1, session_key)
+    assert not session_manager.validate_user_session(1, session_key + 'a')
+    assert not session_manager.validate_user_session(2, session_key)
+
+
+def test_login_replaces_session():
+    session_manager = InMemorySessionManager()
+    old_key = session_manager.set_session(1)
+    new_key = session_manager.set_session(1)
+
+    assert not session_manager.validate_user_session(1, old_key)
+    assert session_manager.validate_user_session(1, new_key)
+
+
+def test_session_expiration_and_extension():
+    clock = FakeClock()
+    session_manager = InMemorySessionManager(session_exp_seconds=30, clock=clock)
+    session_key = session_manager.set_session(1)
+
+    clock.now += 20
+    assert session_manager.validate_and_extend(1, session_key)
+    clock.now += 20
+    assert session_manager.validate_user_session(1, session_key)
+    clock.now += 10
+    assert not session_manager.validate_user_session(1, session_key)
+
+    # like EXPIRE on a missing key, extending an expired session does not revive it
+    session_manager.extend_session(1)
+    assert not session_manager.validate_user_session(1, session_key)
+    assert not session_manager.validate_and_extend(1, session_key)
+
+
+def test_expired_sessions_are_removed():
+    clock = FakeClock()
+    session_manager = InMemorySessionManager(session_exp_seconds=30, clock=clock)
+    for user_id in range(5000):
+        session_manager.set_session(user_id)
+    for _ in range(3):
+        session_manager.extend_sessions(range(5000))
+
+    clock.now += 31
+    session_manager.set_session(1)
+
+    assert session_manager.stats() == dict(sessions=1, heap=1, expired=5000)
+
+
+def test_heap_stays_bounded_under_extensions():
+    clock = FakeClock()
+    session_manager = InMemorySessionManager(session_exp_seconds=30, clock=clock)
+    session_key = session_manager.set_session(1)
+    for _ in range(10000):
+        clock.now += 0.001
+        assert session_manager.validate_and_extend(1, session_key)
+
+    assert session_manager.stats()['heap'] <= 2 * 1 + 1024 + 1
+
+
+def test_concurrent_sessions():
+    session_manager = InMemorySessionManager()
+    failures = []
+
+    def run(offset):
+        for user_id in range(offset, offset + 500):
+            session_key = session_manager.set_session(user_id)
+            if not session_manager.validate_and_extend(user_id, session_key):
+                failures.append(user_id)
+
+    threads = [threading.Thread(target=run, args=(offset,)) for offset in range(0, 4000, 500)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert session_manager.stats()['sessions'] == 4000
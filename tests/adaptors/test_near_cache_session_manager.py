@@ -0,0 +1,145 @@
+import fakeredis
+
+from account.adaptors.near_cache_session_manager import NearCacheSessionManager
+from account.adaptors.session_manager import RedisSessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingSessionManager(RedisSessionManager):
+    def __init__(self, **kwargs):
+        super().__init__(redis_cls=fakeredis.FakeStrictRedis, **kwargs)
+        self.validations = 0
+        self.extension_batches = []
+
+    def validate_user_session(self, user_id, session_key):
+        self.validations += 1
+        return super().validate_user_session(user_id, session_key)
+
+    def validate_and_extend(self, user_id, session_key):
+        self.validations += 1
+        return super().validate_and_extend(user_id, session_key)
+
+    def extend_sessions(self, user_ids):
+        self.extension_batches.append(set(user_ids))
+        super().extend_sessions(user_ids)
+
+
+def make_cache(**kwargs):
+    backend = CountingSessionManager(session_exp_seconds=120)
+    clock = FakeClock()
+    return NearCacheSessionManager(backend, staleness_seconds=1, clock=clock, **kwargs), backend, clock
+
+
+def test_validation_is_served_locally_within_staleness():
+    cache, backend, clock = make_cache()
+    session_key = cache.set_session(1)
+
+    for _ in range(5):
+        assert cache.validate_user_session(1, session_key)
+
+    assert backend.validations == 0
+    assert not cache.validate_user_session(1, session_key + 'a')
+    assert backend.validations == 1
+    assert cache.stats()['hits'] == 5
+
+
+def test_stale_entry_notices_login_elsewhere():
+    cache, backend, clock = make_cache()
+    session_key = cache.set_session(1)
+    backend.set_session(1)
+
+    assert cache.validate_user_session(1, session_key)
+    clock.now += 1
+    assert not cache.validate_user_session(1, session_key)
+    assert not cache.validate_user_session(1, session_key)
+    assert backend.validations == 2
+
+
+def test_rejected_key_keeps_valid_session_and_extension():
+    cache, backend, clock = make_cache(flush_interval=10)
+    session_key = cache.set_session(9004)
+    assert cache.validate_and_extend(9004, session_key)
+
+    assert not cache.validate_user_session(9004, 'forged')
+    assert not cache.validate_and_extend(9004, 'forged')
+
+    assert cache.validate_user_session(9004, session_key)
+    assert backend.validations == 2
+    assert cache.stats()['pending_extensions'] == 1
+
+
+def test_extensions_are_batched_by_interval():
+    cache, backend, clock = make_cache(flush_interval=0.5)
+    session_keys = {user_id: cache.set_session(user_id) for user_id in range(1, 4)}
+
+    for user_id, session_key in session_keys.items():
+        assert cache.validate_and_extend(user_id, session_key)
+
+    assert backend.extension_batches == []
+    assert cache.stats()['pending_extensions'] == 3
+
+    backend.redis.expire(1, 10)
+    clock.now += 0.5
+    assert cache.validate_and_extend(1, session_keys[1])
+
+    assert backend.extension_batches == [{1, 2, 3}]
+    assert backend.redis.ttl(1) > 10
+    assert cache.stats()['pending_extensions'] == 0
+
+
+def test_extensions_are_batched_by_size():
+    cache, backend, clock = make_cache(max_pending=2)
+    session_keys = {user_id: cache.set_session(user_id) for user_id in range(1, 4)}
+
+    for user_id, session_key in session_keys.items():
+        cache.validate_and_extend(user_id, session_key)
+
+    assert backend.extension_batches == [{1, 2}]
+    cache.flush()
+    assert backend.extension_batches == [{1, 2}, {3}]
+
+
+def test_failed_batch_stays_pending():
+    cache, backend, clock = make_cache(max_pending=1)
+    session_key = cache.set_session(1)
+
+    def fail(user_ids):
+        raise ConnectionError('redis is down')
+
+    backend.extend_sessions = fail
+    assert cache.validate_and_extend(1, session_key)
+    assert cache.stats()['pending_extensions'] == 1
+
+
+def test_keyspace_event_invalidates_cached_session():
+    cache, backend, clock = make_cache()
+    session_key = cache.set_session(7)
+
+    cache.handle_keyspace_event(dict(channel=b'__keyspace@0__:7', data=b'expire'))
+    assert cache.validate_user_session(7, session_key)
+    assert backend.validations == 0
+
+    backend.redis.delete(7)
+    cache.handle_keyspace_event(dict(channel=b'__keyspace@0__:7', data=b'del'))
+    assert not cache.validate_user_session(7, session_key)
+    assert backend.validations == 1
+
+
+def test_redis_extend_sessions():
+    session_manager = RedisSessionManager(redis_cls=fakeredis.FakeStrictRedis, session_exp_seconds=120)
+    for user_id in (9001, 9002):
+        session_manager.set_session(user_id)
+        session_manager.redis.expire(user_id, 5)
+
+    session_manager.extend_sessions([9001, 9002, 9003])
+
+    assert session_manager.redis.ttl(9001) > 5
+    assert session_manager.redis.ttl(9002) > 5
+    assert not session_manager.redis.exists(9003)
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+
+from account.adaptors.pin_verifier import ProcessPoolPinVerifier
+from account.entity import Card
+from account.service.service_exceptions import PinVerificationBusy
+
+
+@pytest.fixture
+def card_with_pin():
+    pin = '9021'
+    salt = uuid4().hex
+    yield Card(card_num=77, user_id=3, pin_salt_hash=salt + Card.hash_pin(pin, salt)), pin
+
+
+def test_process_pool_verifier(card_with_pin):
+    card, pin = card_with_pin
+    verifier = ProcessPoolPinVerifier(max_workers=2)
+    try:
+        assert verifier.verify(card, pin)
+        assert not verifier.verify(card, pin + '0')
+    finally:
+        verifier.shutdown()
+
+
+def test_verifier_queue_bound(card_with_pin):
+    card, pin = card_with_pin
+    verifier = ProcessPoolPinVerifier(max_workers=1, max_pending=1, wait_timeout=0, executor_cls=ThreadPoolExecutor)
+    try:
+        # occupy the only pending slot
+        verifier._pending_slots.acquire()
+        with pytest.raises(PinVerificationBusy):
+            verifier.verify(card, pin)
+
+        verifier._pending_slots.release()
+        assert verifier.verify(card, pin)
+    finally:
+        verifier.shutdown()
@@ -0,0 +1,151 @@
+import time
+
+import fakeredis
+import pytest
+
+from account.adaptors.account_repo import ReplicaAccountRepo
+from account.adaptors.recent_writes import RecentWrites
+from account.entity import Account, Card
+from account.service import handler, service_exceptions
+from account.service.unit_of_work import DjangoUnitOfWork, ReadOnlyUnitOfWork
+from account.value_objects import AccountRecord
+from atmdjango.atm_app.models import AccountHistory, BankAccount, BankCard
+from atmdjango.atm_django.routers import ReplicaRouter, get_read_alias, read_from
+from tests.conftest import FakeAccountRepo, FakeSessionmanager
+
+
+class AliasRecordingRepo(FakeAccountRepo):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aliases = []
+
+    def get_card(self, card_num):
+        self.aliases.append(get_read_alias())
+        return super().get_card(card_num)
+
+    def get_user_accounts(self, user_id):
+        self.aliases.append(get_read_alias())
+        return super().get_user_accounts(user_id)
+
+    def iter_account_history(self, account_id, *args, **kwargs):
+        for record in super().iter_account_history(account_id, *args, **kwargs):
+            self.aliases.append(get_read_alias())
+            yield record
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+def make_recent_writes(server, window_seconds=5):
+    return RecentWrites(
+        window_seconds=window_seconds, redis_cls=lambda **kwargs: fakeredis.FakeStrictRedis(server=server)
+    )
+
+
+def test_router_reads_from_selected_alias():
+    router = ReplicaRouter()
+    assert router.db_for_read(BankCard) is None
+
+    with read_from('replica'):
+        assert router.db_for_read(BankCard) == 'replica'
+        assert router.db_for_write(BankCard) == 'default'
+        with read_from(None):
+            assert router.db_for_read(BankCard) is None
+
+        assert router.db_for_read(BankCard) == 'replica'
+
+    assert router.db_for_read(BankCard) is None
+    assert router.allow_migrate('replica', 'atm_app') is False
+
+
+def test_recent_writes_are_shared_and_expire(redis_server):
+    recent = make_recent_writes(redis_server, window_seconds=0.05)
+    recent.record([1, 2])
+
+    # another worker sees the marks through the same Redis
+    other_worker = make_recent_writes(redis_server, window_seconds=0.05)
+    assert other_worker.is_recent(1)
+    assert not other_worker.is_recent(3)
+
+    time.sleep(0.1)
+    assert not other_worker.is_recent(1)
+
+
+def test_recent_writes_fall_back_to_primary_without_redis(redis_server):
+    recent = make_recent_writes(redis_server)
+    redis_server.connected = False
+
+    recent.record([1])
+    assert recent.is_recent(1)
+    assert recent.stats() == dict(failures=2)
+
+
+def test_replica_repo_reads_primary_after_recent_write(redis_server):
+    recent = make_recent_writes(redis_server, window_seconds=0.05)
+    account = Account(
+        account_id=1, user_id=7, name='checking',
+        histories=[AccountRecord(action=AccountRecord.DEPOSIT, balance=10, record_index=1)]
+    )
+    fake_repo = AliasRecordingRepo(cards=[Card(card_num=70, user_id=7, pin_salt_hash='hash')], accounts=[account])
+    repo = ReplicaAccountRepo(fake_repo, 'replica', recent)
+
+    repo.get_card(70)
+    repo.get_user_accounts(7)
+    recent.record([7])
+    repo.get_user_accounts(7)
+    repo.get_card(70)
+    list(repo.iter_account_history(1))
+    time.sleep(0.1)
+    repo.get_user_accounts(7)
+
+    assert fake_repo.aliases == ['replica', 'replica', None, 'replica', 'replica', 'replica']
+    assert get_read_alias() is None
+
+    with pytest.raises(service_exceptions.ReadOnlyRepository):
+        repo.update_account(account)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unit_of_work_records_recent_writes_after_commit(redis_server):
+    account = BankAccount.objects.create(user_id=4242, account_name='fresh')
+    AccountHistory.objects.create(account_id=account.id, account_balance=5, operation='deposit', operation_index=1)
+    recent = make_recent_writes(redis_server)
+    uow = DjangoUnitOfWork(recent_writes=recent)
+
+    with uow:
+        user_account = uow.account_data.get_user_account(4242, account.id)
+        user_account.deposit(3)
+        uow.account_data.update_account(user_account)
+
+    # rolled back writes are not marked
+    assert not recent.is_recent(4242)
+
+    with uow:
+        user_account = uow.account_data.get_user_account(4242, account.id)
+        user_account.deposit(3)
+        uow.account_data.update_account(user_account)
+        assert not recent.is_recent(4242)
+        uow.commit()
+
+    assert recent.is_recent(4242)
+
+
+@pytest.mark.django_db
+def test_get_accounts_with_read_only_unit_of_work():
+    BankCard.objects.create(card_number=4040, user_id=31, pin_hash='hash')
+    account = BankAccount.objects.create(user_id=31, account_name='savings')
+    AccountHistory.objects.create(
+        account_id=account.id, account_balance=77, operation='deposit', operation_index=1,
+    )
+    session_manager = FakeSessionmanager()
+    session_key = session_manager.set_session(31)
+
+    uow = ReadOnlyUnitOfWork()
+    accounts = handler.get_accounts(session_key=session_key, card_num=4040, uow=uow, session_manager=session_manager)
+
+    assert [user_account.get_balance() for user_account in accounts] == [77]
+    with pytest.raises(service_exceptions.ReadOnlyRepository):
+        with uow:
+            uow.commit()
@@ -1,8 +1,14 @@
+import asyncio
 from time import sleep
 
 import fakeredis
+import fakeredis.aioredis
+import pytest
 
-from account.adaptors.session_manager import RedisSessionManager
+from account.adaptors.async_session_manager import AsyncRedisSessionManager
+from account.adaptors.session_manager import (
+    RedisSessionManager, disconnect_connection_pools, get_connection_pool, get_pool_stats
+)
 
 
 def test_session():
@@ -28,3 +34,64 @@ def test_session_expiration():
 
     sleep(1)
     assert not session_manager.validate_user_session(user_id, session_key)
+
+
+def test_validate_and_extend():
+    session_manager = RedisSessionManager(redis_cls=fakeredis.FakeStrictRedis, session_exp_seconds=30)
+    user_id = 323232
+    session_key = session_manager.set_session(user_id)
+    session_manager.redis.expire(str(user_id), 5)
+
+    assert session_manager.validate_and_extend(user_id, session_key)
+    assert session_manager.redis.ttl(str(user_id)) > 5
+
+
+def test_validate_and_extend_wrong_key():
+    session_manager = RedisSessionManager(redis_cls=fakeredis.FakeStrictRedis, session_exp_seconds=30)
+    user_id = 323232
+    session_key = session_manager.set_session(user_id)
+    session_manager.redis.expire(str(user_id), 5)
+
+    assert not session_manager.validate_and_extend(user_id, session_key + 'a')
+    assert session_manager.redis.ttl(str(user_id)) <= 5
+    assert not session_manager.validate_and_extend(user_id + 1, session_key)
+
+
+@pytest.fixture
+def fake_redis_pool():
+    pool = get_connection_pool(
+        redis_host='fake-redis', max_connections=4,
+        connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer()
+    )
+    yield pool
+    disconnect_connection_pools()
+
+
+def test_shared_connection_pool(fake_redis_pool):
+    assert get_connection_pool(
+        redis_host='fake-redis', max_connections=4,
+        connection_class=fakeredis.FakeConnection, server=fake_redis_pool.connection_kwargs['server']
+    ) is fake_redis_pool
+    assert get_connection_pool(redis_host='other-redis') is not fake_redis_pool
+
+    user_id = 323232
+    session_key = RedisSessionManager(connection_pool=fake_redis_pool).set_session(user_id)
+    for _ in range(3):
+        assert RedisSessionManager(connection_pool=fake_redis_pool).validate_user_session(user_id, session_key)
+
+    assert get_pool_stats(fake_redis_pool) == dict(max_connections=4, created=1, available=1, in_use=0)
+
+
+def test_async_session():
+    session_manager = AsyncRedisSessionManager(redis_cls=fakeredis.aioredis.FakeRedis)
+    user_id = 323232
+
+    async def session_flow():
+        session_key = await session_manager.set_session(user_id)
+        return (
+            await session_manager.validate_user_session(user_id, session_key),
+            await session_manager.validate_and_extend(user_id, session_key),
+            await session_manager.validate_and_extend(user_id, session_key + 'a'),
+        )
+
+    assert asyncio.run(session_flow()) == (True, True, False)
@@ -0,0 +1,129 @@
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError
+
+from account.adaptors.sharded_session_manager import HashRing, ShardedRedisSessionManager
+
+NODES = ['redis-a:6379', 'redis-b:6379', 'redis-c:6379']
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeNodes:
+    def __init__(self):
+        self.servers = dict()
+
+    def __call__(self, host, port=6379):
+        server = self.servers.setdefault(f'{host}:{port}', fakeredis.FakeServer())
+        return fakeredis.FakeStrictRedis(server=server)
+
+
+def make_manager(nodes=NODES):
+    fake_nodes = FakeNodes()
+    clock = FakeClock()
+    session_manager = ShardedRedisSessionManager(
+        nodes=nodes, redis_cls=fake_nodes, health_check_interval=5, clock=clock
+    )
+    return session_manager, fake_nodes, clock
+
+
+def test_ring_spreads_keys():
+    ring = HashRing(NODES)
+    owners = [ring.node_for(str(user_id)) for user_id in range(3000)]
+
+    for node in NODES:
+        assert 700 < owners.count(node) < 1300
+
+
+def test_ring_moves_few_keys_on_add_and_remove():
+    ring = HashRing(NODES)
+    before = {user_id: ring.node_for(str(user_id)) for user_id in range(3000)}
+
+    ring.add('redis-d:6379')
+    after = {user_id: ring.node_for(str(user_id)) for user_id in range(3000)}
+    moved = [user_id for user_id in before if before[user_id] != after[user_id]]
+    assert all(after[user_id] == 'redis-d:6379' for user_id in moved)
+    assert len(moved) < 1000
+
+    ring.remove('redis-d:6379')
+    assert {user_id: ring.node_for(str(user_id)) for user_id in range(3000)} == before
+
+
+def test_sessions_are_stored_on_their_node():
+    session_manager, fake_nodes, clock = make_manager()
+    for user_id in range(30):
+        session_key = session_manager.set_session(user_id)
+        assert session_manager.validate_and_extend(user_id, session_key)
+
+    keys = {node: len(fakeredis.FakeStrictRedis(server=server).keys()) for node, server in fake_nodes.servers.items()}
+    assert sum(keys.values()) == 30
+    assert all(count > 0 for count in keys.values())
+
+
+def test_failover_to_next_node():
+    session_manager, fake_nodes, clock = make_manager()
+    user_id = 42
+    primary = session_manager.node_for(user_id)
+    fake_nodes.servers[primary].connected = False
+
+    session_key = session_manager.set_session(user_id)
+    assert session_manager.validate_user_session(user_id, session_key)
+    assert session_manager.node_for(user_id) != primary
+    assert session_manager.stats() == dict(nodes=3, down=[primary], failovers=1)
+
+    # the node is checked again after the health check interval
+    fake_nodes.servers[primary].connected = True
+    assert session_manager.node_for(user_id) != primary
+    clock.now += 5
+    assert session_manager.node_for(user_id) == primary
+    assert session_manager.stats()['down'] == []
+
+
+def test_all_nodes_down():
+    session_manager, fake_nodes, clock = make_manager()
+    for server in fake_nodes.servers.values():
+        server.connected = False
+
+    with pytest.raises(ConnectionError):
+        session_manager.set_session(1)
+
+    assert session_manager.check_health() == {node: False for node in NODES}
+
+
+def test_add_node_keeps_most_sessions():
+    session_manager, fake_nodes, clock = make_manager()
+    session_keys = {user_id: session_manager.set_session(user_id) for user_id in range(300)}
+
+    session_manager.add_node('redis-d:6379')
+    valid = [user_id for user_id, key in session_keys.items() if session_manager.validate_user_session(user_id, key)]
+
+    assert 150 < len(valid) < 300
+
+
+def test_extend_sessions_over_nodes():
+    session_manager, fake_nodes, clock = make_manager()
+    for user_id in range(10):
+        session_manager.set_session(user_id)
+        session_manager.managers[session_manager.node_for(user_id)].redis.expire(str(user_id), 5)
+
+    session_manager.extend_sessions(range(10))
+
+    for user_id in range(10):
+        assert session_manager.managers[session_manager.node_for(user_id)].redis.ttl(str(user_id)) > 5
+
+
+def test_node_connections_time_out(monkeypatch):
+    monkeypatch.setenv('REDIS_NODE_TIMEOUT', '0.25')
+    session_manager = ShardedRedisSessionManager(nodes=['10.0.0.7:6390'])
+
+    connection_kwargs = session_manager.managers['10.0.0.7:6390'].redis.connection_pool.connection_kwargs
+    assert connection_kwargs['host'] == '10.0.0.7'
+    assert connection_kwargs['port'] == 6390
+    assert connection_kwargs['socket_timeout'] == 0.25
+    assert connection_kwargs['socket_connect_timeout'] == 0.25
@@ -0,0 +1,183 @@
+from functools import partial
+
+import fakeredis
+import pytest
+
+from account.adaptors.token_session_manager import SignedTokenSessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingRedis(fakeredis.FakeStrictRedis):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = 0
+
+    def execute_command(self, *args, **options):
+        self.commands += 1
+        return super().execute_command(*args, **options)
+
+
+@pytest.fixture
+def redis_cls():
+    return partial(CountingRedis, server=fakeredis.FakeServer())
+
+
+def make_manager(redis_cls, clock, **kwargs):
+    return SignedTokenSessionManager(
+        redis_cls=redis_cls, secret='test-secret', session_exp_seconds=120, refresh_seconds=1, clock=clock,
+        **kwargs
+    )
+
+
+def test_validation_does_not_use_redis(redis_cls):
+    clock = FakeClock()
+    session_manager = make_manager(redis_cls, clock)
+    session_key = session_manager.set_session(1)
+    session_manager.refresh()
+
+    commands = session_manager.redis.commands
+    for _ in range(10):
+        assert session_manager.validate_user_session(1, session_key)
+
+    assert session_manager.redis.commands == commands
+
+
+def test_invalid_tokens(redis_cls):
+    clock = FakeClock()
+    session_manager = make_manager(redis_cls, clock)
+    session_key = session_manager.set_session(1)
+
+    assert not session_manager.validate_user_session(2, session_key)
+    assert not session_manager.validate_user_session(1, session_key + 'a')
+    assert not session_manager.validate_user_session(1, 'not-a-token')
+
+    user_id, issued, expires, nonce, signature = session_key.split('.')
+    forged = '.'.join([user_id, issued, str(int(expires) + 600000), nonce, signature])
+    assert not session_manager.validate_user_session(1, forged)
+
+    other_secret = SignedTokenSessionManager(redis_cls=redis_cls, secret='other', clock=clock)
+    assert not other_secret.validate_user_session(1, session_key)
+
+
+@pytest.mark.parametrize('malformed', [
+    '', '.', '1.2.3', '1.2.3.4.\u00e9\u00e9', '\u00e9.\u00e9', '1.\ud800.3.4.sig', 'a' * 1000
+])
+def test_malformed_tokens_are_rejected(redis_cls, malformed):
+    session_manager = make_manager(redis_cls, FakeClock())
+    session_manager.set_session(1)
+
+    assert not session_manager.validate_user_session(1, malformed)
+    assert not session_manager.validate_and_extend(1, malformed)
+
+
+def test_session_expiration_and_extension(redis_cls):
+    clock = FakeClock()
+    session_manager = make_manager(redis_cls, clock)
+    session_key = session_manager.set_session(1)
+
+    clock.now += 100
+    assert session_manager.validate_and_extend(1, session_key)
+    clock.now += 100
+    assert session_manager.validate_user_session(1, session_key)
+    clock.now += 20
+    assert not session_manager.validate_user_session(1, session_key)
+
+
+def test_extension_is_seen_by_other_processes(redis_cls):
+    clock = FakeClock()
+    first = make_manager(redis_cls, clock)
+    second = make_manager(redis_cls, clock)
+    session_key = first.set_session(1)
+
+    clock.now += 100
+    first.extend_session(1)
+    clock.now += 30
+    assert second.validate_user_session(1, session_key)
+
+
+def test_login_supersedes_older_tokens(redis_cls):
+    clock = FakeClock()
+    first = make_manager(redis_cls, clock)
+    second = make_manager(redis_cls, clock)
+    old_key = first.set_session(1)
+    assert second.validate_user_session(1, old_key)
+
+    clock.now += 0.5
+    new_key = first.set_session(1)
+    assert not first.validate_user_session(1, old_key)
+    # the other process notices the login once it refreshes
+    assert second.validate_user_session(1, old_key)
+    clock.now += 1
+    assert not second.validate_user_session(1, old_key)
+    assert second.validate_user_session(1, new_key)
+
+
+def test_superseded_token_stays_rejected_while_new_session_is_extended(redis_cls):
+    clock = FakeClock()
+    first = make_manager(redis_cls, clock)
+    second = make_manager(redis_cls, clock)
+    old_key = first.set_session(1)
+    clock.now += 0.5
+    new_key = first.set_session(1)
+    assert not first.validate_user_session(1, old_key)
+
+    # keep the new session alive well past expiration plus clock skew of the login
+    for _ in range(13):
+        clock.now += 10
+        assert first.validate_user_session(1, new_key)
+        first.extend_session(1)
+
+    for session_manager in (first, second, make_manager(redis_cls, clock)):
+        session_manager.refresh()
+        assert not session_manager.validate_user_session(1, old_key)
+        assert session_manager.validate_user_session(1, new_key)
+
+    # once the extensions ended as well the login is dropped
+    clock.now += 126
+    first.refresh()
+    assert first.redis.zcard('session_tokens:logins') == 0
+    assert not first.validate_user_session(1, old_key)
+
+
+def test_revocation(redis_cls):
+    clock = FakeClock()
+    first = make_manager(redis_cls, clock)
+    second = make_manager(redis_cls, clock)
+    session_key = first.set_session(1)
+    other_key = first.set_session(2)
+
+    first.revoke(session_key)
+    clock.now += 1
+    assert not second.validate_user_session(1, session_key)
+    assert second.validate_user_session(2, other_key)
+
+    first.revoke_user(2)
+    clock.now += 1
+    assert not second.validate_user_session(2, other_key)
+
+
+def test_entries_are_dropped_once_unneeded(redis_cls):
+    clock = FakeClock()
+    session_manager = make_manager(redis_cls, clock)
+    for user_id in range(10):
+        session_manager.revoke(session_manager.set_session(user_id))
+
+    clock.now += 126
+    session_manager.refresh()
+
+    assert session_manager.stats() == dict(logins=0, extensions=0, revoked=0, refreshes=1)
+    assert session_manager.redis.zcard('session_tokens:logins') == 0
+    assert session_manager.redis.zcard('session_tokens:revoked') == 0
+
+
+def test_secret_is_required(redis_cls, monkeypatch):
+    monkeypatch.delenv('SESSION_TOKEN_SECRET', raising=False)
+    with pytest.raises(ValueError):
+        SignedTokenSessionManager(redis_cls=redis_cls)
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+from django.core.management import call_command
+
+from account.value_objects import AccountRecord
+from atmdjango.atm_app.models import AccountHistory, BankAccount
+
+
+@pytest.fixture
+def statements():
+    accounts = [
+        BankAccount.objects.create(user_id=user_id, account_name=name)
+        for user_id, name in [(5, 'salary'), (5, 'savings'), (6, 'travel')]
+    ]
+    for account in accounts:
+        for operation_index in range(1, 6):
+            AccountHistory.objects.create(
+                account_id=account.id,
+                operation=AccountRecord.DEPOSIT,
+                account_balance=operation_index * 100,
+                operation_index=operation_index
+            )
+            AccountHistory.objects.filter(account_id=account.id, operation_index=operation_index).update(
+                created_at=datetime(2021, 3, operation_index, tzinfo=timezone.utc)
+            )
+
+    yield accounts
+
+
+@pytest.mark.django_db
+def test_export_user_statements_csv(statements):
+    out = io.StringIO()
+    call_command('export_statements', user_id=5, chunk_size=2, stdout=out)
+
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert len(rows) == 10
+    assert {row['account_name'] for row in rows} == {'salary', 'savings'}
+    assert [row['operation_index'] for row in rows[:5]] == ['1', '2', '3', '4', '5']
+
+
+@pytest.mark.django_db
+def test_export_account_statement_jsonl_date_range(statements):
+    out = io.StringIO()
+    call_command(
+        'export_statements', account_ids=[statements[2].id], output_format='jsonl',
+        since=datetime(2021, 3, 2, tzinfo=timezone.utc), until=datetime(2021, 3, 4, tzinfo=timezone.utc),
+        stdout=out
+    )
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [row['operation_index'] for row in rows] == [2, 3]
+    assert rows[0]['account_name'] == 'travel'
+    assert rows[0]['balance'] == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_all_statements_with_workers(statements, tmp_path):
+    call_command('export_statements', all_accounts=True, workers=2, output=str(tmp_path))
+
+    for account in statements:
+        with open(tmp_path / f'{account.id}.csv') as statement:
+            assert len(list(csv.DictReader(statement))) == 5
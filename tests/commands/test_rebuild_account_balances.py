@@ -0,0 +1,67 @@
+import pytest
+from django.core.management import call_command
+
+from account.value_objects import AccountRecord
+from atmdjango.atm_app.models import AccountBalance, AccountHistory
+
+
+@pytest.fixture
+def account_histories():
+    balances = {
+        31: [(1, 100), (2, 70), (3, 90)],
+        32: [(5, 12)],
+    }
+    for account_id, records in balances.items():
+        for operation_index, balance in records:
+            AccountHistory.objects.create(
+                account_id=account_id,
+                operation=AccountRecord.DEPOSIT,
+                account_balance=balance,
+                operation_index=operation_index
+            )
+
+    yield {account_id: records[-1] for account_id, records in balances.items()}
+
+
+@pytest.mark.django_db
+def test_rebuild_account_balances(account_histories):
+    AccountBalance.objects.create(
+        account_id=31, account_balance=1, operation=AccountRecord.DEPOSIT, operation_index=1,
+        updated_at=AccountHistory.objects.first().created_at
+    )
+
+    call_command('rebuild_account_balances', chunk_size=1)
+
+    assert AccountBalance.objects.count() == len(account_histories)
+    for account_id, (operation_index, balance) in account_histories.items():
+        account_balance = AccountBalance.objects.get(account_id=account_id)
+        assert account_balance.operation_index == operation_index
+        assert account_balance.account_balance == balance
+
+
+@pytest.mark.django_db
+def test_rebuild_single_account(account_histories):
+    call_command('rebuild_account_balances', account_ids=[32])
+
+    assert list(AccountBalance.objects.values_list('account_id', flat=True)) == [32]
+
+
+@pytest.mark.django_db
+def test_rebuild_keeps_newer_snapshot(account_histories, monkeypatch):
+    AccountBalance.record_latest(AccountHistory.objects.filter(account_id=31))
+    record_latest = AccountBalance.record_latest
+
+    def record_after_concurrent_write(history_rows):
+        # an account action commits between the rebuild reading the history and writing the snapshot
+        newer = AccountHistory.objects.create(
+            account_id=31, operation=AccountRecord.WITHDRAWAL, account_balance=40, operation_index=4
+        )
+        record_latest([newer])
+        record_latest(history_rows)
+
+    monkeypatch.setattr(AccountBalance, 'record_latest', record_after_concurrent_write)
+    call_command('rebuild_account_balances', account_ids=[31])
+
+    account_balance = AccountBalance.objects.get(account_id=31)
+    assert account_balance.operation_index == 4
+    assert account_balance.account_balance == 40
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from account.entity import Account, Card, AccountRecord
 from account.adaptors.account_repo import AccountRepository
+from account.adaptors.async_session_manager import AsyncSessionManager
 from account.adaptors.session_manager import SessionManager
 from account.service.unit_of_work import UnitOfWork
 from account.service.service_exceptions import AccountHistoryIntegrityError
@@ -34,6 +35,20 @@ class FakeSessionmanager(SessionManager):
         self.session_expire_at[user_id] = datetime.utcnow() + timedelta(seconds=self.expire_seconds)
 
 
+class FakeAsyncSessionManager(AsyncSessionManager):
+    def __init__(self, expire_seconds=120):
+        self.session_manager = FakeSessionmanager(expire_seconds)
+
+    async def set_session(self, user_id: int) -> str:
+        return self.session_manager.set_session(user_id)
+
+    async def validate_user_session(self, user_id: int, session_key: str) -> bool:
+        return self.session_manager.validate_user_session(user_id, session_key)
+
+    async def extend_session(self, user_id: int):
+        self.session_manager.extend_session(user_id)
+
+
 class FakeAccountRepo(AccountRepository):
     def __init__(self, cards: List[Card], accounts: List[Account], raise_update_failure=bool):
         self.cards: Dict[int, Card] = {card.card_num: card for card in cards}
@@ -49,6 +64,11 @@ class FakeAccountRepo(AccountRepository):
 
         return self.cards[card_num]
 
+    def update_card_pin_hash(self, card_num: int, pin_hash: str, previous_pin_hash: Optional[str] = None):
+        card = self.cards[card_num]
+        if previous_pin_hash is None or card.pin_salt_hash == previous_pin_hash:
+            card.pin_salt_hash = pin_hash
+
     def get_user_accounts(self, user_id: int) -> List[Account]:
         return [account for _, account in self.accounts.items() if account.user_id == user_id]
 
@@ -61,10 +81,38 @@ class FakeAccountRepo(AccountRepository):
 
         return account
 
+    def get_user_accounts_by_id(self, user_id: int, account_ids: Iterable[int]) -> Dict[int, Account]:
+        accounts = dict()
+        for account_id in account_ids:
+            account = self.get_user_account(user_id, account_id)
+            if account is not None:
+                accounts[account_id] = account
+
+        return accounts
+
+    def iter_account_history(
+            self, account_id: int,
+            since: Optional[datetime] = None, until: Optional[datetime] = None,
+            after_index: Optional[int] = None, page_size: int = 1000
+    ) -> Iterator[AccountRecord]:
+        for record in self.accounts[account_id].histories:
+            if after_index is not None and record.record_index <= after_index:
+                continue
+            if since is not None and (record.time_at is None or record.time_at < since):
+                continue
+            if until is not None and (record.time_at is None or record.time_at >= until):
+                continue
+
+            yield record
+
     def update_account(self, account: Account):
         if self.raise_update_failure:
             raise AccountHistoryIntegrityError()
 
+    def update_accounts(self, accounts: List[Account]):
+        if self.raise_update_failure:
+            raise AccountHistoryIntegrityError()
+
 
 class FakeUnitOfWork(UnitOfWork):
     def __init__(self, cards: List[Card], accounts: List[Account], raise_update_failure: bool = False):
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from account.entity import Account
+from account.value_objects import AccountRecord, AccountRecords
+
+
+def make_record(record_index, balance=10, action=AccountRecord.DEPOSIT, time_at=None):
+    return AccountRecord(action=action, balance=balance, record_index=record_index, time_at=time_at)
+
+
+def test_records_round_trip():
+    naive_time = datetime(2021, 2, 23, 13, 53, 1, 123456)
+    aware_time = datetime(2021, 2, 23, 13, 53, 2, 654321, tzinfo=timezone.utc)
+    records = AccountRecords([
+        make_record(1, 100, AccountRecord.DEPOSIT, naive_time),
+        make_record(2, 40, AccountRecord.WITHDRAWAL, aware_time),
+        make_record(5, 45),
+    ])
+
+    assert len(records) == 3
+    assert [record.record_index for record in records] == [1, 2, 5]
+    assert [record.balance for record in records] == [100, 40, 45]
+    assert [record.action for record in records] == [AccountRecord.DEPOSIT, AccountRecord.WITHDRAWAL, AccountRecord.DEPOSIT]
+    assert records[0].time_at == naive_time
+    assert records[1].time_at == aware_time
+    assert records[-1].time_at is None
+    assert [record.record_index for record in records[1:]] == [2, 5]
+    assert records.last_record_index == 5
+    assert records.last_balance == 45
+
+    with pytest.raises(IndexError):
+        records[3]
+
+
+def test_records_are_append_only():
+    records = AccountRecords([make_record(3)])
+
+    with pytest.raises(ValueError):
+        records.append(make_record(3))
+
+
+def test_unordered_histories_are_sorted():
+    account = Account(account_id=1, user_id=2, name='unordered', histories=[make_record(7, 70), make_record(3, 30)])
+
+    assert [record.record_index for record in account.histories] == [3, 7]
+    assert account.get_balance() == 70
+
+
+def test_commit_appends_in_place():
+    account = Account(account_id=1, user_id=2, name='append', histories=[make_record(1, 50)])
+    histories = account.histories
+
+    account.deposit(10)
+    account.withdraw(20)
+    account.commit_new_histories()
+
+    assert account.histories is histories
+    assert [record.balance for record in account.histories] == [50, 60, 40]
+    assert account.new_histories == []
+
+
+def test_first_operation_on_empty_history():
+    account = Account(account_id=1, user_id=2, name='new', histories=[])
+
+    account.deposit(30)
+    account.withdraw(10)
+
+    assert [record.record_index for record in account.new_histories] == [1, 2]
+    assert account.get_balance() == 20
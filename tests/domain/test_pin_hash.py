@@ -0,0 +1,48 @@
+from uuid import uuid4
+
+import pytest
+
+from account import pin_hash
+from account.entity import Card
+
+
+@pytest.mark.parametrize('hasher', [pin_hash.Pbkdf2PinHasher(iterations=1000), pin_hash.ScryptPinHasher(n=2 ** 8)])
+def test_encoded_pin_hash(hasher):
+    encoded = hasher.encode('4821')
+
+    assert encoded.startswith(hasher.algorithm + pin_hash.SEPARATOR)
+    assert len(encoded) <= 128
+    assert pin_hash.verify_pin('4821', encoded)
+    assert not pin_hash.verify_pin('4822', encoded)
+    assert not pin_hash.needs_rehash(encoded, hasher)
+
+
+def test_legacy_pin_hash():
+    salt = uuid4().hex
+    encoded = salt + Card.hash_pin('1234', salt)
+
+    assert pin_hash.verify_pin('1234', encoded)
+    assert not pin_hash.verify_pin('1235', encoded)
+    assert pin_hash.needs_rehash(encoded, pin_hash.Pbkdf2PinHasher())
+
+
+def test_needs_rehash_on_parameter_change():
+    encoded = pin_hash.Pbkdf2PinHasher(iterations=1000).encode('1234')
+
+    assert pin_hash.needs_rehash(encoded, pin_hash.Pbkdf2PinHasher(iterations=2000))
+    assert pin_hash.needs_rehash(encoded, pin_hash.ScryptPinHasher(n=2 ** 8))
+
+
+@pytest.mark.parametrize('encoded', ['bcrypt$12$salt$hash', 'pbkdf2_sha256$many$salt$hash', 'scrypt$hash'])
+def test_malformed_pin_hash(encoded):
+    with pytest.raises(pin_hash.InvalidPinHash):
+        pin_hash.verify_pin('1234', encoded)
+
+    assert pin_hash.needs_rehash(encoded, pin_hash.Pbkdf2PinHasher())
+
+
+def test_calibrate():
+    hasher = pin_hash.calibrate(pin_hash.Pbkdf2PinHasher.algorithm, 0.005)
+
+    assert isinstance(hasher, pin_hash.Pbkdf2PinHasher)
+    assert hasher.iterations >= 1000
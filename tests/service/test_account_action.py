@@ -154,4 +154,41 @@ def test_action_record_integrity_failure(action):
             uow=uow,
             amount=1,
             session_manager=session_manager
-        )
\ No newline at end of file
+        )
+
+
+def test_action_is_committed():
+    card_num, account_id, last_record_index, session_key, uow, session_manager = setup_account_test(10)
+    commits = []
+    uow._commit = lambda: commits.append(account_id)
+
+    handler.account_action(
+        session_key=session_key,
+        account_id=account_id,
+        action=AccountRecord.DEPOSIT,
+        card_num=card_num,
+        uow=uow,
+        amount=5,
+        session_manager=session_manager
+    )
+
+    assert commits == [account_id]
+
+
+def test_failed_action_is_not_committed():
+    card_num, account_id, last_record_index, session_key, uow, session_manager = setup_account_test(10, True)
+    commits = []
+    uow._commit = lambda: commits.append(account_id)
+
+    with pytest.raises(service_exceptions.AccountHistoryIntegrityError):
+        handler.account_action(
+            session_key=session_key,
+            account_id=account_id,
+            action=AccountRecord.DEPOSIT,
+            card_num=card_num,
+            uow=uow,
+            amount=5,
+            session_manager=session_manager
+        )
+
+    assert commits == []
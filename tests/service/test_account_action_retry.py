@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from account.entity import Account, Card, AccountRecord
+from account.service import handler, retry, service_exceptions
+from account.service.retry import ContentionStats, RetryPolicy
+from tests.conftest import FakeUnitOfWork, FakeSessionmanager
+
+
+def setup_retry_test(conflicts):
+    card_num, user_id = 9130, 771
+    session_manager = FakeSessionmanager()
+    session_key = session_manager.set_session(user_id=user_id)
+    card = Card(card_num=card_num, user_id=user_id, pin_salt_hash='something')
+    attempts = []
+
+    def uow_factory():
+        # every unit of work loads the account afresh, like the database repository
+        account = Account(
+            user_id=user_id, account_id=21, name='contended',
+            histories=[
+                AccountRecord(record_index=4, balance=100, action=AccountRecord.DEPOSIT, time_at=datetime.utcnow())
+            ]
+        )
+        attempts.append(1)
+        return FakeUnitOfWork(cards=[card], accounts=[account], raise_update_failure=len(attempts) <= conflicts)
+
+    return card_num, session_key, session_manager, uow_factory, attempts
+
+
+def make_policy(delays, **kwargs):
+    return RetryPolicy(sleep=delays.append, random_fn=lambda: 1.0, **kwargs)
+
+
+def test_conflict_is_retried_with_backoff():
+    card_num, session_key, session_manager, uow_factory, attempts = setup_retry_test(conflicts=2)
+    delays = []
+    contention = ContentionStats()
+    account = handler.account_action_with_retry(
+        session_key=session_key, account_id=21, action=AccountRecord.WITHDRAWAL, amount=30, card_num=card_num,
+        uow_factory=uow_factory, session_manager=session_manager,
+        policy=make_policy(delays, max_attempts=5, base_delay=0.01, max_delay=0.03), contention=contention
+    )
+
+    assert account.get_balance() == 70
+    assert account.histories.last_record_index == 5
+    assert len(attempts) == 3
+    assert delays == [0.01, 0.02]
+    assert contention.stats() == dict(conflicts=2, retries=2, failures=0)
+    assert contention.hot_accounts() == [(21, 2)]
+
+
+def test_gives_up_after_max_attempts():
+    card_num, session_key, session_manager, uow_factory, attempts = setup_retry_test(conflicts=10)
+    contention = ContentionStats()
+    with pytest.raises(service_exceptions.AccountHistoryIntegrityError):
+        handler.account_action_with_retry(
+            session_key=session_key, account_id=21, action=AccountRecord.DEPOSIT, amount=1, card_num=card_num,
+            uow_factory=uow_factory, session_manager=session_manager,
+            policy=make_policy([], max_attempts=3), contention=contention
+        )
+
+    assert len(attempts) == 3
+    assert contention.stats() == dict(conflicts=3, retries=2, failures=1)
+
+
+def test_budget_limits_retries():
+    policy = make_policy([], max_attempts=10, budget_ratio=0.5, budget_max=1)
+    card_num, session_key, session_manager, uow_factory, attempts = setup_retry_test(conflicts=10)
+    with pytest.raises(service_exceptions.AccountHistoryIntegrityError):
+        handler.account_action_with_retry(
+            session_key=session_key, account_id=21, action=AccountRecord.DEPOSIT, amount=1, card_num=card_num,
+            uow_factory=uow_factory, session_manager=session_manager, policy=policy, contention=ContentionStats()
+        )
+
+    assert len(attempts) == 2
+    assert policy.budget < 1
+
+    policy.started()
+    policy.started()
+    assert policy.allow_retry(1)
+
+
+def test_other_errors_are_not_retried():
+    card_num, session_key, session_manager, uow_factory, attempts = setup_retry_test(conflicts=0)
+    contention = ContentionStats()
+    with pytest.raises(service_exceptions.InvalidSesionKey):
+        handler.account_action_with_retry(
+            session_key='wrong', account_id=21, action=AccountRecord.DEPOSIT, amount=1, card_num=card_num,
+            uow_factory=uow_factory, session_manager=session_manager, policy=make_policy([]), contention=contention
+        )
+
+    assert len(attempts) == 1
+    assert contention.stats() == dict(conflicts=0, retries=0, failures=0)
+
+
+def test_default_policy_budget_is_shared(monkeypatch):
+    monkeypatch.setattr(retry, 'default_policy', make_policy([], max_attempts=10, budget_ratio=0, budget_max=1))
+    card_num, session_key, session_manager, uow_factory, attempts = setup_retry_test(conflicts=10)
+    for _ in range(2):
+        with pytest.raises(service_exceptions.AccountHistoryIntegrityError):
+            handler.account_action_with_retry(
+                session_key=session_key, account_id=21, action=AccountRecord.DEPOSIT, amount=1, card_num=card_num,
+                uow_factory=uow_factory, session_manager=session_manager, contention=ContentionStats()
+            )
+
+    # the first call spends the only token, the second one is not retried
+    assert len(attempts) == 3
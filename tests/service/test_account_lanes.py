@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from account.entity import Account, Card, AccountRecord
+from account.service.account_lanes import AccountLaneExecutor
+from tests.conftest import FakeUnitOfWork, FakeSessionmanager
+
+
+@pytest.fixture
+def lanes():
+    executor = AccountLaneExecutor(size=4)
+    yield executor
+    executor.shutdown()
+
+
+def test_same_account_runs_in_order_and_reports_depth(lanes):
+    release = threading.Event()
+    order = []
+
+    def operation(value):
+        release.wait(5)
+        order.append(value)
+        return value
+
+    futures = [lanes.submit(13, operation, value) for value in range(5)]
+    other_account = lanes.submit(14, lambda: 'other')
+
+    assert other_account.result(5) == 'other'
+    assert lanes.queue_depths()[lanes.lane_of(13)] == 5
+
+    release.set()
+    assert [future.result(5) for future in futures] == list(range(5))
+    assert order == list(range(5))
+    assert lanes.queue_depths() == [0, 0, 0, 0]
+    assert lanes.stats() == dict(lanes=4, pending=0, max_depth=0, peak_depth=5)
+
+
+def test_errors_are_returned_to_the_caller(lanes):
+    def failing():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        lanes.submit(1, failing).result(5)
+
+    assert lanes.queue_depths() == [0, 0, 0, 0]
+
+
+def test_concurrent_actions_on_one_account(lanes):
+    card_num, user_id = 7100, 610
+    session_manager = FakeSessionmanager()
+    session_key = session_manager.set_session(user_id=user_id)
+    account = Account(
+        user_id=user_id, account_id=3, name='shared',
+        histories=[AccountRecord(record_index=1, balance=0, action=AccountRecord.DEPOSIT, time_at=datetime.utcnow())]
+    )
+    card = Card(card_num=card_num, user_id=user_id, pin_salt_hash='something')
+
+    def deposit(_):
+        return lanes.account_action(
+            session_key=session_key, account_id=3, action=AccountRecord.DEPOSIT, amount=5, card_num=card_num,
+            uow_factory=lambda: FakeUnitOfWork(cards=[card], accounts=[account]), session_manager=session_manager
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as callers:
+        results = list(callers.map(deposit, range(40)))
+
+    assert sorted(result.get_balance() for result in results)[-1] == 200
+    assert account.get_balance() == 200
+    assert [record.record_index for record in account.histories] == list(range(1, 42))
+
+
+def test_run_from_event_loop(lanes):
+    async def run():
+        return await asyncio.gather(*(lanes.run(account_id, lambda value=account_id: value * 2) for account_id in range(6)))
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8, 10]
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from account.entity import Account, Card, AccountRecord
+from account.service import handler, service_exceptions
+from account.service.unit_of_work import DatabaseThreads, ThreadBoundUnitOfWork
+from tests.conftest import FakeAsyncSessionManager, FakeUnitOfWork
+
+
+@pytest.fixture
+def setup_async_test():
+    pin = '5512'
+    salt = uuid4().hex
+    card = Card(card_num=7171, user_id=99, pin_salt_hash=salt + Card.hash_pin(pin, salt))
+    accounts = [
+        Account(
+            user_id=card.user_id, account_id=account_id, name=f'Test account {account_id}',
+            histories=[AccountRecord(record_index=3, balance=100, action=AccountRecord.DEPOSIT, time_at=datetime.utcnow())]
+        )
+        for account_id in (1, 2)
+    ]
+    threads = DatabaseThreads(size=2)
+    uow = ThreadBoundUnitOfWork(FakeUnitOfWork(cards=[card], accounts=accounts), threads)
+    yield card, pin, uow, FakeAsyncSessionManager()
+    threads.shutdown()
+
+
+def test_async_session_flow(setup_async_test):
+    card, pin, uow, session_manager = setup_async_test
+
+    async def flow():
+        session_key = await handler.set_session_async(
+            card_num=card.card_num, pin=pin, uow=uow, session_manager=session_manager
+        )
+        accounts = await handler.get_accounts_async(
+            session_key=session_key, card_num=card.card_num, uow=uow, session_manager=session_manager
+        )
+        account = await handler.account_action_async(
+            session_key=session_key, account_id=1, action=AccountRecord.WITHDRAWAL, amount=30,
+            card_num=card.card_num, uow=uow, session_manager=session_manager
+        )
+        return accounts, account
+
+    accounts, account = asyncio.run(flow())
+
+    assert sorted(account.account_id for account in accounts) == [1, 2]
+    assert account.get_balance() == 70
+    assert account.histories[-1].record_index == 4
+
+
+def test_async_incorrect_pin(setup_async_test):
+    card, pin, uow, session_manager = setup_async_test
+
+    with pytest.raises(service_exceptions.IncorrectPin):
+        asyncio.run(handler.set_session_async(
+            card_num=card.card_num, pin=pin + '1', uow=uow, session_manager=session_manager
+        ))
+
+
+def test_async_invalid_session(setup_async_test):
+    card, pin, uow, session_manager = setup_async_test
+
+    with pytest.raises(service_exceptions.InvalidSesionKey):
+        asyncio.run(handler.get_accounts_async(
+            session_key='nope', card_num=card.card_num, uow=uow, session_manager=session_manager
+        ))
+
+
+def test_concurrent_units_of_work_use_separate_threads(setup_async_test):
+    card, pin, uow, session_manager = setup_async_test
+    threads = uow.threads
+    used_threads = []
+
+    async def enter_and_hold():
+        async with ThreadBoundUnitOfWork(FakeUnitOfWork(cards=[card], accounts=[]), threads) as unit:
+            used_threads.append(unit._executor)
+            await asyncio.sleep(0.01)
+
+    async def run_concurrently():
+        await asyncio.gather(*(enter_and_hold() for _ in range(4)))
+
+    asyncio.run(run_concurrently())
+
+    assert len(used_threads) == 4
+    assert used_threads[0] is not used_threads[1]
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+import pytest
+
+from account import domain_exception
+from account.entity import Account, Card, AccountRecord
+from account.service import handler, service_exceptions
+from tests.conftest import FakeUnitOfWork, FakeSessionmanager
+
+
+def setup_batch_test(balances, raise_update_failure=False):
+    card_num = 8812
+    user_id = 4410
+    session_manager = FakeSessionmanager()
+    session_key = session_manager.set_session(user_id=user_id)
+    last_record_index = 12
+
+    accounts = [
+        Account(
+            user_id=user_id,
+            account_id=account_id, name=f'Test account {account_id}',
+            histories=[
+                AccountRecord(
+                    record_index=last_record_index,
+                    balance=balance,
+                    action=AccountRecord.DEPOSIT,
+                    time_at=datetime.utcnow()
+                )
+            ]
+        )
+        for account_id, balance in balances.items()
+    ]
+
+    uow = FakeUnitOfWork(
+        cards=[Card(card_num=card_num, user_id=user_id, pin_salt_hash='something')],
+        accounts=accounts,
+        raise_update_failure=raise_update_failure
+    )
+    return card_num, last_record_index, session_key, uow, session_manager
+
+
+def test_batch_actions():
+    card_num, last_record_index, session_key, uow, session_manager = setup_batch_test({1: 100, 2: 50})
+    accounts = handler.batch_account_action(
+        session_key=session_key,
+        operations=[
+            (1, AccountRecord.DEPOSIT, 30),
+            (2, AccountRecord.WITHDRAWAL, 20),
+            (1, AccountRecord.WITHDRAWAL, 120),
+        ],
+        card_num=card_num,
+        uow=uow,
+        session_manager=session_manager
+    )
+
+    assert [account.account_id for account in accounts] == [1, 2]
+    assert accounts[0].get_balance() == 10
+    assert accounts[0].histories[-1].record_index == last_record_index + 2
+    assert accounts[1].get_balance() == 30
+    assert accounts[1].histories[-1].record_index == last_record_index + 1
+
+
+def test_batch_overdraft_rejects_batch():
+    card_num, last_record_index, session_key, uow, session_manager = setup_batch_test({1: 100})
+    with pytest.raises(domain_exception.NegativeAccountBalanceException):
+        handler.batch_account_action(
+            session_key=session_key,
+            operations=[(1, AccountRecord.WITHDRAWAL, 60), (1, AccountRecord.WITHDRAWAL, 60)],
+            card_num=card_num,
+            uow=uow,
+            session_manager=session_manager
+        )
+
+
+def test_batch_unknown_account():
+    card_num, last_record_index, session_key, uow, session_manager = setup_batch_test({1: 100})
+    with pytest.raises(service_exceptions.InvalidAccount):
+        handler.batch_account_action(
+            session_key=session_key,
+            operations=[(1, AccountRecord.DEPOSIT, 1), (2, AccountRecord.DEPOSIT, 1)],
+            card_num=card_num,
+            uow=uow,
+            session_manager=session_manager
+        )
+
+
+def test_batch_invalid_session():
+    card_num, last_record_index, session_key, uow, session_manager = setup_batch_test({1: 100})
+    with pytest.raises(service_exceptions.InvalidSesionKey):
+        handler.batch_account_action(
+            session_key=session_key + 'a',
+            operations=[(1, AccountRecord.DEPOSIT, 1)],
+            card_num=card_num,
+            uow=uow,
+            session_manager=session_manager
+        )
+
+
+def test_batch_record_integrity_failure():
+    card_num, last_record_index, session_key, uow, session_manager = setup_batch_test({1: 100}, True)
+    with pytest.raises(service_exceptions.AccountHistoryIntegrityError):
+        handler.batch_account_action(
+            session_key=session_key,
+            operations=[(1, AccountRecord.DEPOSIT, 1)],
+            card_num=card_num,
+            uow=uow,
+            session_manager=session_manager
+        )
@@ -0,0 +1,224 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from account import domain_exception
+from account.entity import Account, Card, AccountRecord
+from account.service import service_exceptions
+from account.service.group_commit import GroupCommitter
+from tests.conftest import FakeUnitOfWork, FakeSessionmanager
+
+
+class CountingUnitOfWork(FakeUnitOfWork):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commits = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __enter__(self):
+        self.entered.set()
+        self.gate.wait(5)
+        return super().__enter__()
+
+    def _commit(self):
+        self.commits += 1
+
+
+def setup_group_commit_test(balances, raise_update_failure=False, **committer_kwargs):
+    card_num = 5120
+    user_id = 3310
+    session_manager = FakeSessionmanager()
+    session_key = session_manager.set_session(user_id=user_id)
+    accounts = [
+        Account(
+            user_id=user_id,
+            account_id=account_id, name=f'Test account {account_id}',
+            histories=[
+                AccountRecord(record_index=7, balance=balance, action=AccountRecord.DEPOSIT, time_at=datetime.utcnow())
+            ]
+        )
+        for account_id, balance in balances.items()
+    ]
+    uow = CountingUnitOfWork(
+        cards=[Card(card_num=card_num, user_id=user_id, pin_salt_hash='something')],
+        accounts=accounts,
+        raise_update_failure=raise_update_failure
+    )
+    committer = GroupCommitter(uow, session_manager, **committer_kwargs)
+    return card_num, session_key, uow, committer
+
+
+def run_concurrently(committer, calls):
+    results = [None] * len(calls)
+
+    def call(position, kwargs):
+        try:
+            results[position] = committer.account_action(**kwargs)
+        except BaseException as error:
+            results[position] = error
+
+    threads = [threading.Thread(target=call, args=(position, kwargs)) for position, kwargs in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def run_behind_batch(committer, uow, first_call, calls):
+    """Holds the batch of first_call open until calls are queued, so they form the next batch."""
+    uow.gate.clear()
+    results = []
+
+    def run():
+        results.extend(run_concurrently(committer, [first_call]))
+
+    first = threading.Thread(target=run)
+    first.start()
+    assert uow.entered.wait(5)
+
+    def release():
+        while len(committer._queue) < len(calls):
+            time.sleep(0.001)
+        uow.gate.set()
+
+    releaser = threading.Thread(target=release)
+    releaser.start()
+    results.extend(run_concurrently(committer, calls))
+    releaser.join()
+    first.join()
+    return results[0], results[1:]
+
+
+def deposit(session_key, card_num, account_id=1, amount=10):
+    return dict(
+        session_key=session_key, account_id=account_id, action=AccountRecord.DEPOSIT, amount=amount, card_num=card_num
+    )
+
+
+def test_single_action():
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 100}, window_seconds=0)
+    account = committer.account_action(
+        session_key=session_key, account_id=1, action=AccountRecord.WITHDRAWAL, amount=30, card_num=card_num
+    )
+
+    assert account.get_balance() == 70
+    assert account.last_record_index == 8
+    assert uow.commits == 1
+    assert uow.accounts[0].get_balance() == 70
+
+
+def test_single_action_does_not_wait_for_window():
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 100}, window_seconds=5)
+
+    started_at = time.monotonic()
+    committer.account_action(**deposit(session_key, card_num))
+
+    assert time.monotonic() - started_at < 1
+    assert uow.commits == 1
+
+
+def test_concurrent_actions_share_one_commit():
+    card_num, session_key, uow, committer = setup_group_commit_test(
+        {1: 100, 2: 0}, window_seconds=0.2, max_batch_size=4
+    )
+    calls = [deposit(session_key, card_num, account_id) for account_id in (1, 1, 2, 2)]
+    first, results = run_behind_batch(committer, uow, deposit(session_key, card_num, 1), calls)
+
+    assert first.get_balance() == 110
+    assert uow.commits == 2
+    assert committer.stats() == dict(batches=2, actions=5, fallbacks=0)
+    assert sorted(account.get_balance() for account in results if account.account_id == 1) == [120, 130]
+    assert sorted(account.last_record_index for account in results if account.account_id == 2) == [8, 9]
+    assert [account.get_balance() for account in uow.accounts] == [130, 20]
+
+
+def test_failed_action_does_not_fail_batch():
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 100}, window_seconds=0.2, max_batch_size=3)
+    calls = [
+        dict(session_key=session_key, account_id=1, action=AccountRecord.WITHDRAWAL, amount=500, card_num=card_num),
+        dict(session_key='wrong', account_id=1, action=AccountRecord.WITHDRAWAL, amount=10, card_num=card_num),
+        dict(session_key=session_key, account_id=1, action=AccountRecord.WITHDRAWAL, amount=10, card_num=card_num),
+    ]
+    _, results = run_behind_batch(committer, uow, deposit(session_key, card_num, amount=0), calls)
+
+    errors = sorted(type(result).__name__ for result in results if isinstance(result, Exception))
+    assert errors == ['InvalidSesionKey', 'NegativeAccountBalanceException']
+    assert [result.get_balance() for result in results if isinstance(result, Account)] == [90]
+    assert uow.commits == 2
+    assert committer.stats()['batches'] == 2
+
+
+def test_store_failure_falls_back_to_single_actions():
+    card_num, session_key, uow, committer = setup_group_commit_test(
+        {1: 100}, raise_update_failure=True, window_seconds=0.2, max_batch_size=2
+    )
+    calls = [deposit(session_key, card_num)] * 2
+    first, results = run_behind_batch(committer, uow, deposit(session_key, card_num), calls)
+
+    assert isinstance(first, service_exceptions.AccountHistoryIntegrityError)
+    assert all(isinstance(result, service_exceptions.AccountHistoryIntegrityError) for result in results)
+    assert committer.stats()['fallbacks'] == 1
+    assert uow.commits == 0
+
+
+def test_failure_after_commit_does_not_rerun_actions(monkeypatch):
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 100}, window_seconds=0.2, max_batch_size=2)
+
+    def fail(account):
+        raise RuntimeError('failed after commit')
+
+    monkeypatch.setattr(Account, 'commit_new_histories', fail)
+    calls = [deposit(session_key, card_num)] * 2
+    first, results = run_behind_batch(committer, uow, deposit(session_key, card_num), calls)
+
+    assert all(isinstance(result, RuntimeError) for result in [first, *results])
+    assert uow.commits == 2
+    assert committer.stats()['fallbacks'] == 0
+
+
+def test_aborted_batch_releases_waiting_callers(monkeypatch):
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 100}, window_seconds=0.2, max_batch_size=2)
+    run_batch = committer._run_batch
+
+    def interrupted(batch):
+        if len(batch) > 1:
+            raise KeyboardInterrupt()
+        return run_batch(batch)
+
+    monkeypatch.setattr(committer, '_run_batch', interrupted)
+    calls = [deposit(session_key, card_num)] * 2
+    first, results = run_behind_batch(committer, uow, deposit(session_key, card_num), calls)
+
+    assert first.get_balance() == 110
+    assert sorted(type(result).__name__ for result in results) == ['GroupCommitAborted', 'KeyboardInterrupt']
+
+
+def test_leadership_is_handed_over():
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 1000}, window_seconds=0.01, max_batch_size=2)
+    calls = [
+        dict(session_key=session_key, account_id=1, action=AccountRecord.DEPOSIT, amount=1, card_num=card_num)
+    ] * 9
+    results = run_concurrently(committer, calls)
+
+    assert sorted(result.get_balance() for result in results) == list(range(1001, 1010))
+    assert committer.stats()['actions'] == 9
+    assert uow.commits == committer.stats()['batches'] >= 5
+
+
+def test_unknown_account():
+    card_num, session_key, uow, committer = setup_group_commit_test({1: 100}, window_seconds=0)
+    with pytest.raises(service_exceptions.InvalidAccount):
+        committer.account_action(
+            session_key=session_key, account_id=2, action=AccountRecord.DEPOSIT, amount=1, card_num=card_num
+        )
+
+    with pytest.raises(domain_exception.InvalidAmount):
+        committer.account_action(
+            session_key=session_key, account_id=1, action=AccountRecord.WITHDRAWAL, amount=0, card_num=card_num
+        )
@@ -1,6 +1,8 @@
 import pytest
 
 from uuid import uuid4
+from account import pin_hash
+from account.adaptors.pin_verifier import PinVerifier
 from account.entity import Card
 from account.service import handler, service_exceptions
 from tests.conftest import FakeUnitOfWork, FakeSessionmanager
@@ -24,6 +26,20 @@ def test_session(setup_session_test):
     assert session_key is not None
 
 
+def test_session_rehashes_outdated_pin_hash(setup_session_test):
+    valid_card, pin, uow, session_manager = setup_session_test
+    hasher = pin_hash.Pbkdf2PinHasher(iterations=1000)
+    pin_hash.set_default_hasher(hasher)
+    try:
+        handler.set_session(card_num=valid_card.card_num, pin=pin, uow=uow, session_manager=session_manager)
+    finally:
+        pin_hash.set_default_hasher(None)
+
+    assert valid_card.pin_salt_hash.startswith(hasher.algorithm)
+    assert not valid_card.needs_rehash(hasher)
+    assert handler.set_session(card_num=valid_card.card_num, pin=pin, uow=uow, session_manager=session_manager)
+
+
 def test_incorrect_card_pin(setup_session_test):
     valid_card, pin, uow, session_manager = setup_session_test
     incorrect_pin = '2323'
@@ -37,3 +53,37 @@ def test_invalid_card(setup_session_test):
 
     with pytest.raises(service_exceptions.InvalidCardNum):
         handler.set_session(card_num=valid_card.card_num + 1, pin=pin, uow=uow, session_manager=session_manager)
+
+
+class TrackingUnitOfWork(FakeUnitOfWork):
+    in_uow = False
+
+    def __enter__(self):
+        self.in_uow = True
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        super().__exit__(*args)
+        self.in_uow = False
+
+
+class RecordingPinVerifier(PinVerifier):
+    def __init__(self, uow):
+        self.uow = uow
+        self.verified_in_uow = []
+
+    def verify(self, card: Card, pin: str) -> bool:
+        self.verified_in_uow.append(self.uow.in_uow)
+        return card.validate_pin(pin)
+
+
+def test_pin_verified_outside_uow(setup_session_test):
+    valid_card, pin, _, session_manager = setup_session_test
+    uow = TrackingUnitOfWork(cards=[valid_card], accounts=[])
+    pin_verifier = RecordingPinVerifier(uow)
+
+    handler.set_session(
+        card_num=valid_card.card_num, pin=pin, uow=uow, session_manager=session_manager, pin_verifier=pin_verifier
+    )
+
+    assert pin_verifier.verified_in_uow == [False]
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+
+import fakeredis
+import pytest
+
+from account import instrumentation
+from account.adaptors.account_repo import DjangoAccountRepo
+from account.adaptors.ledger import LedgerStore
+from account.adaptors.ledger_repo import LedgerAccountRepo
+from account.adaptors.session_manager import RedisSessionManager
+from account.service.unit_of_work import DjangoUnitOfWork
+
+
+@pytest.fixture
+def snapshots():
+    collected = []
+    instrumentation.registry.reset()
+    instrumentation.enable(instrumentation.CallbackExporter(collected.append))
+    yield collected
+    instrumentation.disable()
+    instrumentation.registry.reset()
+
+
+def test_disabled_records_nothing():
+    instrumentation.registry.reset()
+
+    @instrumentation.timed('test.phase')
+    def phase():
+        return 3
+
+    assert phase() == 3
+    assert instrumentation.registry.snapshot() == {}
+
+
+def test_timed_phases(snapshots):
+    @instrumentation.timed('test.phase')
+    def phase():
+        return 3
+
+    @instrumentation.timed('test.async_phase')
+    async def async_phase():
+        return 4
+
+    @instrumentation.timed('test.failing_phase')
+    def failing_phase():
+        raise ValueError()
+
+    @instrumentation.timed('test.generator_phase')
+    def generator_phase():
+        yield 1
+        yield 2
+
+    assert phase() == 3
+    assert phase() == 3
+    assert asyncio.run(async_phase()) == 4
+    with pytest.raises(ValueError):
+        failing_phase()
+    for _ in generator_phase():
+        time.sleep(0.05)
+
+    instrumentation.export()
+
+    histograms = snapshots[-1]
+    assert histograms['test.phase']['count'] == 2
+    assert histograms['test.async_phase']['count'] == 1
+    assert histograms['test.failing_phase']['count'] == 1
+    # a generator is timed once per iteration, without the time spent in the loop body
+    assert histograms['test.generator_phase']['count'] == 1
+    assert histograms['test.generator_phase']['sum'] < 0.05
+
+
+@pytest.mark.django_db
+def test_adaptor_phases(snapshots, tmp_path):
+    session_manager = RedisSessionManager(redis_cls=fakeredis.FakeStrictRedis)
+    session_key = session_manager.set_session(1)
+    session_manager.validate_and_extend(1, session_key)
+    DjangoAccountRepo().get_card(1)
+    list(DjangoAccountRepo().iter_account_history(1))
+    store = LedgerStore(str(tmp_path / 'accounts.ledger'), grow_bytes=4096)
+    try:
+        LedgerAccountRepo(store).get_card(1)
+        list(LedgerAccountRepo(store).iter_account_history(1))
+    finally:
+        store.close()
+
+    instrumentation.export()
+
+    assert {
+        'session.set_session', 'session.validate_and_extend', 'repo.get_card', 'repo.iter_account_history',
+        'ledger_repo.get_card', 'ledger_repo.iter_account_history'
+    } <= set(snapshots[-1])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unit_of_work_rollback_is_not_timed_twice(snapshots, monkeypatch):
+    uow = DjangoUnitOfWork()
+    rollback = DjangoUnitOfWork.rollback.__wrapped__
+
+    def slow_rollback(self):
+        time.sleep(0.05)
+        rollback(self)
+
+    monkeypatch.setattr(DjangoUnitOfWork, 'rollback', instrumentation.timed('uow.rollback')(slow_rollback))
+    with uow:
+        pass
+
+    instrumentation.export()
+
+    histograms = snapshots[-1]
+    assert histograms['uow.rollback']['count'] == 1
+    assert histograms['uow.exit']['count'] == 1
+    assert histograms['uow.exit']['sum'] < 0.05
+
+
+def test_histogram_quantile():
+    histogram = instrumentation.Histogram(buckets=(0.001, 0.01, 0.1))
+    for seconds in (0.0005, 0.0005, 0.005, 0.05):
+        histogram.observe(seconds)
+
+    assert histogram.quantile(0.5) == 0.001
+    assert histogram.quantile(0.75) == 0.01
+    assert histogram.quantile(1.0) == 0.1
+
+
+def test_prometheus_file_exporter(snapshots, tmp_path):
+    instrumentation.registry.observe('uow.commit', 0.002)
+    path = tmp_path / 'atm.prom'
+
+    instrumentation.PrometheusFileExporter(str(path)).export(instrumentation.registry.snapshot())
+
+    metrics = path.read_text()
+    assert '# TYPE atm_phase_duration_seconds histogram' in metrics
+    assert 'atm_phase_duration_seconds_bucket{phase="uow.commit",le="0.0025"} 1' in metrics
+    assert 'atm_phase_duration_seconds_count{phase="uow.commit"} 1' in metrics
+
+
+def test_log_exporter(snapshots, caplog):
+    instrumentation.registry.observe('pin.verify', 0.04)
+
+    with caplog.at_level(logging.INFO, logger='account.instrumentation'):
+        instrumentation.LogExporter().export(instrumentation.registry.snapshot())
+
+    assert 'phase=pin.verify count=1' in caplog.text